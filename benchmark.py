@@ -0,0 +1,315 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- benchmark.py: performance benchmarks of the T-Fold-SV stages with synthetic data                    -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# Run the following in bash console, for sizes (bars) and frequencies of the synthetic prices:
+# $ python benchmark.py --sizes 10000 1000000 --freqs 1min 1H --output bench.json
+
+# -- Load libraries for script
+import os
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import scipy
+
+# -- Load other scripts
+import data as dt
+import functions as fn
+import pipeline as pl
+import synthetic as sn
+
+# -- Stages of the T-Fold-SV process to benchmark
+_stages = ['resample_data', 'resample_stream', 'folds_formation', 'ohlc_labeling', 'ohlc_features',
+           'kld_matrix', 'end_to_end']
+
+# ------------------------------------------------------------------------------------------ MEASUREMENT -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def measure(stage, function, n_bars, memory=True, **kwargs):
+    """
+    Measures the wall time and CPU time (of the process and its worker processes) of function(**kwargs), and
+    the memory of the call in two more calls, as measuring it slows the call down: the peak of memory
+    allocated (tracemalloc), and the peak resident memory of a child process (forked) that runs only this
+    call. The arguments must allow several calls, e.g. a list of chunks instead of a generator, and the cache
+    of functions.fold_stats is emptied before every call.
+
+    Parameters
+    ----------
+
+    stage: str
+        Name of the stage
+
+    function: callable
+        Stage to be measured
+
+    n_bars: int
+        Number of input bars, for the throughput
+
+    memory: bool
+        True (Default): measure the peak of memory allocated and the peak resident memory
+        False: only the timed call, 'peak_alloc_mb' and 'peak_rss_mb' are None
+
+    Returns
+    -------
+
+    r_measure: tuple
+        (result of the timed call, dict with the measures)
+
+    """
+
+    fn._fold_stats_cache.clear()
+    wall, cpu = time.perf_counter(), _cpu_time()
+    result = function(**kwargs)
+    wall, cpu = time.perf_counter() - wall, _cpu_time() - cpu
+
+    peak_alloc, peak_rss = None, None
+    if memory:
+        fn._fold_stats_cache.clear()
+        tracemalloc.start()
+        function(**kwargs)
+        peak_alloc = tracemalloc.get_traced_memory()[1]/1024**2
+        tracemalloc.stop()
+        peak_rss = _peak_rss_mb(function, kwargs)
+
+    r_measure = {'stage': stage, 'bars': int(n_bars), 'wall_s': wall, 'cpu_s': cpu,
+                 'peak_alloc_mb': peak_alloc, 'peak_rss_mb': peak_rss,
+                 'bars_per_s': n_bars/wall if wall > 0 else None}
+
+    return result, r_measure
+
+
+def _peak_rss_mb(function, kwargs):
+    """
+    Peak resident memory, in MB, of a forked child process that runs function(**kwargs), including the
+    memory shared with the parent that it touches. None where fork is not available.
+
+    """
+
+    if 'fork' not in mp.get_all_start_methods():
+        return None
+
+    receiver, sender = mp.get_context('fork').Pipe(duplex=False)
+    process = mp.get_context('fork').Process(target=_rss_child, args=(sender, function, kwargs))
+    process.start()
+    sender.close()
+    try:
+        peak = receiver.recv()
+    except EOFError:
+        # the child ended without a measure, e.g. killed out of memory
+        peak = None
+    process.join()
+
+    if peak is None:
+        return None
+
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    return peak/1024**2 if platform.system() == 'Darwin' else peak/1024
+
+
+def _rss_child(sender, function, kwargs):
+    """
+    Runs function(**kwargs) and sends the peak resident memory of the process, None if it fails.
+
+    """
+
+    try:
+        fn._fold_stats_cache.clear()
+        function(**kwargs)
+        sender.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    except Exception:
+        sender.send(None)
+    finally:
+        sender.close()
+
+
+def _cpu_time():
+    """
+    User and system CPU time of the process and of its terminated worker processes, in seconds.
+
+    """
+
+    r_cpu = 0.0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        r_cpu += usage.ru_utime + usage.ru_stime
+
+    return r_cpu
+
+# ----------------------------------------------------------------------------------------------- STAGES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def run_benchmark(n_bars, freq='1min', target_freq='8H', fold_size='quarter', p_label='co', stages=None,
+                  workers=1, seed=123, memory=True):
+    """
+    Benchmarks every stage with synthetic OHLCV prices of a given size and frequency.
+
+    Parameters
+    ----------
+
+    n_bars: int
+        Number of synthetic bars
+
+    freq: str
+        '1min' (Default): frequency of the synthetic bars
+
+    target_freq: str
+        '8H' (Default): frequency to resample the prices to, as in main.py
+
+    fold_size: str
+        'quarter' (Default): T-Fold size
+
+    p_label: str
+        'co' (Default): labeling process for the target variable
+
+    stages: list
+        None (Default): every stage, otherwise, a list with the names of the stages to run
+
+    workers: int
+        1 (Default): number of worker processes for the end to end stage
+
+    seed: int
+        123 (Default): seed for the synthetic prices
+
+    memory: bool
+        True (Default): measure the peak of memory allocated and the peak resident memory of every stage,
+        in separate calls, see measure
+
+    Returns
+    -------
+
+    r_results: list
+        One dict of measures for every stage
+
+    """
+
+    stages = _stages if stages is None else stages
+    prices = sn.ohlcv_random_walk(n_bars=n_bars, freq=freq, seed=seed)
+    r_results = []
+
+    def _add(stage, function, n, **kwargs):
+        result, r_measure = measure(stage, function, n, memory=memory, **kwargs)
+        r_measure.update({'freq': freq, 'target_freq': target_freq, 'fold_size': fold_size})
+        r_results.append(r_measure)
+        return result
+
+    # -- Resample, input as read from a file (timestamp column)
+    if 'resample_data' in stages:
+        raw = prices.reset_index()
+        _add('resample_data', dt.resample_data, n_bars, target_data=raw, target_freq=target_freq)
+        del raw
+
+    if 'resample_stream' in stages:
+        # a list of views, to be read again for the memory measure
+        chunks = [prices.iloc[i:i + 500000] for i in range(0, n_bars, 500000)]
+        _add('resample_stream', dt.resample_stream, n_bars, chunks=chunks, target_freq=target_freq)
+
+    # -- Fold stages over the resampled prices
+    global_data = dt.resample_stream(chunks=[prices], target_freq=target_freq)
+    n_global = len(global_data)
+
+    if 'folds_formation' in stages:
+        _add('folds_formation', dt.folds_formation, n_global, global_data=global_data, fold_size=fold_size)
+
+    target = fn.ohlc_labeling(ohlc_data=global_data, p_label=p_label)
+    if 'ohlc_labeling' in stages:
+        _add('ohlc_labeling', fn.ohlc_labeling, n_global, ohlc_data=global_data, p_label=p_label)
+
+    offsets = dt.folds_formation(global_data=global_data, fold_size=fold_size, output='offsets')
+    if 'ohlc_features' in stages:
+        _add('ohlc_features', fn.ohlc_features, n_global, ohlc_data=global_data, target_data=target,
+             fold_offsets=offsets)
+
+    if 'kld_matrix' in stages:
+        targets = {label: target.iloc[start:stop] for label, (start, stop) in offsets.items()}
+        _add('kld_matrix', fn.kld_matrix, n_global, folds=targets, prob_dist='gamma')
+
+    # -- End to end, as in main.py: the stages of run_stages for a price file, without checkpoints to reuse
+    if 'end_to_end' in stages:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_route = os.path.join(tmp_dir, 'prices.txt')
+            prices.to_csv(file_route, header=False, date_format='%Y-%m-%d %H:%M:%S')
+            _add('end_to_end', _end_to_end, n_bars, file_route=file_route, target_freq=target_freq,
+                 fold_size=fold_size, p_label=p_label, workers=workers)
+
+    return r_results
+
+
+def _end_to_end(file_route, target_freq, fold_size, p_label, workers):
+    """
+    The T-Fold-SV process of main.py for a price file: every stage of pipeline.run_stages, with the
+    checkpoints in a temporary directory.
+
+    """
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        config = pl.load_config(file_route=file_route, invert=False, ts_format='%Y-%m-%d %H:%M:%S',
+                                target_freq=target_freq, fold_size=fold_size, p_label=p_label,
+                                checkpoint_dir=checkpoint_dir)
+        return pl.run_stages(config=config, workers=workers)['outputs']['kld']
+
+
+def _metadata():
+    """
+    Versions and commit, to compare benchmarks between commits.
+
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit, 'timestamp': pd.Timestamp.now().isoformat(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'scipy': scipy.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+# ----------------------------------------------------------------------------------------- COMMAND LINE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark of the T-Fold-SV stages with synthetic prices')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='number of synthetic bars, from 10k to 100M')
+    parser.add_argument('--freqs', nargs='+', default=['1min'], help='frequencies of the synthetic bars')
+    parser.add_argument('--target-freq', default='8H', help='frequency to resample the prices to')
+    parser.add_argument('--fold-size', default='quarter', help='T-Fold size')
+    parser.add_argument('--label', default='co', help='labeling process for the target variable')
+    parser.add_argument('--stages', nargs='+', choices=_stages, default=None, help='stages to run')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the end to end stage')
+    parser.add_argument('--seed', type=int, default=123, help='seed for the synthetic prices')
+    parser.add_argument('--no-memory', action='store_true', help='only times, without the memory measures')
+    parser.add_argument('--output', default=None, help='JSON file for the results, stdout if not provided')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for frequency in args.freqs:
+            results += run_benchmark(n_bars=size, freq=frequency, target_freq=args.target_freq,
+                                     fold_size=args.fold_size, p_label=args.label, stages=args.stages,
+                                     workers=args.workers, seed=args.seed, memory=not args.no_memory)
+
+    report = json.dumps({'meta': _metadata(), 'results': results}, indent=2)
+
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(report)
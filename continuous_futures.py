@@ -10,3 +10,348 @@
 # -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
 # -- --------------------------------------------------------------------------------------------------- -- #
 """
+
+# -- Load libraries for script
+import os
+import glob
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# -- Load other scripts
+import data as dt
+import functions as fn
+
+# --------------------------------------------------------------------------------- MULTI-CONTRACT BATCH -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def batch_contracts(contracts, target_freq='8H', fold_size='year', p_label='co', invert=False, align='inner',
+                    workers=None, cache_dir=dt._cache_dir):
+    """
+    Loads, resamples and folds a book of continuous futures contracts, and computes the KLD between the Folds
+    of every contract (per-contract Information Tensor) and between the Folds of all the contracts
+    (cross-contract Information Tensor).
+
+    The files are read and resampled concurrently, one process per contract, through the prices cache of
+    data.read_cached, so the parsed prices are read back memory-mapped instead of being sent between
+    processes. The contracts are aligned to a common index, so the calendar fold boundaries are computed once
+    and reused for every contract, and the distribution parameters of every (contract, Fold) are computed
+    once for both Information Tensors.
+
+    Parameters
+    ----------
+
+    contracts: str or list
+        str: directory with the price files (.txt) of every contract
+        list: routes of the price files, the contract name is the file name without extension
+
+    target_freq: str
+        '8H' (Default): frequency to resample the prices to, see data.resample_stream
+
+    fold_size: str
+        'year' (Default): T-Fold size, see data.folds_formation
+
+    p_label: str
+        'co' (Default): labeling process for the target variable, see functions.ohlc_labeling
+
+    invert: bool or list
+        False (Default): prices of every contract are used as they are in the file
+        True: prices of every contract are inverted (see data.read_ohlcv)
+        list: names of the contracts with inverted prices, e.g. ['MP_H1_2010_2021']
+
+    align: str
+        'inner' (Default): only the timestamps present in every contract
+        'outer': every timestamp between the first and the last timestamps common to all the contracts, the
+                 missing bars of a contract are filled with its previous close as open, high, low and close
+                 and 0 volume, and excluded from its targets
+
+    workers: int
+        None (Default): as many workers as CPUs
+        int: number of worker processes, 1 runs serially
+
+    cache_dir: str
+        'files/cache' (Default): directory for the prices cache
+
+    Returns
+    -------
+
+    r_batch: dict
+        {'data': {contract: pd.DataFrame}, 'index': common pd.DatetimeIndex, 'offsets': {fold: (start, stop)},
+         'filled': {contract: np.array} True for the filled bars, 'targets': {contract: {fold: pd.Series}},
+         'kld': {contract: pd.DataFrame}, 'cross_kld': pd.DataFrame with (contract, fold) MultiIndex in rows
+         and columns}
+
+    Example
+    -------
+
+    >> batch = batch_contracts(contracts='files/prices', target_freq='8H', fold_size='year',
+                               invert=['MP_H1_2010_2021'])
+    >> batch['cross_kld'].loc['MP_H1_2010_2021', 'EC_H1_2010_2021']
+
+    """
+
+    # -- Contract files
+    if isinstance(contracts, str):
+        routes = sorted(glob.glob(os.path.join(contracts, '*.txt')))
+    else:
+        routes = list(contracts)
+
+    if len(routes) == 0:
+        raise ValueError('No contract files were found')
+
+    names = [os.path.splitext(os.path.basename(route))[0] for route in routes]
+    if len(set(names)) != len(names):
+        raise ValueError('Every contract file must have a different name')
+
+    inverts = [invert if isinstance(invert, bool) else name in invert for name in names]
+    tasks = [(route, target_freq, c_invert, cache_dir) for route, c_invert in zip(routes, inverts)]
+
+    # -- Read and resample every contract, concurrently, into the prices cache
+    workers = os.cpu_count() if workers is None else workers
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            list(executor.map(_cache_contract, tasks))
+
+    # memory-mapped from the cache (or read and resampled here when running serially)
+    c_data = {name: dt.read_cached(file_route=route, target_freq=target_freq, invert=c_invert,
+                                   cache_dir=cache_dir)
+              for name, route, c_invert in zip(names, routes, inverts)}
+
+    # -- Common index for all the contracts
+    c_data, filled = _align_contracts(c_data=c_data, align=align)
+
+    # -- Fold boundaries, once for all the contracts
+    index = c_data[names[0]].index
+    offsets = dt.folds_formation(global_data=c_data[names[0]], fold_size=fold_size, output='offsets')
+
+    # -- Target variable of every contract, sliced by fold, without the filled bars
+    targets = {}
+    for name in names:
+        target = fn.ohlc_labeling(ohlc_data=c_data[name], p_label=p_label)
+        targets[name] = {fold: target.iloc[start:stop][~filled[name][start:stop]]
+                         for fold, (start, stop) in offsets.items()}
+
+    # -- KLD between every (contract, fold), the per-contract tensors are its diagonal blocks
+    cross_kld = fn.kld_matrix(folds={(name, fold): targets[name][fold] for name in names for fold in offsets},
+                              prob_dist='gamma')
+    cross_kld.index = pd.MultiIndex.from_tuples(cross_kld.index, names=['contract', 'fold'])
+    cross_kld.columns = pd.MultiIndex.from_tuples(cross_kld.columns, names=['contract', 'fold'])
+    kld = {name: cross_kld.loc[name, name] for name in names}
+
+    return {'data': c_data, 'index': index, 'offsets': offsets, 'filled': filled, 'targets': targets,
+            'kld': kld, 'cross_kld': cross_kld}
+
+
+def _cache_contract(task):
+    """
+    Worker process: reads and resamples a contract file into the prices cache.
+
+    """
+
+    route, target_freq, invert, cache_dir = task
+    dt.read_cached(file_route=route, target_freq=target_freq, invert=invert, cache_dir=cache_dir)
+
+    return route
+
+
+def _align_contracts(c_data, align='inner'):
+    """
+    Reindexes every contract to a common DatetimeIndex, with a boolean array of the filled bars of every
+    contract (never for 'inner').
+
+    """
+
+    names = list(c_data.keys())
+    index = c_data[names[0]].index
+    if any(len(c_data[name]) == 0 for name in names):
+        raise ValueError('Every contract must have prices')
+
+    if align == 'inner':
+        for name in names[1:]:
+            index = index.intersection(c_data[name].index)
+        # contracts already on the common index are not copied
+        r_data = {name: c_data[name] if c_data[name].index.equals(index) else c_data[name].reindex(index)
+                  for name in names}
+
+    elif align == 'outer':
+        for name in names[1:]:
+            index = index.union(c_data[name].index)
+        # from the first to the last timestamp with prices for every contract
+        first = max(c_data[name].index[0] for name in names)
+        last = min(c_data[name].index[-1] for name in names)
+        index = index[(index >= first) & (index <= last)]
+
+        r_data = {}
+        for name in names:
+            if c_data[name].index.equals(index):
+                r_data[name] = c_data[name]
+                continue
+            data = c_data[name].reindex(index)
+            # a filled bar has no price changes nor volume
+            close = data['close'].ffill()
+            for column in ['open', 'high', 'low', 'close']:
+                data[column] = data[column].fillna(close)
+            if 'volume' in data.columns:
+                data['volume'] = data['volume'].fillna(0.0)
+            r_data[name] = data
+
+    else:
+        raise ValueError("Accepted values for align are: 'inner' or 'outer'")
+
+    if len(index) == 0:
+        raise ValueError('The contracts do not have common timestamps')
+
+    r_filled = {name: ~index.isin(c_data[name].index) for name in names}
+
+    return r_data, r_filled
+
+# --------------------------------------------------------------------------------------- ROLL STITCHING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def roll_schedule(contracts, expiries, roll_rule='volume', days=5):
+    """
+    Timestamps where a continuous futures series rolls from every contract to the next one, and the price
+    gap and ratio between both contracts at the roll.
+
+    Parameters
+    ----------
+
+    contracts: dict
+        {contract: pd.DataFrame} with 'open', 'high', 'low', 'close', 'volume' columns and a DatetimeIndex
+        for every contract (expiry)
+
+    expiries: dict
+        {contract: timestamp} expiry of every contract
+
+    roll_rule: str
+        'volume' (Default): roll at the first timestamp where the volume of the next contract is higher than
+                            the volume of the current one (at the latest, days before the expiry)
+        'days': roll a fixed number of days before the expiry of the current contract
+
+    days: int
+        5 (Default): days before the expiry to roll
+
+    Returns
+    -------
+
+    r_schedule: pd.DataFrame
+        One row per roll with: 'from', 'to' contracts, 'roll' timestamp (first timestamp of the next
+        contract), 'gap' (close of next - close of current) and 'ratio' (close of next / close of current),
+        both at the last bar of the current contract before the roll (its last bar in the stitched series),
+        with the last close of the next contract up to that bar
+
+    """
+
+    names = sorted(contracts.keys(), key=lambda name: pd.Timestamp(expiries[name]))
+    rows = []
+
+    for current, following in zip(names[:-1], names[1:]):
+        c_data, f_data = contracts[current], contracts[following]
+        limit = pd.Timestamp(expiries[current]) - pd.Timedelta(days=days)
+
+        # timestamps with prices for both contracts, up to the limit to roll
+        common = c_data.index.intersection(f_data.index)
+        common = common[common <= limit]
+        if len(common) < 2:
+            raise ValueError('The contracts ' + str(current) + ' and ' + str(following) +
+                             ' must have at least two common timestamps before the roll')
+
+        roll = common[-1]
+        if roll_rule == 'volume':
+            crossed = np.flatnonzero(f_data['volume'].reindex(common).to_numpy() >
+                                     c_data['volume'].reindex(common).to_numpy())
+            # first crossover, the series needs at least one bar of the current contract
+            crossed = crossed[crossed > 0]
+            if len(crossed) > 0:
+                roll = common[crossed[0]]
+        elif roll_rule != 'days':
+            raise ValueError("Accepted values for roll_rule are: 'volume' or 'days'")
+
+        # prices at the last bar used from the current contract (there is a common timestamp before the roll)
+        last = c_data.index[c_data.index.searchsorted(roll, side='left') - 1]
+        c_close, f_close = c_data['close'].loc[last], f_data['close'].asof(last)
+        rows.append({'from': current, 'to': following, 'roll': roll, 'gap': f_close - c_close,
+                     'ratio': f_close/c_close})
+
+    return pd.DataFrame(rows, columns=['from', 'to', 'roll', 'gap', 'ratio'])
+
+
+def stitch_contracts(contracts, expiries, roll_rule='volume', days=5, adjustment='back'):
+    """
+    Continuous futures series from the contracts of every expiry. The segments of every contract (between
+    rolls) are joined in a single vectorized pass: every row gets the cumulative adjustment of its segment
+    (sum of the gaps, or product of the ratios, of all the later rolls), so the last contract keeps its
+    prices and the older ones are adjusted to remove the jumps at the rolls.
+
+    Parameters
+    ----------
+
+    contracts: dict
+        {contract: pd.DataFrame} with 'open', 'high', 'low', 'close', 'volume' columns and a DatetimeIndex
+        for every contract (expiry)
+
+    expiries: dict
+        {contract: timestamp} expiry of every contract
+
+    roll_rule: str
+        'volume' (Default) or 'days', see roll_schedule
+
+    days: int
+        5 (Default): days before the expiry to roll, see roll_schedule
+
+    adjustment: str
+        'back' (Default): back-adjusted, the price gaps at the rolls are added to the older prices
+        'ratio': ratio-adjusted, the older prices are multiplied by the price ratios at the rolls
+        None: raw prices of every segment, without adjustment
+
+    Returns
+    -------
+
+    r_continuous: pd.DataFrame
+        'timestamp', 'open', 'high', 'low', 'close', 'volume' columns, as consumed by data.resample_data
+
+    Example
+    -------
+
+    >> continuous = stitch_contracts(contracts=contracts, expiries=expiries, roll_rule='volume')
+    >> global_data = data.resample_data(target_data=continuous, target_freq='8H')
+
+    """
+
+    names = sorted(contracts.keys(), key=lambda name: pd.Timestamp(expiries[name]))
+    schedule = roll_schedule(contracts=contracts, expiries=expiries, roll_rule=roll_rule, days=days)
+    rolls = list(schedule['roll'])
+
+    # -- Segment of every contract, from its roll in to its roll out
+    segments = []
+    for i, name in enumerate(names):
+        index = contracts[name].index
+        start = 0 if i == 0 else index.searchsorted(rolls[i - 1], side='left')
+        stop = len(index) if i == len(names) - 1 else index.searchsorted(rolls[i], side='left')
+        segments.append(contracts[name].iloc[start:stop])
+
+    lengths = np.array([len(segment) for segment in segments])
+    segment_id = np.repeat(np.arange(len(names)), lengths)
+
+    # -- Cumulative adjustment of every segment, from the latest roll backwards
+    if adjustment == 'back':
+        factor = np.append(np.cumsum(schedule['gap'].to_numpy()[::-1])[::-1], 0.0)
+    elif adjustment == 'ratio':
+        factor = np.append(np.cumprod(schedule['ratio'].to_numpy()[::-1])[::-1], 1.0)
+    elif adjustment is None:
+        factor = None
+    else:
+        raise ValueError("Accepted values for adjustment are: 'back', 'ratio' or None")
+
+    prices = np.concatenate([segment[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+                             for segment in segments])
+    if adjustment == 'back':
+        prices += factor[segment_id][:, None]
+    elif adjustment == 'ratio':
+        prices *= factor[segment_id][:, None]
+
+    r_continuous = pd.DataFrame(prices, columns=['open', 'high', 'low', 'close'])
+    r_continuous.insert(0, 'timestamp', np.concatenate([segment.index.values for segment in segments]))
+    r_continuous['volume'] = np.concatenate([segment['volume'].to_numpy() for segment in segments])
+
+    return r_continuous
@@ -12,12 +12,20 @@
 """
 
 # -- Load packages for this script
+import os
+import json
+import shutil
+import hashlib
 import pandas as pd
 import numpy as np
 
+# -- Load other scripts
+import profiling as pf
+
 # --------------------------------------------------------------------------------- RESAMPLE OHLC PRICES -- #
 # ------------------------------------------------------------------------------------------------------ -- #
 
+@pf.stage()
 def resample_data(target_data, target_freq='D', auto_names=True, col_names=None):
     """
     Downsample price data from high frequency, e.g. minute prices, to low frequency, e.g. dayly prices. 
@@ -85,12 +93,13 @@ def resample_data(target_data, target_freq='D', auto_names=True, col_names=None)
             data.columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
     
     # Timestamp data conversion
-    data['timestamp'] = pd.to_datetime(data['timestamp'])
+    with pf.section('to_datetime', rows=len(data)):
+        data['timestamp'] = pd.to_datetime(data['timestamp'])
     data.index = data['timestamp']
     data.drop('timestamp', inplace=True, axis=1)
 
     # -- Resampling process
-    conversion = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    conversion = _ohlcv_conversion(data.columns)
     r_grouped_data = data.resample(target_freq).agg(conversion)
 
     # Eliminar los NAs originados por que ese minuto
@@ -98,84 +107,1127 @@ def resample_data(target_data, target_freq='D', auto_names=True, col_names=None)
 
     return r_grouped_data
 
+# ------------------------------------------------------------------------------- STREAMING OHLCV PRICES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Column names and explicit types for OHLCV price files
+_ohlcv_names = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+_ohlcv_dtypes = {'timestamp': str, 'open': np.float64, 'high': np.float64, 'low': np.float64,
+                 'close': np.float64, 'volume': np.float64}
+
+
+@pf.stage()
+def read_ohlcv(file_route, chunk_size=500000, invert=False, decimals=5, ts_format=None, dtype=np.float64):
+    """
+    Reads an OHLCV price file (csv format, no header) in chunks of rows, so the memory used is bounded by the
+    chunk size instead of the file size. Every chunk is returned as a timestamp-indexed DataFrame.
+
+    Parameters
+    ----------
+
+    file_route: str
+        Route of the file with the columns: timestamp, open, high, low, close, volume
+
+    chunk_size: int
+        500000 (Default): number of rows read per chunk
+
+    invert: bool
+        False (Default): prices are returned as they are in the file
+        True: prices are converted to its reciprocal, e.g. from MXNUSD to USDMXN, and high and low are swapped
+
+    decimals: int
+        5 (Default): decimals to round the prices to when invert is True
+
+    ts_format: str
+        None (Default): infer the timestamp format, otherwise, a strftime format passed to pd.to_datetime
+
+    dtype: np.dtype
+        np.float64 (Default): type of the prices, np.float32 for half the memory, see compact_prices
+
+    Returns
+    -------
+
+    r_chunks: generator
+        DataFrames with 'open', 'high', 'low', 'close', 'volume' columns and a DatetimeIndex
+
+    Example
+    -------
+
+    >> chunks = read_ohlcv(file_route='files/prices/MP_H1_2010_2021.txt', invert=True)
+    >> global_data = resample_stream(chunks=chunks, target_freq='8H')
+
+    """
+
+    reader = pd.read_csv(file_route, header=None, names=_ohlcv_names, dtype=_ohlcv_dtypes,
+                         chunksize=chunk_size)
+
+    for chunk in pf.iterate('read_csv', reader):
+        with pf.section('to_datetime', rows=len(chunk)):
+            index = pd.DatetimeIndex(pd.to_datetime(chunk['timestamp'], format=ts_format), name='timestamp')
+        # a single block for the prices of the chunk
+        prices = chunk[['open', 'high', 'low', 'close']].to_numpy(dtype=dtype)
+
+        if invert:
+            # Conversion from Usd per Mxn to Mxn per Usd
+            np.reciprocal(prices, out=prices)
+            np.round(prices, decimals, out=prices)
+            # Swap high and low since the exchange rate was swapped
+            prices[:, [1, 2]] = prices[:, [2, 1]]
+
+        r_chunk = pd.DataFrame(prices, index=index, columns=['open', 'high', 'low', 'close'])
+        r_chunk['volume'] = chunk['volume'].to_numpy()
+
+        yield r_chunk
+
+
+@pf.stage()
+def resample_stream(chunks, target_freq='D', session_open=None, holidays=None, weekends=False):
+    """
+    Incremental version of resample_data for an iterable of timestamp-indexed OHLCV chunks (e.g. from
+    read_ohlcv). Every chunk is resampled as it arrives, and the rows of the last, possibly partial, bar are
+    carried over to the next chunk, so the output is identical to resampling the whole data at once. With
+    session_open, holidays or weekends the chunks are resampled with resample_bars, and the rows of the last
+    open session (with the ones of the closed sessions just before it) are the ones carried over.
+
+    Parameters
+    ----------
+
+    chunks: iterable
+        DataFrames with 'open', 'high', 'low', 'close' and optionally 'volume' columns, with a DatetimeIndex,
+        sorted in ascending order within and across chunks
+
+    target_freq: str
+        The target frequency to resample the prices, fixed size bins with left labels are supported, e.g.
+        'H', '8H', 'D' (see resample_data)
+
+    session_open: str
+        None (Default): bars anchored to midnight, otherwise, see resample_bars
+
+    holidays: list
+        None (Default): no holidays, otherwise, see resample_bars
+
+    weekends: bool
+        False (Default): sessions that close on saturday or sunday are kept, otherwise, see resample_bars
+
+    Returns
+    -------
+
+    r_grouped_data: DataFrame
+
+        DataFrame with the new resampled data
+
+    """
+
+    if session_open is not None or holidays is not None or weekends:
+        return _resample_sessions(chunks, target_freq, session_open, holidays, weekends)
+
+    r_bars = []
+    carry = None
+    anchor = {}
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+
+        # fixed size bins anchored to the start of the first day in the data, as in resample_data
+        if carry is None and isinstance(pd.tseries.frequencies.to_offset(target_freq), pd.offsets.Tick):
+            anchor = {'origin': chunk.index[0].floor('D')}
+
+        data = chunk if carry is None else pd.concat([carry, chunk])
+        bars = data.resample(target_freq, **anchor).agg(_ohlcv_conversion(data.columns))
+
+        # rows from the last bar are kept until the next chunk arrives
+        carry = data.iloc[data.index.searchsorted(bars.index[-1], side='left'):]
+        r_bars.append(bars.iloc[:-1].dropna())
+
+    # the last partial bar is complete after the last chunk
+    if carry is not None:
+        r_bars.append(carry.resample(target_freq, **anchor).agg(_ohlcv_conversion(carry.columns)).dropna())
+
+    if len(r_bars) == 0:
+        return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
+
+    return pd.concat(r_bars)
+
+
+def _resample_sessions(chunks, target_freq, session_open, holidays, weekends):
+    """
+    resample_stream for bars anchored to trading sessions, with resample_bars.
+
+    """
+
+    # the bars of a session can not start in a previous one
+    step = _freq_nanos(target_freq)
+    if _day_ns % step != 0 and step % _day_ns != 0:
+        raise ValueError('Session bars must divide a day or be whole days, not ' + str(target_freq))
+
+    r_bars = []
+    carry = None
+    origin = None
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+
+        data = chunk if carry is None else pd.concat([carry, chunk])
+        stamps = _wall_nanos(pd.DatetimeIndex(data.index))
+        # the bars of every chunk anchored to the session of the first price
+        if origin is None:
+            origin = _session_origin(stamps, session_open)
+        sessions, closed = _closed_sessions(stamps, origin, holidays, weekends)
+
+        # rows from the last open session, and from the closed ones before it, are kept for the next chunk
+        opened = np.flatnonzero(~closed)
+        if len(opened) == 0:
+            carry = data
+            continue
+        # from the session of the start of its last bar
+        first = sessions[opened[-1]]*_day_ns//step*step//_day_ns
+        c_sessions = set(np.unique(sessions[closed]).tolist())
+        while first - 1 in c_sessions:
+            first -= 1
+        cut = np.searchsorted(sessions, first, side='left')
+
+        carry = data.iloc[cut:]
+        if cut > 0:
+            r_bars.append(resample_bars(target_data=data.iloc[:cut], target_freq=target_freq,
+                                        session_open=session_open, holidays=holidays, weekends=weekends,
+                                        origin=pd.Timestamp(origin)))
+
+    # the last session is complete after the last chunk
+    if carry is not None:
+        r_bars.append(resample_bars(target_data=carry, target_freq=target_freq, session_open=session_open,
+                                    holidays=holidays, weekends=weekends, origin=pd.Timestamp(origin)))
+
+    if len(r_bars) == 0:
+        return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
+
+    return pd.concat(r_bars)
+
+
+def _ohlcv_conversion(columns):
+    """
+    Aggregation function for every OHLCV column present in columns.
+
+    """
+
+    conversion = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+
+    return {column: conversion[column] for column in columns if column in conversion}
+
+# -------------------------------------------------------------------------------- VECTORIZED RESAMPLING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Nanoseconds in a day, for the session arithmetic
+_day_ns = 86400*10**9
+
+
+@pf.stage()
+def resample_bars(target_data, target_freq='D', session_open=None, holidays=None, weekends=False,
+                  bar_type='time', threshold=None, origin=None):
+    """
+    Vectorized alternative to resample_data: the bar of every price is computed once with integer arithmetic
+    over the int64 timestamps, and the OHLCV values of the contiguous rows of every bar are aggregated with
+    np.maximum.reduceat, np.minimum.reduceat and np.add.reduceat. Time bars can be anchored to the open of a
+    trading session (e.g. 17:00 for CME Globex), with the prices of holidays and weekends assigned to the next
+    session, and several frequencies are formed in one pass, the coarser ones from the finer bars when its
+    size is a multiple. Tick, volume and dollar bars are formed with the same aggregation.
+
+    With the defaults, the result is the same as resample_data for fixed size frequencies.
+
+    Parameters
+    ----------
+
+    target_data: pd.DataFrame
+        OHLCV prices with a sorted DatetimeIndex (e.g. a chunk from read_ohlcv) or with a 'timestamp' column,
+        timestamps are taken as the wall time of the session (e.g. US/Central for CME)
+
+    target_freq: str or list
+        'D' (Default): fixed size frequency of the time bars, e.g. '1h', '8h', 'D', or a list of them
+
+    session_open: str
+        None (Default): bars anchored to midnight
+        str: time of the session open, e.g. '17:00', bars are anchored to it and sessions last a day
+
+    holidays: list
+        None (Default): no holidays
+        list: dates of the sessions without trading (the date on which the session closes), its prices are
+        assigned to the first bar of the next session
+
+    weekends: bool
+        False (Default): sessions that close on saturday or sunday are kept
+        True: sessions that close on saturday or sunday are treated as holidays
+
+    bar_type: str
+        'time' (Default): bars of target_freq
+        'tick': bars of threshold prices
+        'volume': a new bar when the cumulative volume reaches a multiple of threshold
+        'dollar': a new bar when the cumulative close*volume reaches a multiple of threshold
+
+    threshold: float or list
+        None (Default): size of the tick, volume or dollar bars, or a list of them
+
+    origin: pd.Timestamp
+        None (Default): time bars anchored to midnight (or session_open) at or before the first price
+        pd.Timestamp: wall time of the anchor of the time bars, to resample chunks of the same prices with
+        the bars of the whole prices (see resample_stream)
+
+    Returns
+    -------
+
+    r_bars: pd.DataFrame or dict
+        Bars with 'open', 'high', 'low', 'close' (and 'volume' if present) columns, labeled by the timestamp
+        of its first price, or {target_freq or threshold: bars} when a list is given
+
+    Example
+    -------
+
+    >> chunk = next(read_ohlcv(file_route='files/prices/MP_H1_2010_2021.txt', chunk_size=10**7))
+    >> bars = resample_bars(target_data=chunk, target_freq=['1h', '8h', 'D'], session_open='17:00',
+                            holidays=['2020-12-25', '2021-01-01'], weekends=True)
+
+    """
+
+    data = target_data.set_index('timestamp') if 'timestamp' in target_data.columns else target_data
+    index = pd.DatetimeIndex(data.index)
+    if not index.is_monotonic_increasing:
+        raise ValueError('The timestamps must be sorted in ascending order')
+
+    if not {'open', 'high', 'low', 'close'}.issubset(data.columns):
+        raise IndexError("The columns 'open', 'high', 'low' and 'close' are needed")
+
+    columns = [column for column in ['open', 'high', 'low', 'close', 'volume'] if column in data.columns]
+    values = data[columns].to_numpy(dtype=np.float64)
+    # wall time as int64 nanoseconds, the bars are labeled with the resolution of the index
+    stamps = (index if index.tz is None else index.tz_localize(None)).values
+    unit, stamps = stamps.dtype, stamps.astype('datetime64[ns]').view(np.int64)
+
+    # -- Information driven bars, labeled by the timestamp of its first price
+    if bar_type in ['tick', 'volume', 'dollar']:
+        if threshold is None:
+            raise ValueError('A threshold is needed for ' + bar_type + ' bars')
+        if bar_type != 'tick' and 'volume' not in columns:
+            raise IndexError('A volume column is needed for ' + bar_type + ' bars')
+
+        sizes = None
+        if bar_type == 'volume':
+            sizes = values[:, 4]
+        elif bar_type == 'dollar':
+            sizes = values[:, 3]*values[:, 4]
+        # cumulative size before every price, so a bar closes with the price that reaches the threshold
+        before = None if sizes is None else np.cumsum(sizes) - sizes
+
+        r_bars = {}
+        for t_bar in np.atleast_1d(threshold).tolist():
+            ids = np.arange(len(stamps))//int(t_bar) if sizes is None else np.floor(before/t_bar)
+            starts = _group_starts(ids)
+            r_bars[t_bar] = _bars_frame(_reduce_bars(values, starts), stamps[starts], columns, index.tz, unit)
+
+        return r_bars if isinstance(threshold, (list, tuple, np.ndarray)) else r_bars[threshold]
+
+    elif bar_type != 'time':
+        raise ValueError("Accepted values for bar_type are: 'time', 'tick', 'volume' or 'dollar'")
+
+    # -- Session anchor, at or before the first price
+    if origin is not None:
+        origin = pd.Timestamp(origin).tz_localize(None).value
+    else:
+        origin = _session_origin(stamps, session_open)
+
+    # -- Prices of closed sessions (holidays and weekends) to the start of the next open session
+    if (holidays is not None or weekends) and len(stamps) > 0:
+        sessions, closed = _closed_sessions(stamps, origin, holidays, weekends)
+        if closed.any():
+            stamps = stamps.copy()
+            c_sessions = np.unique(sessions[closed])
+            # the next open session after a run of closed ones is the first after its last one
+            o_sessions = np.setdiff1d(c_sessions + 1, c_sessions)
+            n_sessions = o_sessions[np.searchsorted(o_sessions, c_sessions, side='right')]
+            stamps[closed] = origin + n_sessions[np.searchsorted(c_sessions, sessions[closed])]*_day_ns
+
+    # -- Bars of every frequency, from the finest to the coarsest
+    freqs = [target_freq] if isinstance(target_freq, str) else list(target_freq)
+    steps = {freq: _freq_nanos(freq) for freq in freqs}
+
+    r_bars = {}
+    f_values, f_stamps, f_step = values, stamps, None
+    for freq in sorted(freqs, key=lambda f: steps[f]):
+        step = steps[freq]
+        # coarser bars from the finer ones when they fit exactly, otherwise from the prices
+        if f_step is None or step % f_step != 0:
+            f_values, f_stamps = values, stamps
+
+        ids = (f_stamps - origin)//step
+        starts = _group_starts(ids)
+        f_values, f_stamps, f_step = _reduce_bars(f_values, starts), origin + ids[starts]*step, step
+        r_bars[freq] = _bars_frame(f_values, f_stamps, columns, index.tz, unit)
+
+    return r_bars[target_freq] if isinstance(target_freq, str) else {freq: r_bars[freq] for freq in freqs}
+
+
+def _session_origin(stamps, session_open=None):
+    """
+    Anchor of the bars in int64 nanoseconds of wall time: midnight, or the session open, at or before the
+    first of the stamps.
+
+    """
+
+    if len(stamps) == 0:
+        return 0
+
+    r_origin = stamps[0] - stamps[0] % _day_ns
+    if session_open is not None:
+        s_open = pd.Timestamp(session_open)
+        r_origin += (s_open - s_open.normalize()).value
+        r_origin -= _day_ns if r_origin > stamps[0] else 0
+
+    return r_origin
+
+
+def _closed_sessions(stamps, origin, holidays=None, weekends=False):
+    """
+    Session of every stamp (days since origin) and whether the session is closed, a holiday or a weekend.
+
+    """
+
+    sessions = (stamps - origin)//_day_ns
+    # date of every session, the date on which it closes, in days since epoch
+    s_dates = (origin + (sessions + 1)*_day_ns - 1)//_day_ns
+    closed = np.zeros(len(stamps), dtype=bool)
+    if holidays is not None:
+        h_dates = pd.DatetimeIndex(holidays).values.astype('datetime64[D]').astype(np.int64)
+        closed |= np.isin(s_dates, h_dates)
+    if weekends:
+        # 1970-01-01 was a thursday, so 2 and 3 are saturday and sunday
+        closed |= (s_dates % 7 == 2) | (s_dates % 7 == 3)
+
+    return sessions, closed
+
+
+def _wall_nanos(index):
+    """
+    Timestamps of a DatetimeIndex as int64 nanoseconds of wall time.
+
+    """
+
+    wall = index if index.tz is None else index.tz_localize(None)
+
+    return wall.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _freq_nanos(freq):
+    """
+    Size of a fixed size frequency in nanoseconds.
+
+    """
+
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if isinstance(offset, pd.offsets.Tick):
+        return int(offset.nanos)
+    elif isinstance(offset, pd.offsets.Day):
+        return int(offset.n)*_day_ns
+
+    raise ValueError('Only fixed size frequencies are supported, e.g. 1min, 8h or D, not ' + str(freq))
+
+
+def _group_starts(ids):
+    """
+    Positions where a new group starts in a sorted array of group ids.
+
+    """
+
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+
+def _reduce_bars(values, starts):
+    """
+    Open, high, low, close (and volume) of the bars formed by the contiguous rows of values that start at the
+    positions in starts.
+
+    """
+
+    r_values = np.empty((len(starts), values.shape[1]), dtype=np.float64)
+    if len(starts) == 0:
+        return r_values
+
+    r_values[:, 0] = values[starts, 0]
+    r_values[:, 1] = np.maximum.reduceat(values[:, 1], starts)
+    r_values[:, 2] = np.minimum.reduceat(values[:, 2], starts)
+    r_values[:, 3] = values[np.r_[starts[1:], len(values)] - 1, 3]
+    if values.shape[1] > 4:
+        r_values[:, 4] = np.add.reduceat(values[:, 4], starts)
+
+    return r_values
+
+
+def _bars_frame(values, stamps, columns, tz=None, unit='datetime64[ns]'):
+    """
+    DataFrame of bars from its values and its labels as int64 nanoseconds of wall time, with the labels in
+    the resolution unit.
+
+    """
+
+    index = pd.DatetimeIndex(stamps.astype('datetime64[ns]').astype(unit), name='timestamp')
+    if tz is not None:
+        index = index.tz_localize(tz, ambiguous=np.ones(len(index), dtype=bool), nonexistent='shift_forward')
+
+    return pd.DataFrame(values, index=index, columns=columns)
+
+# ---------------------------------------------------------------------------------- PRICES BINARY CACHE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Default location and size bound (bytes) of the prices cache
+_cache_dir = 'files/cache'
+_cache_max_size = 2*1024**3
+
+
+@pf.stage()
+def read_cached(file_route, target_freq='D', invert=False, decimals=5, chunk_size=500000,
+                cache_dir=_cache_dir, max_size=_cache_max_size):
+    """
+    Reads and resamples an OHLCV price file (see read_ohlcv and resample_stream), persisting the result to a
+    columnar binary cache (.npy files) that is loaded memory-mapped on subsequent calls. Cache entries are
+    keyed by the route, modification time and size of the file plus the conversion options, so any change
+    to the file or the options produces a new entry. The least recently used entries are evicted to keep
+    the total size of the cache under max_size.
+
+    Parameters
+    ----------
+
+    file_route: str
+        Route of the file with the columns: timestamp, open, high, low, close, volume
+
+    target_freq: str
+        The target frequency to resample the prices, see resample_stream
+
+    invert: bool
+        False (Default): prices are used as they are in the file
+        True: prices are converted to its reciprocal and high and low are swapped, see read_ohlcv
+
+    decimals: int
+        5 (Default): decimals to round the prices to when invert is True
+
+    chunk_size: int
+        500000 (Default): number of rows read per chunk when the file is not in the cache
+
+    cache_dir: str
+        'files/cache' (Default): directory for the cache entries
+
+    max_size: int
+        2 GB (Default): maximum total size, in bytes, of the cache on disk
+
+    Returns
+    -------
+
+    r_data: DataFrame
+        Resampled OHLCV prices with a DatetimeIndex, read-only and memory-mapped when loaded from the cache
+
+    Example
+    -------
+
+    >> global_data = read_cached(file_route='files/prices/MP_H1_2010_2021.txt', target_freq='8H', invert=True)
+
+    """
+
+    entry = os.path.join(cache_dir, _cache_key(file_route, target_freq, invert, decimals))
+
+    # -- Cache hit
+    if os.path.isfile(os.path.join(entry, 'meta.json')):
+        # access time for the least recently used eviction
+        os.utime(os.path.join(entry, 'meta.json'))
+        return _cache_load(entry)
+
+    # -- Cache miss
+    r_data = resample_stream(chunks=read_ohlcv(file_route=file_route, chunk_size=chunk_size, invert=invert,
+                                               decimals=decimals), target_freq=target_freq)
+    _cache_store(entry, r_data, file_route)
+    _cache_evict(cache_dir=cache_dir, max_size=max_size, keep=entry)
+
+    return r_data
+
+
+def cache_invalidate(file_route=None, cache_dir=_cache_dir):
+    """
+    Removes entries from the prices cache.
+
+    Parameters
+    ----------
+
+    file_route: str
+        None (Default): every entry in the cache is removed
+        str: only the entries created from this file are removed, for any conversion options
+
+    cache_dir: str
+        'files/cache' (Default): directory of the cache entries
+
+    Returns
+    -------
+
+    r_removed: int
+        Number of removed entries
+
+    """
+
+    r_removed = 0
+    for entry, meta in _cache_entries(cache_dir):
+        if file_route is None or meta['route'] == os.path.abspath(file_route):
+            shutil.rmtree(entry, ignore_errors=True)
+            r_removed += 1
+
+    return r_removed
+
+
+@pf.stage()
+def read_columnar(route):
+    """
+    Reads OHLCV prices stored in the columnar binary format of the prices cache (a directory with values.npy,
+    index.npy and meta.json), e.g. from synthetic.ohlcv_to_columnar, with the values memory-mapped.
+
+    Parameters
+    ----------
+
+    route: str
+        Directory with the prices
+
+    Returns
+    -------
+
+    r_data: DataFrame
+        OHLCV prices with a DatetimeIndex, read-only and memory-mapped
+
+    """
+
+    return _cache_load(route)
+
+
+def _cache_key(file_route, target_freq, invert, decimals):
+    """
+    Hash of the source file identity (route, modification time and size) and the conversion options.
+
+    """
+
+    stat = os.stat(file_route)
+    key = {'route': os.path.abspath(file_route), 'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+           'target_freq': str(target_freq), 'invert': bool(invert), 'decimals': int(decimals)}
+
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _cache_store(entry, data, file_route, dtype=np.float64):
+    """
+    Writes a DataFrame as a cache entry: one 2D array with the values (float64, or the common type of the
+    columns with dtype=None) and one int64 array with the timestamps (UTC). The entry is written in a
+    temporary directory and then renamed, so it is never left partial, see _entry_replace.
+
+    """
+
+    tmp_entry = entry + '.tmp' + str(os.getpid())
+    os.makedirs(tmp_entry, exist_ok=True)
+
+    np.save(os.path.join(tmp_entry, 'values.npy'), data.to_numpy(dtype=dtype))
+    np.save(os.path.join(tmp_entry, 'index.npy'), data.index.values)
+    meta = {'route': os.path.abspath(file_route), 'columns': list(data.columns),
+            'index_name': data.index.name, 'tz': None if data.index.tz is None else str(data.index.tz)}
+    with open(os.path.join(tmp_entry, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+
+    _entry_replace(tmp_entry, entry)
+
+
+def _entry_replace(tmp_entry, entry):
+    """
+    Renames the temporary directory tmp_entry to entry. A previous entry is renamed aside first and removed
+    after the swap (or renamed back if it fails), and when another process writes the same entry in between,
+    its entry is kept. Any other failure is raised.
+
+    """
+
+    old_entry = entry + '.old' + str(os.getpid())
+    try:
+        os.replace(entry, old_entry)
+    except FileNotFoundError:
+        old_entry = None
+
+    try:
+        os.replace(tmp_entry, entry)
+    except OSError:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        if not os.path.isdir(entry):
+            if old_entry is not None:
+                os.replace(old_entry, entry)
+            raise
+    finally:
+        if old_entry is not None:
+            shutil.rmtree(old_entry, ignore_errors=True)
+
+
+def _cache_load(entry):
+    """
+    Reads a cache entry with the values memory-mapped.
+
+    """
+
+    with open(os.path.join(entry, 'meta.json')) as file:
+        meta = json.load(file)
+
+    values = np.load(os.path.join(entry, 'values.npy'), mmap_mode='r')
+    index = pd.DatetimeIndex(np.load(os.path.join(entry, 'index.npy')), name=meta['index_name'])
+    if meta['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(meta['tz'])
+
+    return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+
+
+def _cache_entries(cache_dir):
+    """
+    Complete entries in the cache directory with its metadata.
+
+    """
+
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        meta_route = os.path.join(cache_dir, name, 'meta.json')
+        if os.path.isfile(meta_route):
+            with open(meta_route) as file:
+                entries.append((os.path.join(cache_dir, name), json.load(file)))
+
+    return entries
+
+
+def _cache_evict(cache_dir, max_size, keep=None):
+    """
+    Removes the least recently used entries until the total size of the cache is under max_size, the entry
+    keep is never removed.
+
+    """
+
+    entries = []
+    for entry, _ in _cache_entries(cache_dir):
+        size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+        entries.append((os.path.getmtime(os.path.join(entry, 'meta.json')), size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_size:
+            break
+        if entry != keep:
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+# ---------------------------------------------------------------------------------- COMPACT MEMORY MODE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Types of the compact mode, prices as float32 or as int32 multiples of the tick size
+_compact_dtypes = {'float32': np.float32, 'int32': np.int32}
+
+
+def compact_prices(global_data, dtype='float32', tick_size=None):
+    """
+    Compact version of an OHLCV dataset, with all the columns in a single backing array of 4 bytes per value
+    instead of 8: float32 prices, or int32 prices as multiples of the tick size (exact for prices quoted in
+    ticks). Since the values are a single block, the Folds of folds_formation(output='data') are views of
+    this array, and ohlc_labeling scales the 'co' and 'hl' labels of int32 prices by the tick size, kept in
+    r_data.attrs['tick_size'].
+
+    float32 prices have a relative error of up to 6e-8, so labels that are differences of close prices
+    ('co', 'hl') have an absolute error of up to about 1e-7 times the price level, see pipeline.compact_check
+    for the tolerance check of labels and KLD against the float64 results.
+
+    Parameters
+    ----------
+
+    global_data: pd.DataFrame
+        OHLCV prices with a DatetimeIndex
+
+    dtype: str
+        'float32' (Default): prices and volume as float32
+        'int32': prices as int32 number of ticks, volume rounded to int32
+
+    tick_size: float
+        None (Default): tick size of the prices, needed when dtype is 'int32', e.g. 1e-5
+
+    Returns
+    -------
+
+    r_data: pd.DataFrame
+        Same index and columns as global_data, with the values in one (rows, columns) array of dtype
+
+    Example
+    -------
+
+    >> global_data = compact_prices(global_data=read_cached(file_route=file_route, target_freq='8H'),
+                                    dtype='int32', tick_size=1e-5)
+    >> folds_data = folds_formation(global_data=global_data, fold_size='year')
+
+    """
+
+    if dtype not in _compact_dtypes:
+        raise ValueError("Accepted values for dtype are: 'float32' or 'int32'")
+
+    values = global_data.to_numpy(dtype=np.float64)
+
+    if dtype == 'float32':
+        r_values = values.astype(np.float32)
+
+    else:
+        if tick_size is None:
+            raise ValueError('A tick_size is needed for int32 prices')
+        # prices in ticks, the volume as it is
+        scale = np.array([1.0 if column == 'volume' else 1/tick_size for column in global_data.columns])
+        r_values = np.rint(values*scale)
+        if np.isnan(r_values).any():
+            raise ValueError('int32 prices can not have missing values')
+        if np.abs(r_values).max(initial=0) > np.iinfo(np.int32).max:
+            raise ValueError('The prices in ticks (or the volume) are out of the int32 range')
+        r_values = r_values.astype(np.int32)
+
+    # a single block, so the slices of the rows are views of r_values
+    r_data = pd.DataFrame(r_values, index=global_data.index, columns=global_data.columns, copy=False)
+    r_data.attrs['tick_size'] = tick_size if dtype == 'int32' else None
+
+    return r_data
+
+
+def expand_prices(compact_data):
+    """
+    float64 version of a dataset from compact_prices, with the int32 ticks converted back to prices.
+
+    Parameters
+    ----------
+
+    compact_data: pd.DataFrame
+        Dataset from compact_prices (or one of its Folds)
+
+    Returns
+    -------
+
+    r_data: pd.DataFrame
+
+    """
+
+    values = compact_data.to_numpy(dtype=np.float64, copy=True)
+    tick_size = compact_data.attrs.get('tick_size')
+    if tick_size is not None:
+        values[:, [column != 'volume' for column in compact_data.columns]] *= tick_size
+
+    return pd.DataFrame(values, index=compact_data.index, columns=compact_data.columns)
+
 # ------------------------------------------------------------------------------------ T-FOLDS FORMATION -- #
 # --------------------------------------------------------------------------------------------------------- #
 
-def folds_formation(global_data, fold_size):
+@pf.stage()
+def folds_formation(global_data, fold_size, output='data'):
     """
-    Function to separate in T-Folds the data, the functions guarantees not having filtrations
+    Function to separate in T-Folds the data, the functions guarantees not having filtrations. Fold boundaries
+    are computed once from the sorted DatetimeIndex (searchsorted on the period edges), so every fold is a
+    contiguous positional slice of the global dataset and no data is re-scanned or copied per fold.
     
     Parameters
     ----------
     global_data : pd.DataFrame
-        DataFrame with a global dataset
+        DataFrame with a global dataset, indexed by a sorted DatetimeIndex
     
     fold_size : str
         'month': every T-Fold will be of one month of historical data
         'quarter': every T-Fold will be of three months (quarter) of historical data
+        'semester': every T-Fold will be of six months (semester) of historical data
         'year': every T-Fold will be of twelve months of historical data
         'bi-year': every T-Fold will be of 2 years of historical data
         '80-20': Hold out method, 80% for training and 20% for valing
     
+    output : str
+        'data' (Default): every fold is materialized as a positional slice (view) of global_data
+        'offsets': every fold is returned as a (start, stop) tuple of integer positions in global_data
+
     Returns
     -------
     n_data: dict
         A dictionary with the data separated by Fold, stored by keynames according to Fold size
     
+    Example
+    -------
+
+    >> folds_formation(global_data=global_data, fold_size='quarter', output='offsets')
+    >> {'q_01_2010': (0, 189), 'q_02_2010': (189, 381), ...}
+
+    """
+
+    # -- Fold boundaries as positional offsets
+    offsets = folds_offsets(index=global_data.index, fold_size=fold_size)
+
+    # return offsets only
+    if output == 'offsets':
+        return offsets
+
+    # positional slices of the global data
+    elif output == 'data':
+        return {label: global_data.iloc[start:stop] for label, (start, stop) in offsets.items()}
+
+    # raise error
+    else:
+        raise ValueError("Accepted values for output are: 'data' or 'offsets'")
+
+
+@pf.stage()
+def folds_offsets(index, fold_size, origin=None):
+    """
+    Computes the (start, stop) integer positions of every T-Fold within a sorted DatetimeIndex. Empty periods
+    (e.g. gaps in the data) do not produce a fold.
+
+    Parameters
+    ----------
+    index : pd.DatetimeIndex
+        Sorted (ascending) timestamp-based index of the global dataset
+
+    fold_size : str
+        'month', 'quarter', 'semester', 'year', 'bi-year' or '80-20', see folds_formation
+
+    origin : pd.Timestamp
+        None (Default): 'bi-year' folds are anchored to the first year of the index
+        pd.Timestamp: 'bi-year' folds are anchored to its year, e.g. the first timestamp of a longer index
+        when index is its last rows
+
+    Returns
+    -------
+    r_offsets: dict
+        {fold_label: (start, stop)} with fold labels in chronological order
+
+    """
+
+    if not isinstance(index, pd.DatetimeIndex):
+        raise TypeError('The index of the global dataset must be a pd.DatetimeIndex')
+
+    if not index.is_monotonic_increasing:
+        raise ValueError('The index of the global dataset must be sorted in ascending order')
+
+    if len(index) == 0:
+        return {}
+
+    # Hold out method, splitted by whole years
+    if fold_size == '80-20':
+        # positions and labels of every year with data
+        y_edges, y_pos = _period_edges(index=index, months=12)
+        years = [y_edges[i].year for i in range(0, len(y_edges) - 1) if y_pos[i + 1] > y_pos[i]]
+        a_8 = int(len(years)*0.80)
+        a_2 = int(len(years)*0.20)
+        # year boundaries in positions
+        y_start = dict(zip([edge.year for edge in y_edges], y_pos))
+        h_8_stop = y_start[years[a_8]] if a_8 < len(years) else len(index)
+        h_2_stop = y_start[years[a_8 + a_2]] if a_8 + a_2 < len(years) else len(index)
+
+        return {'h_8': (0, int(h_8_stop)), 'h_2': (int(h_8_stop), int(h_2_stop))}
+
+    # Calendar folds, as a fixed number of months per fold
+    elif fold_size in _fold_months:
+        months = _fold_months[fold_size]
+        edges, positions = _period_edges(index=index, months=months, origin=origin)
+
+        r_offsets = {}
+        for i in range(0, len(edges) - 1):
+            start, stop = int(positions[i]), int(positions[i + 1])
+            # skip periods without data
+            if stop > start:
+                r_offsets[_fold_label(edges[i], fold_size)] = (start, stop)
+
+        return r_offsets
+
+    # raise error
+    else:
+        raise ValueError("Accepted values for fold_size are: 'month', 'quarter', 'semester', 'year', "
+                         "'bi-year' or '80-20'")
+
+
+# -- Number of calendar months in every fold size
+_fold_months = {'month': 1, 'quarter': 3, 'semester': 6, 'year': 12, 'bi-year': 24}
+
+
+def _period_edges(index, months, origin=None):
+    """
+    Edges (timestamps) of consecutive periods of a fixed number of calendar months, covering the whole index,
+    and their positions in the index through searchsorted. Periods up to a year are anchored to the calendar
+    year, longer ones to the first year in the index (or the year of origin).
+
+    """
+
+    first, last = index[0], index[-1]
+
+    # first period start, anchored to the calendar
+    if months <= 12:
+        start_year, start_month = first.year, ((first.month - 1)//months)*months + 1
+    else:
+        o_year = first.year if origin is None else pd.Timestamp(origin).year
+        start_year, start_month = o_year + ((first.year - o_year)//(months//12))*(months//12), 1
+    start = pd.Timestamp(year=start_year, month=start_month, day=1, tz=index.tz)
+
+    # number of periods needed to cover up to the last timestamp
+    n_months = (last.year - start.year)*12 + (last.month - start.month)
+    n_periods = n_months//months + 1
+
+    # period edges, the last one closes the final period
+    edges = [start + pd.DateOffset(months=months*i) for i in range(0, n_periods + 1)]
+    positions = index.searchsorted(pd.DatetimeIndex(edges), side='left')
+
+    return edges, positions
+
+
+def _fold_label(edge, fold_size):
+    """
+    Label for a calendar fold starting at edge.
+
     """
 
-    # For quarterly separation of the data
-    if fold_size == 'quarter':
-        # List of quarters in the dataset
-        quarters = list(set(time.quarter for time in list(global_data.index)))
-        # List of years in the dataset
-        years = set(time.year for time in list(global_data.index))
-        q_data = {}
-        # New key for every quarter_year
-        for y in sorted(list(years)):
-            q_data.update({'q_' + str('0') + str(i) + '_' + str(y) if i <= 9 else str(i) + '_' + str(y):
-                               global_data[(global_data.index.year == y) & (global_data.index.quarter == i)]
-                           for i in quarters})
-        return q_data
-
-    # For semester separation of the data
+    if fold_size == 'month':
+        return 'm_' + str(edge.month).zfill(2) + '_' + str(edge.year)
+    elif fold_size == 'quarter':
+        return 'q_' + str((edge.month - 1)//3 + 1).zfill(2) + '_' + str(edge.year)
     elif fold_size == 'semester':
-        # List of years in the dataset
-        years = set(time.year for time in list(global_data.index))
-        s_data = {}
-        # New key for every semester_year
-        for y in sorted(list(years)):
-            s_data.update({'s_' + str('0') + str(1) + '_' + str(y):
-                               global_data[(global_data.index.year == y) & ((global_data.index.quarter == 1) |
-                                      (global_data.index.quarter == 2))]})
-
-            s_data.update({'s_' + str('0') + str(2) + '_' + str(y):
-                               global_data[(global_data.index.year == y) &
-                                      ((global_data.index.quarter == 3) | (global_data.index.quarter == 4))]})
-
-        return s_data
-
-    # For yearly separation of the data
+        return 's_' + str((edge.month - 1)//6 + 1).zfill(2) + '_' + str(edge.year)
     elif fold_size == 'year':
-        # List of years in the dataset
-        years = set(time.year for time in list(global_data.index))
-        y_data = {}
-        # New key for every year
-        for y in sorted(list(years)):
-            y_data.update({'y_' + str(y):
-                               global_data[(global_data.index.year == y)]})
-                               
-        return y_data
-
-    # For yearly separation of the data
-    elif fold_size == '80-20':
-        # List of years in the dataset
-        years = sorted(list(set(time.year for time in list(global_data.index))))
-        # dict to store data
-        a_8 = int(len(years)*0.80) 
-        a_2 = int(len(years)*0.20)
-        # data construction
-        data_80_20 = {'h_8': global_data[global_data.index.year.isin(years[0:a_8])],
-                      'h_2': global_data[global_data.index.year.isin(years[a_8:a_8+a_2])]}
-    
-        return data_80_20
+        return 'y_' + str(edge.year)
+    elif fold_size == 'bi-year':
+        return 'b_' + str(edge.year) + '_' + str(edge.year + 1)
+
+# ---------------------------------------------------------------------------------- INFORMATION LEAKAGE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+class PurgedTFold:
+    """
+    T-Fold splitter with information leakage prevention (purge and embargo), compatible with the scikit-learn
+    cross-validation splitters. Every T-Fold from folds_formation is used once as validation, and the
+    training observations are:
+
+        - purged: removed if its label ends inside the validation T-Fold, or if it starts before the end
+          of the last label in the validation T-Fold.
+        - embargoed: removed if it is within the embargo period right after the validation T-Fold.
+
+    All the boundaries are found with searchsorted over the sorted index (or integer arithmetic for a fixed
+    horizon), and the splits are integer position arrays, so no data is copied.
+
+    Parameters
+    ----------
+
+    fold_size: str
+        'year' (Default): T-Fold size, see folds_formation
+
+    horizon: int or pd.Series
+        0 (Default): the label of every observation ends in its own period, e.g. 'co' or 'b_co' labels
+        int: number of periods ahead where every label ends, e.g. horizon for 'fwd_ret' or 'tb' labels
+        pd.Series: timestamp where the label of every observation ends, with the same index as the data
+
+    embargo: int or pd.Timedelta
+        0 (Default): number of periods after the validation T-Fold to remove from the training data
+        pd.Timedelta: time after the end of the validation T-Fold to remove from the training data
+
+    train: str
+        'all' (Default): training data from every other T-Fold, before and after the validation T-Fold
+        'past': training data only from the T-Folds before the validation T-Fold
+
+    References
+    ----------
+    [1] Lopez de Prado, M. (2018). Advances in Financial Machine Learning. Wiley. Chapter 7.
+
+    Example
+    -------
+
+    >> splitter = PurgedTFold(fold_size='year', horizon=5, embargo=10)
+    >> for train_idx, val_idx in splitter.split(global_data):
+    >>     model.fit(features.iloc[train_idx], target.iloc[train_idx])
+
+    """
+
+    def __init__(self, fold_size='year', horizon=0, embargo=0, train='all'):
+
+        if train not in ['all', 'past']:
+            raise ValueError("Accepted values for train are: 'all' or 'past'")
+
+        self.fold_size = fold_size
+        self.horizon = horizon
+        self.embargo = embargo
+        self.train = train
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        """
+        Number of splits, one for every T-Fold in X.
+
+        """
+
+        if X is None:
+            raise ValueError('X, with a DatetimeIndex, is needed to know the number of T-Folds')
+
+        return len(folds_offsets(index=_time_index(X), fold_size=self.fold_size))
+
+    def split(self, X, y=None, groups=None):
+        """
+        Generates (train, validation) integer position arrays, one pair for every T-Fold in X.
+
+        Parameters
+        ----------
+
+        X: pd.DataFrame or pd.DatetimeIndex
+            Data with a sorted DatetimeIndex, e.g. the global dataset
+
+        Returns
+        -------
+
+        r_split: generator
+            (train_idx, val_idx) np.arrays of integer positions
+
+        """
+
+        index = _time_index(X)
+        n = len(index)
+        offsets = folds_offsets(index=index, fold_size=self.fold_size)
+        label_end = self._label_end(index)
+
+        for start, stop in offsets.values():
+            val_idx = np.arange(start, stop)
+
+            # purge: first observation before the T-Fold with a label ending inside of it
+            purge_start = min(int(np.searchsorted(label_end, start, side='left')), start)
+
+            # purge and embargo: first observation after the T-Fold that can be used for training
+            if isinstance(self.embargo, (pd.Timedelta, np.timedelta64)):
+                embargo_end = index[stop - 1] + pd.Timedelta(self.embargo)
+                embargo_stop = int(index.searchsorted(embargo_end, side='right'))
+            else:
+                embargo_stop = stop + int(self.embargo)
+            train_start = min(max(int(label_end[stop - 1]) + 1, embargo_stop), n)
+
+            if self.train == 'past':
+                train_idx = np.arange(0, purge_start)
+            else:
+                train_idx = np.concatenate([np.arange(0, purge_start), np.arange(train_start, n)])
+
+            yield train_idx, val_idx
+
+    def _label_end(self, index):
+        """
+        Position of the last period in the label of every observation, made non-decreasing (a running
+        maximum) so it can be searched, which can only purge more observations, never less.
+
+        """
+
+        n = len(index)
+
+        if isinstance(self.horizon, pd.Series):
+            if not self.horizon.index.equals(index):
+                raise IndexError('The index of horizon must be exactly the same as the index of the data')
+            label_end = index.searchsorted(pd.DatetimeIndex(self.horizon), side='right') - 1
+            return np.maximum.accumulate(np.maximum(label_end, np.arange(n)))
+
+        return np.minimum(np.arange(n) + int(self.horizon), n - 1)
+
+
+def _time_index(X):
+    """
+    Sorted DatetimeIndex of X.
+
+    """
+
+    return X if isinstance(X, pd.DatetimeIndex) else X.index
@@ -12,36 +12,68 @@
 """
 
 # -- Load libraries for script
+import zlib
+import hashlib
 import numpy as np
 import pandas as pd
 import scipy.special as sps
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# -- Load other scripts
+import profiling as pf
 
 # ---------------------------------------------------------------------------------------- OHLC LABELING -- #
 # --------------------------------------------------------------------------------------------------------- #
 
-def ohlc_labeling(ohlc_data, p_label='b_co'):
+@pf.stage()
+def ohlc_labeling(ohlc_data, p_label='b_co', horizon=1, barriers=(0.01, 0.01), dtype=np.float64):
     """
     This methods offers some options to generate target variables according to the selected labeling process. The input, OHLC prices, is already time-based labelled, nevertheless, a lower granularity labeling process can be conducted. It is recomended though to use this function with higher frequency prices (by the minute or more frequent if possible).
 
     Normally, a numeric value like co = close - open will be utilized for a regression type of problem, whereas the binary classification problem can be formulated as the sign operation for co, having therefore a 1 if close > open and 0 otherwise. For numerical stability of some cost functions, it is better to have 1 and 0 instead of 1 and -1.
 
+    Every label is computed with vectorized operations over the price columns as contiguous arrays, the input data is not copied.
+
     Parameters
     ----------
 
     ohlc_data: DataFrame
-        With at least 4 numeric columns: 'open', 'high', 'low', 'close'
+        With at least 4 numeric columns: 'open', 'high', 'low', 'close', also in the compact versions of
+        data.compact_prices (float32 prices or int32 ticks)
     
     p_label: str
         An indication of the labelling function, must chose one of the following options:
             'co': close - open
             'b_co': binary version of 'co', i.e. sign[close - open], 1 if close > open, 0 otherwise
+            'hl': high - low, the range of the price within every period
+            'log_ret': log(close_t / close_t-1), NaN for the first period
+            'fwd_ret': fixed-horizon forward return, close_t+horizon / close_t - 1, NaN for the last periods
+            'b_fwd_ret': binary version of 'fwd_ret', 1 if close_t+horizon > close_t, 0 otherwise, NaN for
+                         the last periods (as dtype)
+            'tb': triple-barrier, 1 if the upper barrier close_t*(1 + barriers[0]) is touched by the high
+                  prices within the next horizon periods, -1 if the lower barrier close_t*(1 - barriers[1])
+                  is touched by the low prices first (or in the same period), 0 if none is touched
+
+    horizon: int
+        1 (Default): number of periods ahead for 'fwd_ret', 'b_fwd_ret' and 'tb' (vertical barrier), a
+        ValueError is raised if it is less than 1. With a horizon of the size of the data or more, every
+        'fwd_ret' and 'b_fwd_ret' label is NaN
+
+    barriers: tuple
+        (0.01, 0.01) (Default): (profit taking, stop loss) as a fraction of the close price, for 'tb'
+
+    dtype: np.dtype
+        np.float64 (Default): type for the numeric labels, np.float32 for a compact version
 
     Returns
     -------
 
         labels according to selected method, currently the results will be:
-            - numeric when selecting 'co'
-            - numeric and binary (1s and 0s) when selecting 'b_co'
+            - numeric (dtype) when selecting 'co', 'hl', 'log_ret' or 'fwd_ret'
+            - binary (1s and 0s, np.int8) when selecting 'b_co'
+            - binary (1s and 0s, dtype, with NaN for the last horizon periods) when selecting 'b_fwd_ret'
+            - ternary (1s, 0s and -1s, np.int8) when selecting 'tb'
 
     Example
     -------
@@ -53,25 +85,93 @@ def ohlc_labeling(ohlc_data, p_label='b_co'):
 
     """
 
-    # shallow copy of data
-    f_data = ohlc_data.copy()
-    # base calculation
-    co = f_data['close'] - f_data['open']
+    # forward looking labels need at least one period ahead
+    if p_label in ['fwd_ret', 'b_fwd_ret', 'tb'] and (int(horizon) != horizon or horizon < 1):
+        raise ValueError('horizon must be an integer greater than or equal to 1, not ' + str(horizon))
+    horizon = int(horizon)
+
+    # price columns as arrays, no copy of the data
+    close = ohlc_data['close'].to_numpy()
+    # prices as int32 ticks, see data.compact_prices (ratios of prices do not depend on it)
+    tick_size = ohlc_data.attrs.get('tick_size')
+
     # return continuous variable
     if p_label == 'co':
-        return co
+        r_label = np.subtract(close, ohlc_data['open'].to_numpy(), dtype=dtype)
+
     # return discrete-binary variable
     elif p_label == 'b_co':
-        return pd.Series([1 if i > 0 else 0 for i in list(co)], index=f_data.index)
-    
+        r_label = np.greater(close, ohlc_data['open'].to_numpy()).astype(np.int8)
+
+    # range of the period
+    elif p_label == 'hl':
+        r_label = np.subtract(ohlc_data['high'].to_numpy(), ohlc_data['low'].to_numpy(), dtype=dtype)
+
+    # logarithmic return between consecutive periods
+    elif p_label == 'log_ret':
+        r_label = np.full(len(close), np.nan, dtype=dtype)
+        r_label[1:] = np.diff(np.log(close))
+
+    # forward return at a fixed horizon, unknown (NaN) for the last horizon periods
+    elif p_label in ['fwd_ret', 'b_fwd_ret']:
+        known = max(len(close) - horizon, 0)
+        fwd_ret = np.full(len(close), np.nan, dtype=np.float64)
+        fwd_ret[:known] = close[horizon:horizon + known]/close[:known] - 1
+        if p_label == 'fwd_ret':
+            r_label = fwd_ret.astype(dtype, copy=False)
+        else:
+            r_label = np.full(len(close), np.nan, dtype=dtype)
+            r_label[:known] = np.greater(fwd_ret[:known], 0)
+
+    # first barrier touched within the horizon
+    elif p_label == 'tb':
+        r_label = _triple_barrier(high=ohlc_data['high'].to_numpy(), low=ohlc_data['low'].to_numpy(),
+                                  close=close, horizon=horizon, barriers=barriers)
+
     # raise error
     else:
-        raise ValueError("Accepted values for label are: 'co' or 'b_co' ")
+        raise ValueError("Accepted values for label are: 'co', 'b_co', 'hl', 'log_ret', 'fwd_ret', "
+                         "'b_fwd_ret' or 'tb'")
+
+    # differences of prices from ticks to prices
+    if tick_size is not None and p_label in ['co', 'hl']:
+        r_label *= tick_size
+
+    return pd.Series(r_label, index=ohlc_data.index, name=p_label)
+
+
+def _triple_barrier(high, low, close, horizon, barriers):
+    """
+    Triple-barrier labels, the next horizon high and low prices of every period are compared at once with its
+    upper and lower barriers through a (n, horizon) sliding window view.
+
+    """
+
+    n = len(close)
+
+    # prices from t+1 to t+horizon for every t, padded after the last period so no barrier is touched
+    f_high = np.lib.stride_tricks.sliding_window_view(np.concatenate([high[1:], np.full(horizon, -np.inf)]),
+                                                      horizon)[:n]
+    f_low = np.lib.stride_tricks.sliding_window_view(np.concatenate([low[1:], np.full(horizon, np.inf)]),
+                                                     horizon)[:n]
+
+    # first period touching every barrier, horizon if never touched
+    up_hit = f_high >= (close*(1 + barriers[0]))[:, None]
+    dn_hit = f_low <= (close*(1 - barriers[1]))[:, None]
+    up_first = np.where(up_hit.any(axis=1), up_hit.argmax(axis=1), horizon)
+    dn_first = np.where(dn_hit.any(axis=1), dn_hit.argmax(axis=1), horizon)
+
+    r_label = np.zeros(n, dtype=np.int8)
+    r_label[up_first < dn_first] = 1
+    r_label[(dn_first <= up_first) & (dn_first < horizon)] = -1
+
+    return r_label
 
 # -------------------------------------------------------------------------- KULLBACK-LEIBLER DIVERGENCE -- #
 # --------------------------------------------------------------------------------------------------------- #
 
-def kld(p_data, q_data, prob_dist, pq_shift=True):
+@pf.stage()
+def kld(p_data, q_data, prob_dist, pq_shift=True, bins='auto'):
     """
     Computes the divergence between two empirical adjusted probability density functions.
 
@@ -87,9 +187,16 @@ def kld(p_data, q_data, prob_dist, pq_shift=True):
     prob_dist: str
         Probability distribution - Added: to fit to empirical data
         'gamma': Generalized gamma distribution
+        'binomial': Bernoulli distribution, for binary (1s and 0s) data, e.g. 'b_co' labels
+        'categorical': Categorical distribution, for discrete data, e.g. 'tb' labels
+        'histogram': Nonparametric, histogram with the same bin edges for both processes
+        'kde': Nonparametric, gaussian kernel density estimation over the histogram bins
     
     pq_shift: bool
-        True (Default): Shifts the data in order to have only positive values. This is done by adding, to all values, the absolute of the most negative value.
+        True (Default): Shifts the data in order to have only positive values. This is done by adding, to all values, the absolute of the most negative value. Only used with 'gamma'.
+    
+    bins: int or str
+        'auto' (Default): number of bins, or a method of np.histogram_bin_edges, for 'histogram' and 'kde'
     
     Returns
     -------
@@ -111,34 +218,33 @@ def kld(p_data, q_data, prob_dist, pq_shift=True):
 
     """
 
-    # Shift data to have only positive values
-    if pq_shift:
-        q_data = (q_data + abs(min(q_data)))/max(q_data)
-        p_data = (p_data + abs(min(p_data)))/max(p_data)
-
     # -- with Gamma Distribution -- #
     # ----------------------------- #
 
     # For continuous variables
     if prob_dist == 'gamma':
-        return _kld_gamma(p_data=p_data, q_data=q_data)
+        return _kld_gamma(p_data=p_data, q_data=q_data, pq_shift=pq_shift)
 
-    # -- with Binomial Distribution -- #
-    # -------------------------------- #
+    # -- with Binomial, Categorical or Nonparametric Distributions -- #
+    # --------------------------------------------------------------- #
 
-    # For discrete variables (Pending)
+    # For discrete variables, and continuous variables without a parametric form
+    elif prob_dist in _kld_probs_dists:
+        return _kld_probs_matrix(datasets=[p_data, q_data], prob_dist=prob_dist, bins=bins)[0, 1]
 
     # -- with Other Distribution -- #
     # ----------------------------- #
 
     else:
-        return print('error')
+        raise ValueError("Accepted values for prob_dist are: 'gamma', 'binomial', 'categorical', 'histogram' "
+                         "or 'kde'")
 
-# ----------------------------------------------------------------------- KLD with generalized gamma -- #
+# --------------------------------------------------------------------------- KLD with generalized gamma -- #
 
-def _kld_gamma(p_data, q_data):
+def _kld_gamma(p_data, q_data, pq_shift=False):
     """
-    Computes the Kullback-Leibler divergence between two gamma PDFs
+    Computes the Kullback-Leibler divergence between two gamma PDFs, with the parameters from the
+    statistics of every dataset (see fold_stats)
     
     Parameters
     ----------
@@ -149,6 +255,10 @@ def _kld_gamma(p_data, q_data):
     q_data: np.array
         Data of the first process
 
+    pq_shift: bool
+        False (Default): the data is used as it is
+        True: the parameters correspond to the data shifted to have only positive values, see kld
+
     Returns
     -------
 
@@ -161,117 +271,996 @@ def _kld_gamma(p_data, q_data):
     
     """
     
-    # -------------------------------------------------------------------------- Distribution Parameters -- #
-
-    def _gamma_params(data, method='MoM'):
-        """
-        Computes the parameters of a gamma probability density function (pdf), according to the selected
-        method.
-
-        Parameters
-        ----------
-
-        data: np.array
-            The data with which will be adjusted the pdf
-        
-        method: str
-            Method to calculate the value of the parameters for the pdf
-                'MoM': Method of Moments (Default)
-
-        Returns
-        -------
-
-        r_params: dict
-            {'alpha': gamma distribution paramerter, 'beta': gamma distribution parameter}
-        
-        """
-
-        # -- Methods of Moments -- #
-        if method == 'MoM':
-
-            # first two moments
-            mean = np.mean(data)
-            variance = np.var(data)
-            # sometimes refered in literature as k
-            alpha = mean**2/variance
-            # sometimes refered in literature as 1/theta
-            beta = mean/variance
-            # return the gamma distribution empirically adjusted parameters
-            return alpha, beta
-        
-        # -- For errors or other unsupported methods
-        else:
-            raise ValueError("Currently, the supported methods are: 'MoM'")
-
     # alpha_1: Distribution 1: shape parameter, alpha_1 > 0
     # beta_1:  Distribution 1: rate or inverse scale distribution parameter, beta_1 > 0
-    alpha_1, beta_1 = _gamma_params(data=p_data)
+    alpha_1, beta_1 = _stats_gamma_params(stats=fold_stats(data=p_data), pq_shift=pq_shift)
 
     # alpha_2: Distribution 2: shape parameter, alpha_2 > 0
     # beta_2:  Distribution 2: rate or inverse scale parameter, beta_2 > 0  
-    alpha_2, beta_2 = _gamma_params(data=q_data)
+    alpha_2, beta_2 = _stats_gamma_params(stats=fold_stats(data=q_data), pq_shift=pq_shift)
+
+    # Final Kullback-Leibler Divergence for Empirically Adjusted Gamma PDFs
+    return _kld_gamma_params(alpha_1=alpha_1, beta_1=beta_1, alpha_2=alpha_2, beta_2=beta_2)
+
+
+def _kld_gamma_params(alpha_1, beta_1, alpha_2, beta_2, p_1=1, p_2=1):
+    """
+    Closed form of the Kullback-Leibler divergence between two generalized gamma PDFs given its parameters,
+    all the parameters can be numeric or np.arrays of broadcastable shapes. Every term is computed in log
+    space (sps.gammaln instead of sps.gamma), so large shape parameters (alpha > ~170) do not overflow.
 
-    # Expression with beta instead of theta
-    theta_1 = 1/beta_1
-    theta_2 = 1/beta_2
-    p1, p2 = 1, 1  # Generalized Gamma Distribution with p=1 is a gamma distribution [1]
+    """
+
+    # Expression with log(theta) instead of beta
+    log_theta_1 = -np.log(beta_1)
+    log_theta_2 = -np.log(beta_2)
     
-    # Calculations, see [1] for mathematical details.
-    a = p1*(theta_2**alpha_2)*sps.gamma(alpha_2/p2)
-    b = p2*(theta_1**alpha_1)*sps.gamma(alpha_1/p1)
-    c = (((sps.digamma(alpha_1/p1))/p1) + np.log(theta_1))*(alpha_1 - alpha_2)
+    # Calculations, see [1] for mathematical details: log(a/b) with a = p1*theta_2**alpha_2*gamma(alpha_2/p2)
+    # and b = p2*theta_1**alpha_1*gamma(alpha_1/p1)
+    log_ab = (np.log(p_1) - np.log(p_2) + alpha_2*log_theta_2 + sps.gammaln(alpha_2/p_2)
+              - alpha_1*log_theta_1 - sps.gammaln(alpha_1/p_1))
+    c = ((sps.digamma(alpha_1/p_1))/p_1 + log_theta_1)*(alpha_1 - alpha_2)
     
-    # Bi-gamma functions
-    d = sps.gamma((alpha_1+p2)/p1)
-    e = sps.gamma((alpha_1/p1))
+    # Bi-gamma functions ratio, gamma(x + 1)/gamma(x) = x for the gamma distribution (p1 = p2 = 1)
+    if np.all(np.asarray(p_1) == 1) and np.all(np.asarray(p_2) == 1):
+        log_de = np.log(alpha_1)
+    else:
+        log_de = sps.gammaln((alpha_1 + p_2)/p_1) - sps.gammaln(alpha_1/p_1)
     
-    # Calculations
-    f = (theta_1/theta_2)**(p2)
-    g = alpha_1/p1
+    # Calculations: (d/e)*f, with f = (theta_1/theta_2)**p2
+    def_ = np.exp(log_de + p_2*(log_theta_1 - log_theta_2))
+    g = alpha_1/p_1
     
     # General calculation and output
-    r_kld = np.log(a/b) + c + (d/e)*f - g  
+    r_kld = log_ab + c + def_ - g
 
-    # Final Kullback-Leibler Divergence for Empirically Adjusted Gamma PDFs
     return r_kld
 
+
+def kld_gamma(p_params, q_params, p_1=1, p_2=1):
+    """
+    Batched Kullback-Leibler divergence between generalized gamma PDFs given its parameters, for use inside
+    matrix or rolling computations where the parameters are already known.
+
+    Parameters
+    ----------
+
+    p_params: np.array
+        (alpha, beta) pairs of the first process, with shape (2,) or (n, 2)
+
+    q_params: np.array
+        (alpha, beta) pairs of the second process, with shape (2,) or (n, 2), broadcastable to p_params
+
+    p_1: numeric
+        1 (Default): power parameter of the first generalized gamma, p = 1 is a gamma distribution
+
+    p_2: numeric
+        1 (Default): power parameter of the second generalized gamma, p = 1 is a gamma distribution
+
+    Returns
+    -------
+
+    r_kld_gamma: np.array
+        Kullback-Leibler Divergence for every pair of parameters
+
+    References
+    ----------
+    [1] Bauckhage, Christian. (2014). Computing the Kullback-Leibler Divergence between two Generalized Gamma Distributions. arXiv. 1401.6853. 
+
+    Example
+    -------
+
+    >>> p_params = np.array([[2.0, 1.0], [250.0, 30.0]])
+    >>> q_params = np.array([[1.0, 0.5], [240.0, 29.0]])
+    >>> kld_gamma(p_params=p_params, q_params=q_params)
+
+    """
+
+    p_params = np.asarray(p_params, dtype=np.float64)
+    q_params = np.asarray(q_params, dtype=np.float64)
+
+    if p_params.shape[-1] != 2 or q_params.shape[-1] != 2:
+        raise ValueError('The parameters must be (alpha, beta) pairs, with shape (2,) or (n, 2)')
+
+    return _kld_gamma_params(alpha_1=p_params[..., 0], beta_1=p_params[..., 1],
+                             alpha_2=q_params[..., 0], beta_2=q_params[..., 1], p_1=p_1, p_2=p_2)
+
+# ------------------------------------------------------------------------------ Distribution Parameters -- #
+
+def _gamma_params(data, method='MoM'):
+    """
+    Computes the parameters of a gamma probability density function (pdf), according to the selected
+    method.
+
+    Parameters
+    ----------
+
+    data: np.array
+        The data with which will be adjusted the pdf
+    
+    method: str
+        Method to calculate the value of the parameters for the pdf
+            'MoM': Method of Moments (Default)
+
+    Returns
+    -------
+
+    r_params: tuple
+        (alpha, beta): gamma distribution shape and rate parameters
+    
+    """
+
+    # -- Methods of Moments -- #
+    if method == 'MoM':
+
+        # first two moments
+        mean = np.mean(data)
+        variance = np.var(data)
+        # sometimes refered in literature as k
+        alpha = mean**2/variance
+        # sometimes refered in literature as 1/theta
+        beta = mean/variance
+        # return the gamma distribution empirically adjusted parameters
+        return alpha, beta
+    
+    # -- For errors or other unsupported methods
+    else:
+        raise ValueError("Currently, the supported methods are: 'MoM'")
+
+
+def _pq_shift(data):
+    """
+    Shifts the data to have only positive values, adding the absolute of the most negative value, and scales
+    it by its maximum, as in kld.
+
+    """
+
+    data = np.asarray(data, dtype=np.float64)
+
+    return (data + abs(np.min(data)))/np.max(data)
+
+# ------------------------------------------------------------------------------------------- KLD MATRIX -- #
+
+@pf.stage()
+def kld_matrix(folds, prob_dist='gamma', pq_shift=True, bins='auto'):
+    """
+    Computes the Kullback-Leibler divergence for all the combinations of Folds (Information Tensor). The
+    distribution parameters of every Fold are computed once, and the divergences of all the pairs are
+    evaluated at once over the arrays of parameters.
+
+    Parameters
+    ----------
+
+    folds: dict
+        {fold_label: data} with the data (e.g. the target variable) of every Fold, as the output of
+        folds_formation followed by ohlc_labeling
+
+    prob_dist: str
+        Probability distribution, see kld: 'gamma', 'binomial', 'categorical', 'histogram' or 'kde'. For the
+        nonparametric ones, the bin edges (or categories) are computed once with the data of all the Folds
+
+    pq_shift: bool
+        True (Default): Shifts the data of every Fold in order to have only positive values, see kld
+
+    bins: int or str
+        'auto' (Default): number of bins, or a method of np.histogram_bin_edges, for 'histogram' and 'kde'
+
+    Returns
+    -------
+
+    r_kld_matrix: pd.DataFrame
+        N x N divergences with fold labels as index and columns, the value in [p, q] is kld(p_data=folds[p],
+        q_data=folds[q])
+
+    Example
+    -------
+
+    >> targets = {label: ohlc_labeling(ohlc_data=folds_data[label], p_label='co') for label in folds_data}
+    >> information_tensor = kld_matrix(folds=targets, prob_dist='gamma')
+
+    """
+
+    labels = list(folds.keys())
+
+    # -- with Gamma Distribution -- #
+    # ----------------------------- #
+
+    if prob_dist == 'gamma':
+        # distribution parameters, once per fold, from its cached statistics
+        params = np.array([fold_gamma_params(data=folds[label], label=label, pq_shift=pq_shift)
+                           for label in labels], dtype=np.float64).reshape(len(labels), 2)
+        alpha, beta = params[:, 0], params[:, 1]
+        # p in rows, q in columns
+        r_kld = _kld_gamma_params(alpha_1=alpha[:, None], beta_1=beta[:, None],
+                                  alpha_2=alpha[None, :], beta_2=beta[None, :])
+
+    # -- with Binomial, Categorical or Nonparametric Distributions -- #
+    # --------------------------------------------------------------- #
+
+    elif prob_dist in _kld_probs_dists:
+        r_kld = _kld_probs_matrix(datasets=[folds[label] for label in labels], prob_dist=prob_dist, bins=bins,
+                                  labels=labels)
+
+    # -- with Other Distribution -- #
+    # ----------------------------- #
+
+    else:
+        raise ValueError("Accepted values for prob_dist are: 'gamma', 'binomial', 'categorical', 'histogram' "
+                         "or 'kde'")
+
+    return pd.DataFrame(r_kld, index=labels, columns=labels)
+
+# --------------------------------------------------------------------- KLD with discrete and histograms -- #
+
+# -- Distributions estimated as probabilities over categories or bins
+_kld_probs_dists = ['binomial', 'categorical', 'histogram', 'kde']
+
+# -- Pseudo-count added to every category or bin, so no probability is zero (Jeffreys prior)
+_kld_pseudo_count = 0.5
+
+
+def _kld_probs_matrix(datasets, prob_dist, bins='auto', labels=None):
+    """
+    Kullback-Leibler divergence between every pair of datasets, with its probabilities estimated over the
+    same categories (discrete data) or bin edges (continuous data), computed once with all the datasets.
+
+    """
+
+    probs = _probs(datasets=datasets, prob_dist=prob_dist, bins=bins, labels=labels)
+
+    # sum over the categories of p*log(p/q), for p in rows and q in columns
+    log_probs = np.log(probs)
+    r_kld = np.einsum('ik,ik->i', probs, log_probs)[:, None] - probs @ log_probs.T
+
+    return r_kld
+
+
+def _probs(datasets, prob_dist, bins='auto', labels=None):
+    """
+    (n_datasets, n_categories) probabilities of every dataset. Binomial counts and histograms come from the
+    cached statistics of every dataset (see fold_stats), the ones not cached yet are counted with a single
+    np.bincount over the category (or bin) of every value and the dataset it belongs to.
+
+    """
+
+    labels = [None]*len(datasets) if labels is None else list(labels)
+    arrays = [_as_values(data) for data in datasets]
+    stats = [fold_stats(data=array, label=label) for array, label in zip(arrays, labels)]
+
+    # -- Binomial, from the count and sum of every dataset
+    if prob_dist == 'binomial':
+        # only 1s and 0s: values within [0, 1] and x**2 == x for all of them
+        if not all(stat['min'] >= 0 and stat['max'] <= 1 and stat['sum_sq'] == stat['sum'] for stat in stats):
+            raise ValueError("Data for 'binomial' must be binary (1s and 0s)")
+        counts = np.array([[stat['count'] - stat['sum'], stat['sum']] for stat in stats], dtype=np.float64)
+
+    # -- Categorical, with the categories of all the datasets
+    elif prob_dist == 'categorical':
+        categories, codes = np.unique(np.concatenate(arrays), return_inverse=True)
+        counts = _bincount_datasets(codes=codes.ravel(), lengths=[len(array) for array in arrays],
+                                    n_codes=len(categories))
+
+    # -- Histograms, with the same bin edges for all the datasets
+    else:
+        if isinstance(bins, (int, np.integer)):
+            # from the cached minimum and maximum, without a pass over the data
+            edges = np.linspace(min(stat['min'] for stat in stats), max(stat['max'] for stat in stats),
+                                bins + 1)
+        else:
+            edges = np.histogram_bin_edges(np.concatenate(arrays), bins=bins)
+        e_key = _fingerprint(edges)
+
+        missing = [i for i, stat in enumerate(stats) if e_key not in stat['hist']]
+        if len(missing) > 0:
+            codes = _bin_codes(values=np.concatenate([arrays[i] for i in missing]), edges=edges)
+            m_counts = _bincount_datasets(codes=codes, lengths=[len(arrays[i]) for i in missing],
+                                          n_codes=len(edges) - 1)
+            for i, m_count in zip(missing, m_counts):
+                stats[i]['hist'][e_key] = m_count
+
+        counts = np.array([stat['hist'][e_key] for stat in stats], dtype=np.float64)
+
+        # -- Gaussian kernel over the bins, with the bandwidth of the Scott's rule
+        if prob_dist == 'kde':
+            counts = _kde_smooth(counts=counts, stats=stats, bin_width=edges[1] - edges[0])
+
+    counts = counts + _kld_pseudo_count
+
+    return counts/counts.sum(axis=1, keepdims=True)
+
+
+def _bincount_datasets(codes, lengths, n_codes):
+    """
+    (n_datasets, n_codes) counts of the codes of consecutive datasets with the given lengths.
+
+    """
+
+    dataset_id = np.repeat(np.arange(len(lengths)), lengths)
+    counts = np.bincount(dataset_id*n_codes + codes, minlength=len(lengths)*n_codes)
+
+    return counts.reshape(len(lengths), n_codes).astype(np.float64)
+
+
+def _bin_codes(values, edges):
+    """
+    Bin of every value, the last bin includes its right edge (as in np.histogram).
+
+    """
+
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+
+
+def _kde_smooth(counts, stats, bin_width):
+    """
+    Binned gaussian kernel density estimation: the histogram counts of every dataset convolved with a
+    gaussian kernel, with the Scott's rule bandwidth of every dataset, in units of bins.
+
+    """
+
+    n_bins = counts.shape[1]
+    offsets = np.arange(-(n_bins - 1), n_bins)
+    r_counts = np.empty_like(counts)
+
+    for i, stat in enumerate(stats):
+        std = np.sqrt(stat['m2']/stat['count'])
+        bandwidth = max(std*stat['count']**(-1/5)/bin_width, 1e-12)
+        kernel = np.exp(-0.5*(offsets/bandwidth)**2)
+        # centered part of the full convolution, one value per bin
+        r_counts[i] = np.convolve(counts[i], kernel/kernel.sum())[n_bins - 1:2*n_bins - 1]
+
+    return r_counts
+
+# -------------------------------------------------------------------------------------- FOLD STATISTICS -- #
+
+# -- Statistics of every fold, {(label, length, checksum of its values): stats}, from the least to the most
+# -- recently used
+_fold_stats_cache = OrderedDict()
+
+# -- Maximum number of folds in the cache
+_fold_stats_size = 1024
+
+
+@pf.stage()
+def fold_stats(data, label=None):
+    """
+    Sufficient statistics of the data of a Fold, cached by Fold label and a CRC-32 checksum of all its values,
+    so the same Fold compared against many others (e.g. in kld_matrix, or in pairwise calls of kld) is only
+    summarized once, and any change of its values (another target, appended bars or a value changed in
+    place) computes them again. The least recently used entries are evicted beyond _fold_stats_size Folds.
+
+    Parameters
+    ----------
+
+    data: np.array or pd.Series
+        Data of the Fold, e.g. its target variable, non-finite values (e.g. the NaN edges of the 'log_ret' or
+        'fwd_ret' labels) are not taken into account
+
+    label: str
+        None (Default): the statistics are cached by the values only
+        str: Fold label, part of the key of the cache, see fold_stats_invalidate
+
+    Returns
+    -------
+
+    r_stats: dict
+        {'count', 'sum', 'sum_sq' (sum of squares), 'm2' (sum of squared deviations from the mean), 'min',
+         'max', 'hist': {edges fingerprint: counts}}, the histograms are added by kld with 'histogram' or
+         'kde' distributions
+
+    """
+
+    values = _as_values(data)
+    key = (label, len(values), zlib.crc32(values))
+
+    r_stats = _fold_stats_cache.get(key)
+    if r_stats is not None:
+        _fold_stats_cache.move_to_end(key)
+        return r_stats
+
+    count = len(values)
+    total = float(np.sum(values))
+    r_stats = {'count': count, 'sum': total, 'sum_sq': float(np.dot(values, values)),
+               'm2': float(np.sum((values - total/count)**2)) if count > 0 else 0.0,
+               'min': float(np.min(values)) if count > 0 else np.nan,
+               'max': float(np.max(values)) if count > 0 else np.nan, 'hist': {}}
+
+    _fold_stats_cache[key] = r_stats
+    while len(_fold_stats_cache) > _fold_stats_size:
+        _fold_stats_cache.popitem(last=False)
+
+    return r_stats
+
+
+def fold_stats_invalidate(label=None):
+    """
+    Removes cached Fold statistics.
+
+    Parameters
+    ----------
+
+    label: str
+        None (Default): the statistics of every Fold are removed
+        str: only the statistics of the Folds with this label are removed
+
+    Returns
+    -------
+
+    r_removed: int
+        Number of removed entries
+
+    """
+
+    keys = [key for key in _fold_stats_cache if label is None or key[0] == label]
+    for key in keys:
+        del _fold_stats_cache[key]
+
+    return len(keys)
+
+
+def fold_gamma_params(data, label=None, pq_shift=True):
+    """
+    Method of Moments gamma parameters of the data of a Fold, from its cached statistics (see fold_stats), as
+    used by kld and kld_matrix, e.g. for kld_gamma. A ValueError is raised for a Fold with zero variance.
+
+    Parameters
+    ----------
+
+    data: np.array or pd.Series
+        Data of the Fold, e.g. its target variable
+
+    label: str
+        None (Default): Fold label, see fold_stats
+
+    pq_shift: bool
+        True (Default): parameters of the data shifted to have only positive values, see kld
+
+    Returns
+    -------
+
+    r_params: tuple
+        (alpha, beta): gamma distribution shape and rate parameters
+
+    """
+
+    return _stats_gamma_params(stats=fold_stats(data=data, label=label), pq_shift=pq_shift)
+
+
+def _stats_gamma_params(stats, pq_shift=True):
+    """
+    Method of Moments gamma parameters from the statistics of a Fold. The shift of _pq_shift is applied
+    through its effect on the moments: mean' = (mean + |min|)/max and variance' = variance/max**2.
+
+    """
+
+    if stats['count'] == 0 or stats['m2'] <= 0 or (pq_shift and stats['max'] == 0):
+        raise ValueError('The gamma parameters are not defined for a Fold with less than two different '
+                         'values (zero variance), e.g. a Fold of constant or filled prices')
+
+    mean = stats['sum']/stats['count']
+    variance = stats['m2']/stats['count']
+
+    if pq_shift:
+        mean = (mean + abs(stats['min']))/stats['max']
+        variance = variance/stats['max']**2
+
+    return mean**2/variance, mean/variance
+
+
+def _as_values(data):
+    """
+    Finite values of data as a contiguous 1D float64 array (not copied when it already is one without NaN),
+    e.g. without the unknown first 'log_ret' or last 'fwd_ret' labels.
+
+    """
+
+    r_values = np.ascontiguousarray(np.asarray(data, dtype=np.float64)).ravel()
+    finite = np.isfinite(r_values)
+
+    return r_values if finite.all() else r_values[finite]
+
+
+def _fingerprint(values):
+    """
+    Hash of the values of a contiguous array.
+
+    """
+
+    return hashlib.blake2b(values, digest_size=16).hexdigest()
+
+# ---------------------------------------------------------------------------------- SPARSITY ASSESSMENT -- #
+
+@pf.stage()
+def sparsity_assessment(kld_data, threshold=None, thresholds=None, symmetric='max'):
+    """
+    Classifies the Information Tensor (the KLD of all the combinations of Folds) as Sparse, Weakly Sparse or
+    Non-Sparse for an Information Threshold: two Folds share information when its divergence is below the
+    threshold, and the Folds connected this way form clusters.
+
+        - 'Non-Sparse': all the Folds are in a single cluster
+        - 'Weakly Sparse': more than one cluster, at least one with more than one Fold
+        - 'Sparse': every Fold is its own cluster
+
+    The divergences are sorted once, and every candidate threshold is evaluated with cumulative counts over
+    them (the number of clusters after adding the pairs in sorted order is computed once, with a union-find),
+    so the sweep does not re-scan the tensor or recompute any KLD for every candidate.
+
+    Parameters
+    ----------
+
+    kld_data: pd.DataFrame
+        N x N KLD between Folds, as returned by kld_matrix, an undefined (NaN) divergence of a pair is left
+        out, so the pair never shares information
+
+    threshold: float
+        None (Default): the threshold is placed in the (geometric) middle of the largest relative gap
+                        between the sorted divergences (natural break)
+        float: Information Threshold
+
+    thresholds: array
+        None (Default): every divergence between Folds is a candidate
+        array: candidate thresholds for the sweep
+
+    symmetric: str
+        'max' (Default): divergence of a pair as the maximum of KLD(p, q) and KLD(q, p)
+        'mean': divergence of a pair as the mean of KLD(p, q) and KLD(q, p)
+
+    Returns
+    -------
+
+    r_assessment: dict
+        {'threshold': float, 'class': str, 'clusters': {fold: cluster}, 'sweep': pd.DataFrame with
+         'threshold', 'density' (fraction of pairs below it), 'n_clusters' and 'class' for every candidate}
+
+    Example
+    -------
+
+    >> information_tensor = kld_matrix(folds=targets, prob_dist='gamma')
+    >> assessment = sparsity_assessment(kld_data=information_tensor)
+
+    """
+
+    labels = list(kld_data.index)
+    values = kld_data.to_numpy(dtype=np.float64)
+    n = len(labels)
+
+    # -- Divergence of every pair of Folds, sorted once
+    if symmetric == 'max':
+        pairs = np.maximum(values, values.T)
+    elif symmetric == 'mean':
+        pairs = (values + values.T)/2
+    else:
+        raise ValueError("Accepted values for symmetric are: 'max' or 'mean'")
+
+    # undefined divergences (NaN) do not join its Folds for any threshold
+    i_idx, j_idx = np.triu_indices(n, k=1)
+    p_values = pairs[i_idx, j_idx]
+    n_pairs = len(p_values)
+    defined = ~np.isnan(p_values)
+    i_idx, j_idx, p_values = i_idx[defined], j_idx[defined], p_values[defined]
+    order = np.argsort(p_values, kind='stable')
+    p_sorted, i_sorted, j_sorted = p_values[order], i_idx[order], j_idx[order]
+
+    # -- Number of clusters after adding the first k pairs, k = 0 .. n_pairs
+    n_clusters = np.empty(len(p_sorted) + 1, dtype=np.int64)
+    n_clusters[0] = n
+    parent = np.arange(n)
+    for k in range(0, len(p_sorted)):
+        n_clusters[k + 1] = n_clusters[k] - _union(parent, i_sorted[k], j_sorted[k])
+
+    # -- Threshold
+    if threshold is None:
+        if len(p_sorted) > 1:
+            # largest relative gap, in log scale, and its geometric middle
+            log_sorted = np.log(np.maximum(p_sorted, 1e-12))
+            gap = int(np.argmax(np.diff(log_sorted)))
+            threshold = float(np.exp((log_sorted[gap] + log_sorted[gap + 1])/2))
+        else:
+            threshold = float(p_sorted[0]) if len(p_sorted) > 0 else 0.0
+    elif np.isnan(threshold):
+        raise ValueError('The threshold must be a number, not NaN')
+
+    # -- Sweep over the candidate thresholds, with cumulative counts over the sorted pairs
+    if thresholds is None:
+        thresholds = np.unique(p_sorted)
+    thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+    k_below = np.searchsorted(p_sorted, thresholds, side='right')
+    sweep = pd.DataFrame({'threshold': thresholds,
+                          'density': k_below/max(n_pairs, 1),
+                          'n_clusters': n_clusters[k_below]})
+    sweep['class'] = [_sparsity_class(n_c, n) for n_c in sweep['n_clusters']]
+
+    # -- Clusters for the threshold
+    k = int(np.searchsorted(p_sorted, threshold, side='right'))
+    parent = np.arange(n)
+    for i, j in zip(i_sorted[:k], j_sorted[:k]):
+        _union(parent, i, j)
+    roots = [_find(parent, i) for i in range(0, n)]
+    cluster_ids = {root: c_id for c_id, root in enumerate(dict.fromkeys(roots))}
+
+    return {'threshold': threshold, 'class': _sparsity_class(int(n_clusters[k]), n),
+            'clusters': {label: cluster_ids[root] for label, root in zip(labels, roots)}, 'sweep': sweep}
+
+
+def _sparsity_class(n_clusters, n_folds):
+    """
+    Class of the Information Tensor from its number of clusters.
+
+    """
+
+    if n_clusters == 1:
+        return 'Non-Sparse'
+    elif n_clusters == n_folds:
+        return 'Sparse'
+    else:
+        return 'Weakly Sparse'
+
+
+def _find(parent, i):
+    """
+    Root of i in a union-find, with path halving.
+
+    """
+
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+
+    return i
+
+
+def _union(parent, i, j):
+    """
+    Joins the sets of i and j in a union-find, 1 if they were different sets, 0 otherwise.
+
+    """
+
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    if root_i == root_j:
+        return 0
+
+    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return 1
+
+# ------------------------------------------------------------------------------------------ ROLLING KLD -- #
+
+@pf.stage()
+def rolling_kld(target_data, window, ref_window=None, prob_dist='gamma', pq_shift=True):
+    """
+    Kullback-Leibler divergence between a sliding current window and the reference window right before it,
+    for every timestamp of a target variable (e.g. from ohlc_labeling), to monitor the drift of its
+    distribution on live bars. The moments of both windows are updated online when a value enters or leaves
+    the window (pandas rolling mean and variance), so the whole series is scanned in one linear pass
+    instead of recomputing the moments for every window.
+
+    Parameters
+    ----------
+
+    target_data: pd.Series
+        Target variable, timestamp-indexed
+
+    window: int
+        Number of observations in the current window
+
+    ref_window: int
+        None (Default): same size as window
+        int: number of observations in the reference window, which ends where the current window starts
+
+    prob_dist: str
+        Probability distribution - Added: to fit to empirical data
+        'gamma': Generalized gamma distribution
+
+    pq_shift: bool
+        True (Default): Shifts the data of every window in order to have only positive values, see kld
+
+    Returns
+    -------
+
+    r_rolling_kld: pd.Series
+        kld(p_data=reference window, q_data=current window) at every timestamp, NaN until both windows are
+        complete
+
+    Example
+    -------
+
+    >> target = ohlc_labeling(ohlc_data=global_data, p_label='co')
+    >> kld_drift = rolling_kld(target_data=target, window=90, ref_window=360)
+
+    """
+
+    if prob_dist != 'gamma':
+        raise ValueError("Currently, the supported distributions are: 'gamma'")
+
+    ref_window = window if ref_window is None else ref_window
+    data = pd.Series(np.asarray(target_data, dtype=np.float64), index=getattr(target_data, 'index', None))
+
+    # -- Current window moments, online add/remove
+    q_params = _rolling_gamma_params(data=data, window=window, pq_shift=pq_shift)
+
+    # -- Reference window moments, ending where the current window starts
+    p_params = _rolling_gamma_params(data=data, window=ref_window, pq_shift=pq_shift).shift(window)
+
+    r_kld = _kld_gamma_params(alpha_1=p_params['alpha'].to_numpy(), beta_1=p_params['beta'].to_numpy(),
+                              alpha_2=q_params['alpha'].to_numpy(), beta_2=q_params['beta'].to_numpy())
+
+    return pd.Series(r_kld, index=data.index, name='kld')
+
+
+def _rolling_gamma_params(data, window, pq_shift=True):
+    """
+    Method of Moments gamma parameters for every rolling window of data, with the same shift as _pq_shift
+    applied through its effect on the moments: mean' = (mean + |min|)/max and variance' = variance/max**2.
+
+    """
+
+    rolling = data.rolling(window=window, min_periods=window)
+    mean = rolling.mean()
+    variance = rolling.var(ddof=0)
+
+    if pq_shift:
+        r_max = rolling.max()
+        mean = (mean + rolling.min().abs())/r_max
+        variance = variance/r_max**2
+
+    return pd.DataFrame({'alpha': mean**2/variance, 'beta': mean/variance})
+
+# ----------------------------------------------------------------------------- KLD CONFIDENCE INTERVALS -- #
+
+# -- Maximum number of resampled values (replicates x values) per shard of the bootstrap, ~128MB of indexes
+_boot_shard_values = 2**24
+
+
+@pf.stage()
+def kld_bootstrap(folds, n_boot=1000, block_size=None, alpha=0.05, prob_dist='gamma', pq_shift=True,
+                  random_state=None, workers=1):
+    """
+    Bootstrap confidence intervals for the KLD of all the combinations of Folds. The data of every Fold is
+    resampled n_boot times at once, as a (n_boot x n) matrix of indexes, and the Method of Moments gamma
+    parameters of every replicate are computed along its axis, so there is no loop over the replicates. With
+    a block_size, contiguous blocks of values are resampled (moving block bootstrap) to keep the serial
+    dependence of the data within the blocks.
+
+    The replicates of every Fold are drawn in shards of a fixed size, each with its own generator seeded from
+    random_state, so the result only depends on random_state and not on the number of workers, and every
+    shard only receives the data of its Fold.
+
+    With pq_shift, every replicate is shifted with the minimum and maximum of the whole Fold, as the point
+    estimate, so the intervals measure the sampling variability of the KLD and not of the shift.
+
+    Parameters
+    ----------
+
+    folds: dict
+        {fold_label: data} with the data (e.g. the target variable) of every Fold, see kld_matrix
+
+    n_boot: int
+        1000 (Default): number of bootstrap replicates
+
+    block_size: int
+        None (Default): resample single values (i.i.d. bootstrap)
+        int: length of the blocks for a moving block bootstrap
+
+    alpha: float
+        0.05 (Default): the confidence intervals are the alpha/2 and 1 - alpha/2 quantiles of the replicates
+
+    prob_dist: str
+        'gamma' (Default): probability distribution for the KLD
+
+    pq_shift: bool
+        True (Default): Shifts the data of every Fold in order to have only positive values, see kld
+
+    random_state: int or np.random.Generator
+        None (Default): seed or generator for the resamples
+
+    workers: int
+        1 (Default): number of worker processes for the shards of replicates
+
+    Returns
+    -------
+
+    r_bootstrap: dict
+        {'kld': point estimates, 'std': standard errors, 'lower', 'upper': confidence intervals}, every one
+        as a N x N pd.DataFrame with fold labels as index and columns, as in kld_matrix
+
+    Example
+    -------
+
+    >> targets = {label: ohlc_labeling(ohlc_data=folds_data[label], p_label='co') for label in folds_data}
+    >> ci = kld_bootstrap(folds=targets, n_boot=2000, block_size=5, random_state=123)
+    >> sparsity = sparsity_assessment(kld_data=ci['lower'])
+
+    """
+
+    if prob_dist != 'gamma':
+        raise ValueError("Currently, the supported distributions are: 'gamma'")
+
+    labels = list(folds.keys())
+    datasets = [_as_values(folds[label]) for label in labels]
+    short = [str(label) for label, values in zip(labels, datasets) if len(values) < 2]
+    if len(short) > 0:
+        raise ValueError('Every Fold needs at least 2 values, these do not: ' + ', '.join(short))
+
+    # -- Shards of replicates of every Fold, with its own seeds
+    rng = np.random.default_rng(random_state)
+    tasks = []
+    for values in datasets:
+        shift = (abs(float(values.min())), float(values.max())) if pq_shift else None
+        shard_size = max(1, min(n_boot, _boot_shard_values//len(values)))
+        sizes = [min(shard_size, n_boot - start) for start in range(0, n_boot, shard_size)]
+        seeds = rng.integers(0, 2**63, size=len(sizes)).tolist()
+        tasks += [(values, size, block_size, shift, seed) for size, seed in zip(sizes, seeds)]
+
+    if workers <= 1 or len(tasks) < 2:
+        shards = [_boot_params(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            shards = list(executor.map(_boot_task, tasks))
+
+    # (folds, replicates) gamma parameters, the shards are in the order of the Folds
+    b_alpha = np.concatenate([shard[0] for shard in shards]).reshape(len(labels), n_boot)
+    b_beta = np.concatenate([shard[1] for shard in shards]).reshape(len(labels), n_boot)
+
+    # (p, q, replicates) divergences
+    b_kld = _kld_gamma_params(alpha_1=b_alpha[:, None, :], beta_1=b_beta[:, None, :],
+                              alpha_2=b_alpha[None, :, :], beta_2=b_beta[None, :, :])
+    lower, upper = np.nanquantile(b_kld, [alpha/2, 1 - alpha/2], axis=2)
+
+    def _frame(values):
+        return pd.DataFrame(values, index=labels, columns=labels)
+
+    return {'kld': kld_matrix(folds=folds, prob_dist=prob_dist, pq_shift=pq_shift),
+            'std': _frame(np.nanstd(b_kld, axis=2)), 'lower': _frame(lower), 'upper': _frame(upper)}
+
+
+def _boot_params(values, n_boot, block_size, shift, seed):
+    """
+    Method of Moments gamma parameters of n_boot resamples of the values of a Fold, as n_boot arrays, with
+    shift = (|min|, max) of the Fold for _pq_shift, or None.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    n = len(values)
+
+    # (n_boot, n) indexes of the resamples
+    if block_size is None or block_size <= 1:
+        indexes = rng.integers(0, n, size=(n_boot, n))
+    else:
+        length = min(block_size, n)
+        n_blocks = -(-n//length)
+        starts = rng.integers(0, n - length + 1, size=(n_boot, n_blocks))
+        indexes = (starts[:, :, None] + np.arange(length)).reshape(n_boot, n_blocks*length)[:, :n]
+
+    samples = values[indexes]
+    mean = samples.mean(axis=1)
+    variance = samples.var(axis=1)
+
+    if shift is not None:
+        mean = (mean + shift[0])/shift[1]
+        variance = variance/shift[1]**2
+
+    return mean**2/variance, mean/variance
+
+
+def _boot_task(task):
+    """
+    Worker process: gamma parameters of one shard of replicates.
+
+    """
+
+    return _boot_params(*task)
+
 # ----------------------------------------------------------------------------- OHLC FEATURE ENGINEERING -- #
 # --------------------------------------------------------------------------------------------------------- #
 
-def ohlc_features(ohlc_data, target_data):
+@pf.stage()
+def ohlc_features(ohlc_data, target_data, fold_offsets=None, lags=(1, 2, 3), windows=(5, 10, 20),
+                  horizon_shift=0):
     """
     Feature engineering for OHLC prices. A time check is performed to make sure the targets have exactly the same timestamps as the OHLC data.
-    
+
+    The features are computed once over the whole global dataset with vectorized operations, and then sliced
+    for every Fold by its positional offsets, so the warm-up of lags and rolling windows is not repeated (and
+    the data not copied) for every Fold. Every feature in the period t uses only prices up to t-1: the target
+    of the period t - k is known at t - k + horizon_shift, so its lags and rolling windows are shifted by
+    horizon_shift periods more for the forward looking labels ('fwd_ret', 'b_fwd_ret', 'tb').
     
     Parameters
     ----------
 
-    ohlc_data: dict
-        Dictionary with the OHLC data for every fold
+    ohlc_data: DataFrame
+        Global dataset with at least 4 numeric columns: 'open', 'high', 'low', 'close', the price features of
+        int32 prices are scaled by ohlc_data.attrs['tick_size'] (see data.compact_prices)
+
+    target_data: pd.Series
+        Target variable for the global dataset, e.g. from ohlc_labeling
+
+    fold_offsets: dict
+        None (Default): the features for the global dataset are returned
+        dict: {fold_label: (start, stop)} as returned by folds_formation with output='offsets'
 
-    target_data: dict
-        Dictionary with the target variables for every fold
+    lags: tuple
+        (1, 2, 3) (Default): lags of the target variable for the autoregressive features
+
+    windows: tuple
+        (5, 10, 20) (Default): sizes of the rolling windows for the mean and standard deviation features
+
+    horizon_shift: int
+        0 (Default): periods after t used by the target of t, e.g. the horizon of 'fwd_ret', see
+        label_horizon()
+
+    Returns
+    -------
+
+    r_features: DataFrame or dict
+        Features for the global dataset, or {fold_label: features} when fold_offsets is provided
+
+    Example
+    -------
+
+    >> fold_offsets = folds_formation(global_data=global_data, fold_size='year', output='offsets')
+    >> target = ohlc_labeling(ohlc_data=global_data, p_label='co')
+    >> features = ohlc_features(ohlc_data=global_data, target_data=target, fold_offsets=fold_offsets)
 
     """
 
-    # -- For every Fold check form the same timestamp-based index between targets and ohlc
-    
-    # elements to iterate
-    l_target = list(target_data.keys())
-    l_ohlc = list(ohlc_data.keys())
+    # -- Exactly the same timestamp-based index for both ohlc and target data
+    if not ohlc_data.index.equals(target_data.index):
+        raise IndexError('The index in both target and ohlc data must be exactly the same')
+
+    o_open, o_high = ohlc_data['open'].to_numpy(), ohlc_data['high'].to_numpy()
+    o_low, o_close = ohlc_data['low'].to_numpy(), ohlc_data['close'].to_numpy()
+    target = pd.Series(np.asarray(target_data, dtype=np.float64), index=ohlc_data.index)
+
+    # -- Create linear features, in prices for prices in ticks
+    tick_size = ohlc_data.attrs.get('tick_size')
+    linear = pd.DataFrame({'co': o_close - o_open, 'hl': o_high - o_low, 'ho': o_high - o_open,
+                           'ol': o_open - o_low}, index=ohlc_data.index)
+    if tick_size is not None:
+        linear = linear*tick_size
+    features = [linear.shift(1)]
+
+    # -- Create autoregressive features, with the targets already known in t-1
+    features.append(pd.DataFrame({'lag_' + str(lag): target.shift(lag + horizon_shift) for lag in lags}))
+
+    # -- Create rolling window features, over the previous periods
+    p_target = target.shift(1 + horizon_shift)
+    p_hl = features[0]['hl']
+    rolling = {}
+    for window in windows:
+        rolling['ma_' + str(window)] = p_target.rolling(window=window, min_periods=window).mean()
+        rolling['sd_' + str(window)] = p_target.rolling(window=window, min_periods=window).std()
+        rolling['hl_ma_' + str(window)] = p_hl.rolling(window=window, min_periods=window).mean()
+    features.append(pd.DataFrame(rolling))
+
+    r_features = pd.concat(features, axis=1)
+
+    # -- Features for every Fold, as positional slices of the global features
+    if fold_offsets is None:
+        return r_features
 
-    # first validation: The same amount of keys
-    if not len(l_target) == len(l_ohlc):
-        raise ValueError('The number of elements between targets and ohlc data must be the same')
+    return {label: r_features.iloc[start:stop] for label, (start, stop) in fold_offsets.items()}
 
-    # second validation: Exactly the same timestamp-based index for both ohlc and target data
-    for i in range(0, len(l_target)):
-        if any(list(ohlc_data[i].index) != list(target_data.index[i])):
-            raise IndexError('The index in both target and ohlc data must be exactly the same')
 
-    # -- Create linear features
-    # -- Create autoregressive features
-    # -- Create symbolic features
-    # -- Perform information leakage prevention
+def label_horizon(p_label, horizon=1):
+    """
+    Periods after t used by the label of t from ohlc_labeling: horizon for the forward looking labels
+    ('fwd_ret', 'b_fwd_ret', 'tb') and 0 for the rest.
+
+    Parameters
+    ----------
+
+    p_label: str
+        Labeling process, see ohlc_labeling
+
+    horizon: int
+        1 (Default): horizon of the forward looking labels
+
+    Returns
+    -------
+
+    r_horizon: int
+
+    """
 
-    return 1
\ No newline at end of file
+    return int(horizon) if p_label in ['fwd_ret', 'b_fwd_ret', 'tb'] else 0
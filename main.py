@@ -11,43 +11,15 @@
 # -- --------------------------------------------------------------------------------------------------- -- #
 """
 
+# Run the following in bash console, with the parameters of the run in a JSON file (see pipeline.load_config):
+# $ python main.py --config config.json --workers 4
+# $ python main.py --config config.json --only-stage kld --profile kld
+
 # -- Load libraries for script
-import pandas as pd
-import numpy as np
+import argparse
 
 # -- Load other scripts
-import data as dt
-import functions as fn
-
-# -- Read Future Continuous Prices -- #
-
-# File name and route
-file_name = 'MP_H1_2010_2021'
-file_route = 'files/prices/' + file_name + '.txt'
-
-# Read files and prepare format
-data_futures = pd.read_csv(file_route, header=None,
-                           names=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-
-# Conversion from Usd per Mxn to Mxn per Usd
-data_futures['timestamp'] = pd.to_datetime(data_futures['timestamp'])
-data_futures['open'] = round(1/data_futures['open'], 5)
-data_futures['high'] = round(1/data_futures['high'], 5)
-data_futures['low'] = round(1/data_futures['low'], 5)
-data_futures['close'] = round(1/data_futures['close'], 5)
-
-# Swap high and low since the exchange rate was swapped from MXNUSD to USDMXN
-low = data_futures['low'].copy()
-high = data_futures['high'].copy()
-data_futures['high'] = low
-data_futures['low'] = high
-
-# Clean memory for these dummy objects
-high, low = None, None
-
-# -- 0. Load Global Dataset (Downsample price data)
-global_data = dt.resample_data(target_data=data_futures.copy(), target_freq='8H',
-                               auto_names=True, col_names=None)
+import pipeline as pl
 
 """
 Pre-Building
@@ -91,33 +63,35 @@ Type 2 requires:
 - Specify Information Leakage Prevention Criteria.
 """
 
-# ---------------------------------------------------------------------------------- T-FOLD-SV : TYPE 1 -- #  
-# ---------------------------------------------------------------------------------- ------------------ -- #  
-
-# -- 1. Folds Formation
-folds_data = dt.folds_formation(global_data=global_data, fold_size='year')
-
-# -- 2. Target and Features Engineering
-
-# Target Variable: Time-based labeling
-Targets = {}
-for label in list(folds_data.keys()):
-    Targets[label] = fn.ohlc_labeling(ohlc_data=folds_data[label], p_label='co')
-
-# Feature Engineering
-Features = {}
-for label in list(folds_data.keys()):
-    Features[label] = fn.ohlc_features(ohlc_data=folds_data[label], p_label='co')
-
-# -- Tests for target variable formation and KLD metric for continuous variables
-target_2010 = fn.ohlc_labeling(ohlc_data=folds_data['y_2010'], p_label='co')
-target_2011 = fn.ohlc_labeling(ohlc_data=folds_data['y_2011'], p_label='co')
-kld_metric = fn.kld(p_data=target_2010, q_data=target_2011, prob_dist='gamma')
-
-# Feature Engineering: In-Fold + Heuristic
-
-# -- 3. Information Assesment
-# -- 4. Learning Assesment
-# -- 5. Generalization Assesment
-
-# ------------------------------- #
+# ---------------------------------------------------------------------------------- T-FOLD-SV : TYPE 1 -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- 0. Load Global Dataset: read the price file by chunks and downsample the prices ('resample' stage)
+# -- 1. Folds Formation ('fold' stage)
+# -- 2. Target and Features Engineering ('label' and 'features' stages)
+# -- 3. Information Assesment: KLD with all combinations of Folds ('kld' stage) and Sparsity assesment
+# -- 4. Learning Assesment and 5. Generalization Assesment, with the estimator of the configuration
+#       ('assess' stage)
+
+# Every stage is checkpointed in checkpoint_dir, and skipped on the next runs with the same parameters
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='T-Fold-SV process, by stages with checkpoints')
+    parser.add_argument('--config', nargs='+', default=[None],
+                        help='JSON files with the configuration of every run, the default configuration if '
+                             'not provided')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, as many as CPUs if not '
+                                                                  'provided')
+    parser.add_argument('--profile', nargs='?', const='', default=None,
+                        help='trace of the stages in checkpoint_dir/profile, and a cProfile dump of the '
+                             'stage or function provided')
+    parser.add_argument('--only-stage', choices=pl._run_stages, default=None,
+                        help='run only this stage again, with the checkpoints of its inputs')
+    args = parser.parse_args()
+
+    for config_route in args.config:
+        config = pl.load_config(route=config_route)
+        run = pl.run_stages(config=config, only_stage=args.only_stage, workers=args.workers,
+                            profile=args.profile)
+        print(config_route or 'default configuration', run['status'])
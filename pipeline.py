@@ -0,0 +1,1144 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- pipeline.py: parallel execution of the T-Fold-SV process                                            -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import os
+import copy
+import json
+import time
+import hashlib
+import importlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# -- Load other scripts
+import data as dt
+import functions as fn
+import profiling as pf
+
+# -- Minimum number of rows in the global dataset to use a process pool, smaller ones run serially
+_parallel_min_rows = 200000
+
+# ------------------------------------------------------------------------------------ PER-FOLD PIPELINE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def run_folds(global_data, fold_size='year', p_label='co', prob_dist='gamma', features=True, lags=(1, 2, 3),
+              windows=(5, 10, 20), horizon=1, workers=None, min_rows=_parallel_min_rows):
+    """
+    Runs the per-fold stages of the T-Fold-SV process (target labeling, feature engineering and distribution
+    parameters) for every T-Fold in a process pool, and the KLD of all the combinations of Folds with the
+    parameters of every Fold. The global dataset is placed once in shared memory, and every worker reads its
+    Fold from there (with the rows needed for lags and rolling windows) instead of receiving a pickled copy.
+
+    Parameters
+    ----------
+
+    global_data: pd.DataFrame
+        Global dataset with 'open', 'high', 'low', 'close' (and optionally 'volume') columns and a sorted
+        DatetimeIndex
+
+    fold_size: str
+        'year' (Default): T-Fold size, see data.folds_formation
+
+    p_label: str
+        'co' (Default): labeling process for the target variable, see functions.ohlc_labeling
+
+    prob_dist: str
+        'gamma' (Default): probability distribution for the KLD, only 'gamma' is supported, with the gamma
+        parameters of every Fold computed in its task (see functions.fold_gamma_params and
+        functions.kld_gamma), otherwise a ValueError is raised
+
+    features: bool
+        True (Default): compute the features of every Fold, see functions.ohlc_features
+
+    lags: tuple
+        (1, 2, 3) (Default): lags for the autoregressive features
+
+    windows: tuple
+        (5, 10, 20) (Default): sizes of the rolling windows for the features
+
+    horizon: int
+        1 (Default): periods ahead for the forward looking labels ('fwd_ret', 'b_fwd_ret', 'tb')
+
+    workers: int
+        None (Default): as many workers as CPUs
+        int: number of worker processes, 1 runs serially
+
+    min_rows: int
+        200000 (Default): global datasets with less rows run serially
+
+    Returns
+    -------
+
+    r_results: dict
+        {'offsets': {fold: (start, stop)}, 'targets': {fold: pd.Series}, 'features': {fold: pd.DataFrame},
+         'kld': pd.DataFrame}, the folds in chronological order in every element
+
+    Example
+    -------
+
+    >> results = run_folds(global_data=global_data, fold_size='year', p_label='co', workers=8)
+    >> information_tensor = results['kld']
+
+    """
+
+    offsets = dt.folds_formation(global_data=global_data, fold_size=fold_size, output='offsets')
+    if prob_dist != 'gamma':
+        raise ValueError("Currently, the supported distributions are: 'gamma'")
+
+    # e.g. the 20% of the hold out with less than 5 years of prices
+    offsets = {label: (start, stop) for label, (start, stop) in offsets.items() if stop > start}
+    labels = list(offsets.keys())
+
+    # rows needed before and after every fold for lags, rolling windows and forward looking labels
+    params = {'p_label': p_label, 'prob_dist': prob_dist, 'features': features, 'lags': tuple(lags),
+              'windows': tuple(windows), 'horizon': horizon,
+              'before': max(list(lags) + list(windows) + [0]) + 1 + fn.label_horizon(p_label, horizon),
+              'after': horizon}
+
+    workers = os.cpu_count() if workers is None else workers
+    tasks = [(label, start, stop) for label, (start, stop) in offsets.items()]
+
+    # -- Serial execution for small inputs
+    if workers <= 1 or len(tasks) < 2 or len(global_data) < min_rows:
+        results = [_fold_stages(global_data, start, stop, params) for _, start, stop in tasks]
+
+    # -- Parallel execution with the global dataset in shared memory
+    else:
+        shm, layout = _to_shared(global_data)
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                # map keeps the order of the tasks
+                results = list(executor.map(_fold_task, [(shm.name, layout, start, stop, params)
+                                                         for _, start, stop in tasks]))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # -- KLD with all combinations of Folds, from the parameters of every Fold
+    fold_params = np.array([result['params'] for result in results], dtype=np.float64).reshape(len(labels), 2)
+    kld = fn.kld_gamma(p_params=fold_params[:, None, :], q_params=fold_params[None, :, :])
+
+    return {'offsets': offsets,
+            'targets': {label: result['target'] for label, result in zip(labels, results)},
+            'features': {label: result['features'] for label, result in zip(labels, results)},
+            'kld': pd.DataFrame(kld, index=labels, columns=labels)}
+
+
+def _fold_stages(global_data, start, stop, params):
+    """
+    Target, features and distribution parameters for the Fold in the positions [start, stop) of global_data.
+
+    """
+
+    # the fold plus the rows needed before and after it
+    w_start = max(start - params['before'], 0)
+    w_stop = min(stop + params['after'], len(global_data))
+    window = global_data.iloc[w_start:w_stop]
+    f_start, f_stop = start - w_start, stop - w_start
+
+    w_target = fn.ohlc_labeling(ohlc_data=window, p_label=params['p_label'], horizon=params['horizon'])
+    target = w_target.iloc[f_start:f_stop]
+
+    r_features = None
+    if params['features']:
+        r_features = fn.ohlc_features(ohlc_data=window, target_data=w_target, lags=params['lags'],
+                                      windows=params['windows'],
+                                      horizon_shift=fn.label_horizon(params['p_label'], params['horizon'])
+                                      ).iloc[f_start:f_stop]
+
+    fold_params = fn.fold_gamma_params(data=target)
+
+    return {'target': target, 'features': r_features, 'params': fold_params}
+
+
+def _fold_task(task):
+    """
+    Worker process: attaches to the shared global dataset and runs the stages for one Fold.
+
+    """
+
+    shm_name, layout, start, stop, params = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        global_data = _from_shared(shm, layout)
+        r_result = _fold_stages(global_data, start, stop, params)
+        # results must not reference the shared memory after it is closed
+        r_result['target'] = r_result['target'].copy()
+        if r_result['features'] is not None:
+            r_result['features'] = r_result['features'].copy()
+        del global_data
+    finally:
+        shm.close()
+
+    return r_result
+
+# ----------------------------------------------------------------------------------- SHARED MEMORY DATA -- #
+
+def _to_shared(data, dtype=None):
+    """
+    Copies a timestamp-indexed numeric DataFrame to a shared memory block: the index as 64-bit timestamps (in
+    the resolution of the index) followed by the values as a (rows, columns) array of dtype (by default their
+    common type, e.g. the float32 or int32 prices of data.compact_prices), with the attrs of the DataFrame
+    kept in the layout.
+
+    """
+
+    n, k = data.shape
+    if dtype is None:
+        dtype = np.result_type(*data.dtypes) if k > 0 else np.float64
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(n*8 + n*k*dtype.itemsize, 1))
+
+    index = data.index if data.index.tz is None else data.index.tz_convert(None)
+    np.ndarray((n,), dtype=index.values.dtype, buffer=shm.buf)[:] = index.values
+    np.ndarray((n, k), dtype=dtype, buffer=shm.buf, offset=n*8)[:] = data.to_numpy(dtype=dtype)
+
+    # attrs, e.g. the tick size of int32 prices
+    layout = {'n': n, 'columns': list(data.columns), 'dtype': dtype.str, 'index_name': data.index.name,
+              'index_dtype': str(index.values.dtype),
+              'tz': None if data.index.tz is None else str(data.index.tz), 'attrs': dict(data.attrs)}
+
+    return shm, layout
+
+
+def _from_shared(shm, layout):
+    """
+    DataFrame over a shared memory block created with _to_shared, the values are not copied.
+
+    """
+
+    n, k = layout['n'], len(layout['columns'])
+    index = pd.DatetimeIndex(np.ndarray((n,), dtype=layout['index_dtype'], buffer=shm.buf),
+                             name=layout['index_name'])
+    if layout['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(layout['tz'])
+    values = np.ndarray((n, k), dtype=layout['dtype'], buffer=shm.buf, offset=n*8)
+
+    r_data = pd.DataFrame(values, index=index, columns=layout['columns'], copy=False)
+    r_data.attrs.update(layout['attrs'])
+
+    return r_data
+
+# ---------------------------------------------------------------------------------- LEARNING ASSESSMENT -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def assess_learning(estimator, features, targets, clusters=None, metric=None, workers=None,
+                    min_rows=_parallel_min_rows):
+    """
+    Learning and Generalization assessment over T-Folds: a copy of the estimator is trained with every Fold
+    and evaluated with every Fold, and every evaluation is classified, according to the clusters of the
+    sparsity assessment, as:
+
+        - 'in-sample': evaluated with the same Fold used for training
+        - 'out-of-sample': evaluated with another Fold of the same cluster (same distribution)
+        - 'out-of-distribution': evaluated with a Fold of another cluster
+
+    The fits run in a process pool, one task per training Fold, with the features and targets of all the
+    Folds placed once in shared memory as a read-only array, so every worker reads the Folds it needs from
+    there instead of receiving pickled copies.
+
+    Parameters
+    ----------
+
+    estimator: object
+        scikit-learn style estimator, with fit(X, y), predict(X) and, if metric is None, score(X, y)
+
+    features: dict
+        {fold: pd.DataFrame} features of every Fold, with the same columns, e.g. from run_folds
+
+    targets: dict
+        {fold: pd.Series} target variable of every Fold, with the same index as its features
+
+    clusters: dict
+        None (Default): all the Folds in the same cluster
+        dict: {fold: cluster} as returned by functions.sparsity_assessment
+
+    metric: callable
+        None (Default): estimator.score(X, y)
+        callable: metric(y_true, y_pred), e.g. sklearn.metrics.mean_squared_error
+
+    workers: int
+        None (Default): as many workers as CPUs
+        int: number of worker processes, 1 runs serially
+
+    min_rows: int
+        200000 (Default): Folds with less rows in total run serially
+
+    Returns
+    -------
+
+    r_assessment: pd.DataFrame
+        One row per (train_fold, test_fold) with: 'type', 'metric', 'n_train', 'n_test', 'fit_time' and
+        'eval_time' (seconds), in the order of the Folds
+
+    Example
+    -------
+
+    >> results = run_folds(global_data=global_data, fold_size='year', p_label='co')
+    >> sparsity = functions.sparsity_assessment(kld_data=results['kld'])
+    >> assessment = assess_learning(estimator=Ridge(), features=results['features'],
+                                    targets=results['targets'], clusters=sparsity['clusters'])
+
+    """
+
+    labels = list(features.keys())
+    if set(labels) != set(targets.keys()):
+        raise ValueError('The Folds in features and targets must be the same')
+
+    clusters = {label: 0 for label in labels} if clusters is None else clusters
+    for label in labels:
+        if not features[label].index.equals(targets[label].index):
+            raise IndexError('The index in both features and targets of ' + str(label) + ' must be the same')
+
+    # -- Features and target of all the Folds stacked in a single array, the target as the last column
+    columns = list(features[labels[0]].columns)
+    stacked = pd.concat([features[label][columns].assign(_target=targets[label].to_numpy(dtype=np.float64))
+                         for label in labels])
+    lengths = np.array([len(features[label]) for label in labels])
+    stops = np.cumsum(lengths)
+    offsets = {label: (int(stop - length), int(stop)) for label, stop, length in zip(labels, stops, lengths)}
+
+    tasks = [(label, offsets, clusters, estimator, metric) for label in labels]
+    workers = os.cpu_count() if workers is None else workers
+
+    # -- Serial execution for small inputs
+    if workers <= 1 or len(tasks) < 2 or len(stacked) < min_rows:
+        values = stacked.to_numpy(dtype=np.float64)
+        results = [_learning_stages(values, *task) for task in tasks]
+
+    # -- Parallel execution with the stacked Folds in shared memory
+    else:
+        # float64, as in the serial execution
+        shm, layout = _to_shared(stacked, dtype=np.float64)
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                results = list(executor.map(_learning_task, [(shm.name, layout) + task for task in tasks]))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    return pd.DataFrame([row for result in results for row in result],
+                        columns=['train_fold', 'test_fold', 'type', 'metric', 'n_train', 'n_test', 'fit_time',
+                                 'eval_time'])
+
+
+def _learning_stages(values, train_fold, offsets, clusters, estimator, metric):
+    """
+    Trains a copy of the estimator with one Fold and evaluates it with every Fold, the rows with missing
+    values (e.g. the warm-up of lags and rolling windows) are left out.
+
+    """
+
+    def _fold_xy(fold):
+        start, stop = offsets[fold]
+        block = values[start:stop]
+        valid = ~np.isnan(block).any(axis=1)
+        return block[valid, :-1], block[valid, -1]
+
+    model = copy.deepcopy(estimator)
+    x_train, y_train = _fold_xy(train_fold)
+
+    fit_time = time.perf_counter()
+    model.fit(x_train, y_train)
+    fit_time = time.perf_counter() - fit_time
+
+    r_rows = []
+    for test_fold in offsets:
+        x_test, y_test = _fold_xy(test_fold)
+
+        eval_time = time.perf_counter()
+        if metric is None:
+            value = model.score(x_test, y_test)
+        else:
+            value = metric(y_test, model.predict(x_test))
+        eval_time = time.perf_counter() - eval_time
+
+        if test_fold == train_fold:
+            e_type = 'in-sample'
+        elif clusters[test_fold] == clusters[train_fold]:
+            e_type = 'out-of-sample'
+        else:
+            e_type = 'out-of-distribution'
+
+        r_rows.append((train_fold, test_fold, e_type, float(value), len(y_train), len(y_test), fit_time,
+                       eval_time))
+
+    return r_rows
+
+
+def _learning_task(task):
+    """
+    Worker process: attaches to the shared stacked Folds and runs the learning stages for one training Fold.
+
+    """
+
+    shm_name, layout = task[:2]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        values = np.ndarray((layout['n'], len(layout['columns'])), dtype=layout['dtype'], buffer=shm.buf,
+                            offset=layout['n']*8)
+        values.flags.writeable = False
+        r_rows = _learning_stages(values, *task[2:])
+        del values
+    finally:
+        shm.close()
+
+    return r_rows
+
+# ---------------------------------------------------------------------------------- INCREMENTAL UPDATES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def state_init(target_freq='8H', fold_size='year', p_label='co', prob_dist='gamma', features=True,
+               lags=(1, 2, 3), windows=(5, 10, 20), horizon=1):
+    """
+    Empty state of the T-Fold-SV process for incremental updates: new raw prices are added with state_append,
+    and the state is persisted between runs with state_save and state_load.
+
+    Only the open Folds (the ones new prices can still change) and the bars needed to label them are kept in
+    state['bars'], the finished bars and Folds are the delta written by the next state_save to an append-only
+    columnar store (see data.read_columnar), and read back memory-mapped. All the resampled prices are
+    available with state_bars.
+
+    Parameters
+    ----------
+
+    target_freq: str
+        '8H' (Default): frequency to resample the raw prices to, see data.resample_stream
+
+    fold_size, p_label, prob_dist, features, lags, windows, horizon:
+        See run_folds
+
+    Returns
+    -------
+
+    r_state: dict
+        {'params', 'anchor', 'carry' (raw rows of the last bar), 'first' (timestamp of the first bar), 'base'
+         (position of the first row of 'bars'), 'bars' (resampled prices of the open Folds, with the last bar
+         possibly partial), 'spill' (finished bars not saved yet), 'closed' (finished Folds), 'saved'
+         (route, rows and Folds in the store), 'offsets', 'targets', 'features', 'fold_params' (gamma
+         parameters of every Fold), 'kld', 'changed' (Folds updated by the last state_append)}
+
+    Example
+    -------
+
+    >> state = state_init(target_freq='8H', fold_size='year', p_label='co')
+    >> for chunk in data.read_ohlcv(file_route='files/prices/MP_H1_2010_2021.txt', invert=True):
+    >>     state = state_append(state=state, new_data=chunk)
+    >> state_save(state=state, route='files/state')
+
+    """
+
+    if prob_dist != 'gamma':
+        raise ValueError("Currently, the supported distributions are: 'gamma'")
+
+    params = {'target_freq': target_freq, 'fold_size': fold_size, 'p_label': p_label, 'prob_dist': prob_dist,
+              'features': features, 'lags': tuple(lags), 'windows': tuple(windows), 'horizon': horizon,
+              'before': max(list(lags) + list(windows) + [0]) + 1 + fn.label_horizon(p_label, horizon),
+              'after': horizon}
+
+    return {'params': params, 'anchor': None, 'carry': None, 'first': None, 'base': 0, 'bars': None,
+            'spill': [], 'closed': [], 'saved': {'route': None, 'rows': 0, 'folds': []}, 'offsets': {},
+            'targets': {}, 'features': {}, 'fold_params': {}, 'kld': pd.DataFrame(dtype=np.float64),
+            'changed': []}
+
+
+def state_append(state, new_data):
+    """
+    Adds new raw prices to the state of the T-Fold-SV process: only the new prices (and the raw rows of the
+    last, possibly partial, bar) are resampled, only the Folds whose data changed (the newest one, extended,
+    or a new one) are labeled again, and only the rows and columns of those Folds in the KLD matrix are
+    computed, with the stored parameters of the other Folds. The result is the same as running the whole
+    process (resample_stream, folds_formation and run_folds) with all the prices at once.
+
+    A calendar Fold is finished once a later Fold has started and the bars after it needed by its labels are
+    final, its bars are moved from state['bars'] to state['spill'], so the bars in memory (and copied by
+    every call) are the ones of the open Folds. '80-20' Folds change with every new year of prices, so they
+    are never finished.
+
+    Parameters
+    ----------
+
+    state: dict
+        State from state_init, state_load or a previous state_append, it is updated in place
+
+    new_data: pd.DataFrame
+        Raw OHLCV prices with a sorted DatetimeIndex, after the last price already in the state, e.g. a chunk
+        from data.read_ohlcv
+
+    Returns
+    -------
+
+    r_state: dict
+        The updated state, with the labels of the Folds that changed in state['changed']
+
+    """
+
+    params = state['params']
+    if len(new_data) == 0:
+        state['changed'] = []
+        return state
+
+    if state['carry'] is not None and new_data.index[0] <= state['carry'].index[-1]:
+        raise ValueError('The new prices must start after ' + str(state['carry'].index[-1]))
+
+    # -- Resample the new prices, with the raw rows of the last bar to finish it
+    if state['anchor'] is None:
+        tick = isinstance(pd.tseries.frequencies.to_offset(params['target_freq']), pd.offsets.Tick)
+        state['anchor'] = {'origin': new_data.index[0].floor('D')} if tick else {}
+
+    raw = new_data if state['carry'] is None else pd.concat([state['carry'], new_data])
+    bars = raw.resample(params['target_freq'], **state['anchor']).agg(dt._ohlcv_conversion(raw.columns))
+    state['carry'] = raw.iloc[raw.index.searchsorted(bars.index[-1], side='left'):]
+    bars = bars.dropna()
+
+    # the previous last bar is replaced by its finished version (the first of the new bars), positions of
+    # the bars are global (from the first bar), the ones in memory start at state['base']
+    base = state['base']
+    if state['bars'] is None:
+        first_changed = 0
+        state['bars'] = bars
+        state['first'] = bars.index[0]
+    else:
+        first_changed = base + len(state['bars']) - 1
+        state['bars'] = pd.concat([state['bars'].iloc[:-1], bars])
+    n_bars = base + len(state['bars'])
+
+    # -- Folds with new bars, or with changed bars within the rows needed after them by the labels
+    offsets = dt.folds_offsets(index=state['bars'].index, fold_size=params['fold_size'],
+                               origin=state['first'])
+    # e.g. the 20% of the hold out with less than 5 years of prices, or the finished Fold of the first rows
+    offsets = {label: (base + start, base + stop) for label, (start, stop) in offsets.items()
+               if stop > start and label not in state['closed']}
+    changed = [label for label, (start, stop) in offsets.items()
+               if state['offsets'].get(label) != (start, stop) or stop + params['after'] > first_changed]
+    offsets = dict([(label, state['offsets'][label]) for label in state['closed']] + list(offsets.items()))
+
+    for label in [label for label in state['offsets'] if label not in offsets]:
+        for key in ['targets', 'features', 'fold_params']:
+            state[key].pop(label, None)
+
+    for label in changed:
+        start, stop = offsets[label]
+        result = _fold_stages(state['bars'], start - base, stop - base, params)
+        state['targets'][label] = result['target']
+        state['features'][label] = result['features']
+        state['fold_params'][label] = result['params']
+
+    # -- KLD matrix, with only the rows and columns of the changed Folds computed
+    labels = list(offsets.keys())
+    state['offsets'] = offsets
+    for key in ['targets', 'features', 'fold_params']:
+        state[key] = {label: state[key][label] for label in labels}
+
+    kld = np.array(state['kld'].reindex(index=labels, columns=labels), dtype=np.float64)
+    if len(changed) > 0:
+        fold_params = np.array([state['fold_params'][label] for label in labels],
+                               dtype=np.float64).reshape(len(labels), 2)
+        positions = [labels.index(label) for label in changed]
+        c_params = fold_params[positions]
+        # p in rows, q in columns
+        kld[positions, :] = fn.kld_gamma(p_params=c_params[:, None, :], q_params=fold_params[None, :, :])
+        kld[:, positions] = fn.kld_gamma(p_params=fold_params[:, None, :], q_params=c_params[None, :, :])
+
+    state['kld'] = pd.DataFrame(kld, index=labels, columns=labels)
+    state['changed'] = changed
+
+    # -- Finished Folds: a later Fold exists and the bars after it for its labels are final
+    if params['fold_size'] != '80-20':
+        opened = [label for label in labels if label not in state['closed']]
+        for label in opened[:-1]:
+            if offsets[label][1] + params['after'] > n_bars - 1:
+                break
+            state['closed'].append(label)
+            opened.remove(label)
+
+        # bars before the rows needed by the first open Fold
+        stop = max(offsets[opened[0]][0] - params['before'], base)
+        if stop > base:
+            state['spill'].append(state['bars'].iloc[:stop - base])
+            state['bars'] = state['bars'].iloc[stop - base:]
+            state['base'] = stop
+
+    return state
+
+
+def state_bars(state):
+    """
+    Resampled prices of the state of the T-Fold-SV process: the saved ones (memory-mapped), the ones not
+    saved yet and the ones of the open Folds.
+
+    Parameters
+    ----------
+
+    state: dict
+        State from state_init, state_load or state_append
+
+    Returns
+    -------
+
+    r_bars: pd.DataFrame
+
+    """
+
+    bars = []
+    if state['saved']['rows'] > 0:
+        route = os.path.join(state['saved']['route'], 'bars')
+        bars += [dt._cache_load(os.path.join(route, name)) for name in sorted(os.listdir(route))
+                 if int(name) < state['saved']['rows']]
+    bars += state['spill'] + ([] if state['bars'] is None else [state['bars']])
+
+    if len(bars) == 0:
+        return state['bars']
+
+    return pd.concat(bars) if len(bars) > 1 else bars[0]
+
+
+def state_save(state, route):
+    """
+    Persists the state of the T-Fold-SV process to a directory: the bars and Folds finished since the
+    previous save are appended to its columnar store, and the rest of the state (the open Folds, the
+    parameters of every Fold and the KLD matrix) is written as state.pkl. The finished bars and Folds are
+    released from memory, and read back memory-mapped.
+
+    Parameters
+    ----------
+
+    state: dict
+        State from state_init or state_append
+
+    route: str
+        Route of the directory, the same for every save of a state
+
+    """
+
+    saved = state['saved']
+    if saved['route'] is not None and os.path.abspath(saved['route']) != os.path.abspath(route):
+        raise ValueError('The state was saved to ' + str(saved['route']) + ', it must be saved there')
+    os.makedirs(route, exist_ok=True)
+
+    # -- Delta: finished bars, in a new entry named by the position of its first bar
+    if len(state['spill']) > 0:
+        spill = pd.concat(state['spill']) if len(state['spill']) > 1 else state['spill'][0]
+        _state_store(os.path.join(route, 'bars', str(saved['rows']).zfill(12)), spill, route)
+        saved['rows'] += len(spill)
+        state['spill'] = []
+
+    # -- Delta: finished Folds, replaced by its memory-mapped version
+    closed = [label for label in state['closed'] if label not in saved['folds']]
+    for label in closed:
+        _state_store(os.path.join(route, 'folds', label, 'target'), state['targets'][label].to_frame(), route)
+        if state['features'][label] is not None:
+            _state_store(os.path.join(route, 'folds', label, 'features'), state['features'][label], route)
+        saved['folds'].append(label)
+    saved['route'] = route
+    _state_folds(state, closed)
+
+    # written to a temporary file first, so an interrupted save never leaves a corrupted state
+    folds = {key: {label: value for label, value in state[key].items() if label not in saved['folds']}
+             for key in ['targets', 'features']}
+    pd.to_pickle(dict(state, **folds), os.path.join(route, 'state.pkl.tmp'))
+    os.replace(os.path.join(route, 'state.pkl.tmp'), os.path.join(route, 'state.pkl'))
+
+
+def state_load(route):
+    """
+    Loads the state of the T-Fold-SV process saved with state_save, with the finished Folds memory-mapped.
+
+    Parameters
+    ----------
+
+    route: str
+        Route of the directory
+
+    Returns
+    -------
+
+    r_state: dict
+
+    """
+
+    r_state = pd.read_pickle(os.path.join(route, 'state.pkl'))
+    r_state['saved']['route'] = route
+    _state_folds(r_state, r_state['saved']['folds'])
+
+    return r_state
+
+
+def _state_store(entry, data, route):
+    """
+    Writes the values of a DataFrame to an entry of the store of a state, replacing a previous version (e.g.
+    from an interrupted save).
+
+    """
+
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    dt._cache_store(entry, data, route, dtype=None)
+
+
+def _state_folds(state, labels):
+    """
+    Targets and features of saved Folds, memory-mapped from the store of the state.
+
+    """
+
+    route = state['saved']['route']
+    for label in labels:
+        state['targets'][label] = dt._cache_load(os.path.join(route, 'folds', label, 'target')).iloc[:, 0]
+        f_entry = os.path.join(route, 'folds', label, 'features')
+        state['features'][label] = dt._cache_load(f_entry) if os.path.isdir(f_entry) else None
+
+    # in the order of the Folds
+    for key in ['targets', 'features']:
+        state[key] = {label: state[key][label] for label in state['offsets']}
+
+# ---------------------------------------------------------------------------------- COMPACT MEMORY MODE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Tolerances of the compact mode: absolute error of numeric labels relative to the price level, and
+# relative error of the KLD (float32 prices have a relative error of up to 6e-8)
+_compact_label_tol = 1e-6
+_compact_kld_tol = 1e-3
+
+
+def compact_check(global_data, fold_size='year', p_labels=('co', 'b_co', 'hl', 'log_ret'), dtype='float32',
+                  tick_size=None, prob_dist='gamma', label_tol=_compact_label_tol, kld_tol=_compact_kld_tol):
+    """
+    Tolerance check of the compact memory mode (data.compact_prices, with float32 numeric labels and int8
+    binary labels) against the float64 results, for the labels of every Fold and the KLD matrix.
+
+    The tolerances are:
+
+        - numeric labels: max |label_32 - label_64| <= label_tol * max |price|
+        - binary labels: the same value, except where the float64 difference of prices is within the
+          tolerance of the numeric labels (e.g. close == open up to the last tick), reported as 'flips'
+        - KLD: max |kld_32 - kld_64| <= kld_tol * max |kld_64|
+
+    Parameters
+    ----------
+
+    global_data: pd.DataFrame
+        float64 OHLCV prices with a DatetimeIndex
+
+    fold_size: str
+        'year' (Default): T-Fold size, see data.folds_formation
+
+    p_labels: tuple
+        ('co', 'b_co', 'hl', 'log_ret') (Default): labels to check, see functions.ohlc_labeling
+
+    dtype, tick_size:
+        See data.compact_prices
+
+    prob_dist: str
+        'gamma' (Default): probability distribution for the KLD of the numeric labels, see kld_matrix
+
+    label_tol: float
+        1e-6 (Default): tolerance for the numeric labels, relative to the price level
+
+    kld_tol: float
+        1e-3 (Default): tolerance for the KLD, relative to the largest divergence
+
+    Returns
+    -------
+
+    r_check: pd.DataFrame
+        One row per label with: 'label_error', 'flips', 'kld_error' (None for binary labels) and 'passed'
+
+    Example
+    -------
+
+    >> compact_check(global_data=global_data, fold_size='year', dtype='int32', tick_size=1e-5)
+
+    """
+
+    compact_data = dt.compact_prices(global_data=global_data, dtype=dtype, tick_size=tick_size)
+    offsets = dt.folds_formation(global_data=global_data, fold_size=fold_size, output='offsets')
+    level = float(np.nanmax(np.abs(global_data[['open', 'high', 'low', 'close']].to_numpy())))
+
+    r_check = []
+    for p_label in p_labels:
+        # labels of the global data, sliced by Fold, so only its edges are unknown
+        labels_64 = fn.ohlc_labeling(ohlc_data=global_data, p_label=p_label)
+        labels_32 = fn.ohlc_labeling(ohlc_data=compact_data, p_label=p_label, dtype=np.float32)
+        values_64 = labels_64.to_numpy(dtype=np.float64)
+        values_32 = labels_32.to_numpy(dtype=np.float64)
+        binary = p_label in ['b_co', 'b_fwd_ret', 'tb']
+
+        if binary:
+            # unknown labels (NaN) are the same in both, and only labels within the tolerance can change
+            label_error = 0.0
+            flipped = (values_32 != values_64) & ~(np.isnan(values_32) & np.isnan(values_64))
+            flips = int(np.sum(flipped))
+            kld_error = None
+            passed = not np.any(flipped & ~_compact_ambiguous(global_data, p_label, label_tol*level))
+        else:
+            label_error = float(np.nanmax(np.abs(values_32 - values_64), initial=0))
+            flips = 0
+            kld_64 = fn.kld_matrix(folds={label: labels_64.iloc[start:stop]
+                                          for label, (start, stop) in offsets.items()},
+                                   prob_dist=prob_dist).to_numpy()
+            kld_32 = fn.kld_matrix(folds={label: labels_32.iloc[start:stop]
+                                          for label, (start, stop) in offsets.items()},
+                                   prob_dist=prob_dist).to_numpy()
+            kld_error = float(np.max(np.abs(kld_32 - kld_64), initial=0))
+            # an undefined divergence is not within the tolerance
+            passed = (label_error <= label_tol*level and np.isfinite(kld_64).all() and
+                      np.isfinite(kld_32).all() and
+                      kld_error <= kld_tol*float(np.max(np.abs(kld_64), initial=0)))
+
+        r_check.append({'p_label': p_label, 'label_error': label_error, 'flips': flips,
+                        'kld_error': kld_error, 'passed': bool(passed)})
+
+    return pd.DataFrame(r_check).set_index('p_label')
+
+
+def _compact_ambiguous(global_data, p_label, tolerance, horizon=1, barriers=(0.01, 0.01)):
+    """
+    Binary labels that can change with the compact prices: those decided by a comparison of float64 prices
+    within the tolerance, for the default horizon and barriers of functions.ohlc_labeling.
+
+    """
+
+    close, open_ = global_data['close'].to_numpy(), global_data['open'].to_numpy()
+    r_ambiguous = np.zeros(len(close), dtype=bool)
+
+    if p_label == 'b_co':
+        r_ambiguous[:] = np.abs(close - open_) <= tolerance
+
+    elif p_label == 'b_fwd_ret':
+        r_ambiguous[:-horizon] = np.abs(close[horizon:] - close[:-horizon]) <= tolerance
+
+    elif p_label == 'tb':
+        # a barrier (a close price scaled) touched or not by a high or low price of the next periods
+        high, low = global_data['high'].to_numpy(), global_data['low'].to_numpy()
+        b_tolerance = tolerance*(2 + max(barriers))
+        upper, lower = close*(1 + barriers[0]), close*(1 - barriers[1])
+        for ahead in range(1, horizon + 1):
+            r_ambiguous[:-ahead] |= ((np.abs(high[ahead:] - upper[:-ahead]) <= b_tolerance) |
+                                     (np.abs(low[ahead:] - lower[:-ahead]) <= b_tolerance))
+
+    return r_ambiguous
+
+# --------------------------------------------------------------------------------------- RESUMABLE RUNS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Stages of a run, in order of execution
+_run_stages = ['resample', 'fold', 'label', 'features', 'kld', 'assess']
+
+# -- Stages whose outputs are the inputs of every stage
+_run_inputs = {'resample': [], 'fold': ['resample'], 'label': ['resample'],
+               'features': ['resample', 'label'], 'kld': ['fold', 'label'],
+               'assess': ['fold', 'label', 'features', 'kld']}
+
+# -- Parameters of the configuration used by every stage
+_run_params = {'resample': ['file_route', 'invert', 'decimals', 'ts_format', 'target_freq', 'session_open',
+                            'holidays', 'weekends'],
+               'fold': ['fold_size'], 'label': ['p_label', 'horizon'],
+               'features': ['lags', 'windows', 'p_label', 'horizon'],
+               'kld': ['prob_dist'], 'assess': ['threshold', 'estimator', 'metric']}
+
+# -- Default configuration of a run, as in the original main.py
+_run_defaults = {'file_route': 'files/prices/MP_H1_2010_2021.txt', 'invert': True, 'decimals': 5,
+                 'ts_format': None, 'chunk_size': 500000, 'target_freq': '8H', 'session_open': None,
+                 'holidays': None, 'weekends': False, 'fold_size': 'year', 'p_label': 'co', 'horizon': 1,
+                 'lags': [1, 2, 3], 'windows': [5, 10, 20], 'prob_dist': 'gamma', 'threshold': None,
+                 'estimator': None, 'metric': None, 'checkpoint_dir': 'files/checkpoints'}
+
+
+def load_config(route=None, **kwargs):
+    """
+    Configuration of a run, from a JSON file with any of the keys of the default configuration.
+
+    Parameters
+    ----------
+
+    route: str
+        None (Default): the default configuration
+        str: route of a JSON file, e.g. config.json
+
+    kwargs:
+        Values that replace the ones of the file, e.g. fold_size='quarter'
+
+    Returns
+    -------
+
+    r_config: dict
+        Complete configuration, with the keys:
+            - file_route, invert, decimals, ts_format, chunk_size: see data.read_ohlcv
+            - target_freq, session_open, holidays, weekends: see data.resample_stream
+            - fold_size: see data.folds_formation
+            - p_label, horizon: see functions.ohlc_labeling
+            - lags, windows: see functions.ohlc_features
+            - prob_dist: see functions.kld_matrix
+            - threshold: see functions.sparsity_assessment
+            - estimator: None, or {'class': 'module.Class', 'params': {}} of a scikit-learn style estimator
+              for assess_learning, e.g. {'class': 'sklearn.linear_model.Ridge', 'params': {'alpha': 1.0}}
+            - metric: None, or 'module.function' for assess_learning, e.g. 'sklearn.metrics.r2_score'
+            - checkpoint_dir: directory for the checkpoints of the stages
+
+    """
+
+    r_config = dict(_run_defaults)
+    if route is not None:
+        with open(route) as file:
+            r_config.update(json.load(file))
+    r_config.update(kwargs)
+
+    unknown = set(r_config) - set(_run_defaults)
+    if unknown:
+        raise ValueError('Unknown configuration keys: ' + ', '.join(sorted(unknown)))
+
+    return r_config
+
+
+def run_stages(config, only_stage=None, workers=None, profile=None):
+    """
+    Runs the stages of the T-Fold-SV process (resample, fold, label, features, kld and assess) with a
+    configuration, with the output of every stage checkpointed to disk. A stage is skipped when there is a
+    checkpoint for the same parameters and inputs (the key of a stage is a hash of its parameters, the keys
+    of its input stages and, for the resample stage, the route, modification time and size of the price
+    file), so a run that failed restarts from the failed stage, and runs with other parameters only compute
+    the stages that change, e.g. a new fold_size reuses the resample checkpoint. The price file is read by
+    chunks and resampled as they are read, so the raw prices are never held in memory nor checkpointed.
+
+    Parameters
+    ----------
+
+    config: dict
+        Configuration of the run, see load_config
+
+    only_stage: str
+        None (Default): every stage, skipping the ones with a checkpoint
+        str: only this stage, computed again, with the checkpoints of its input stages
+
+    workers: int
+        None (Default): as many workers as CPUs, for the learning assessment, see assess_learning
+
+    profile: str
+        None (Default): no profiling
+        '': trace of every stage and function (see profiling.py), written in checkpoint_dir/profile
+        str: also a cProfile dump of this stage (e.g. 'kld') or function (e.g. 'resample_bars')
+
+    Returns
+    -------
+
+    r_run: dict
+        {'status': {stage: 'run' or 'skipped'}, 'keys': {stage: key}, 'outputs': {stage: output}} with the
+        outputs of the stages that run and of the ones loaded as their inputs
+
+    Example
+    -------
+
+    >> config = load_config(route='config.json', fold_size='quarter')
+    >> run = run_stages(config=config, workers=4)
+    >> sparsity = stage_output(config=config, stage='assess')['sparsity']
+
+    """
+
+    if only_stage is not None and only_stage not in _run_stages:
+        raise ValueError('Accepted values for only_stage are: ' + ', '.join(_run_stages))
+
+    keys = _stage_keys(config)
+    stages = _run_stages if only_stage is None else [only_stage]
+    r_run = {'status': {}, 'keys': keys, 'outputs': {}}
+
+    if profile is not None:
+        pf.enable(profile_stage=None if profile == '' else
+                  'stage:' + profile if profile in _run_stages else profile)
+
+    try:
+        for stage in stages:
+            entry = _stage_entry(config, stage, keys[stage])
+            if only_stage is None and os.path.isdir(entry):
+                r_run['status'][stage] = 'skipped'
+                continue
+
+            # inputs from this run, or from its checkpoints
+            inputs = {}
+            for i_stage in _run_inputs[stage]:
+                if i_stage not in r_run['outputs']:
+                    i_entry = _stage_entry(config, i_stage, keys[i_stage])
+                    if not os.path.isdir(i_entry):
+                        raise ValueError('There is no checkpoint of the stage ' + i_stage + ', run it first')
+                    r_run['outputs'][i_stage] = _checkpoint_load(i_entry)
+                inputs[i_stage] = r_run['outputs'][i_stage]
+
+            with pf.section('stage:' + stage):
+                output = _run_stage(stage, config, inputs, workers)
+
+            _checkpoint_save(entry, output, config['file_route'])
+            r_run['outputs'][stage] = output
+            r_run['status'][stage] = 'run'
+
+    finally:
+        if profile is not None:
+            pf.disable()
+            p_dir = os.path.join(config['checkpoint_dir'], 'profile')
+            os.makedirs(p_dir, exist_ok=True)
+            stamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
+            pf.export(os.path.join(p_dir, 'trace_' + stamp + '.csv'))
+            if profile != '':
+                pf.dump_profile(os.path.join(p_dir, profile + '_' + stamp + '.prof'))
+
+    return r_run
+
+
+def stage_output(config, stage):
+    """
+    Output of a stage from its checkpoint, for the parameters of config.
+
+    Parameters
+    ----------
+
+    config: dict
+        Configuration of the run, see load_config
+
+    stage: str
+        Name of the stage, see run_stages
+
+    Returns
+    -------
+
+    r_output: object
+        pd.DataFrame for resample and features, dict of offsets for fold, pd.Series for label,
+        pd.DataFrame for kld and {'sparsity', 'learning'} for assess
+
+    """
+
+    entry = _stage_entry(config, stage, _stage_keys(config)[stage])
+    if not os.path.isdir(entry):
+        raise ValueError('There is no checkpoint of the stage ' + stage + ' for this configuration')
+
+    return _checkpoint_load(entry)
+
+
+def _run_stage(stage, config, inputs, workers):
+    """
+    Computes the output of a stage from the outputs of its input stages.
+
+    """
+
+    if stage == 'resample':
+        chunks = dt.read_ohlcv(file_route=config['file_route'], chunk_size=config['chunk_size'],
+                               invert=config['invert'], decimals=config['decimals'],
+                               ts_format=config['ts_format'])
+        return dt.resample_stream(chunks=chunks, target_freq=config['target_freq'],
+                                  session_open=config['session_open'], holidays=config['holidays'],
+                                  weekends=config['weekends'])
+
+    elif stage == 'fold':
+        return dt.folds_formation(global_data=inputs['resample'], fold_size=config['fold_size'],
+                                  output='offsets')
+
+    elif stage == 'label':
+        return fn.ohlc_labeling(ohlc_data=inputs['resample'], p_label=config['p_label'],
+                                horizon=config['horizon'])
+
+    elif stage == 'features':
+        return fn.ohlc_features(ohlc_data=inputs['resample'], target_data=inputs['label'],
+                                lags=config['lags'], windows=config['windows'],
+                                horizon_shift=fn.label_horizon(config['p_label'], config['horizon']))
+
+    elif stage == 'kld':
+        targets = {label: inputs['label'].iloc[start:stop] for label, (start, stop) in inputs['fold'].items()}
+        return fn.kld_matrix(folds=targets, prob_dist=config['prob_dist'])
+
+    # assess
+    sparsity = fn.sparsity_assessment(kld_data=inputs['kld'], threshold=config['threshold'])
+    learning = None
+    if config['estimator'] is not None:
+        offsets = inputs['fold']
+        estimator = _import(config['estimator']['class'])(**config['estimator'].get('params', {}))
+        learning = assess_learning(estimator=estimator,
+                                   features={label: inputs['features'].iloc[start:stop]
+                                             for label, (start, stop) in offsets.items()},
+                                   targets={label: inputs['label'].iloc[start:stop]
+                                            for label, (start, stop) in offsets.items()},
+                                   clusters=sparsity['clusters'], workers=workers,
+                                   metric=None if config['metric'] is None else _import(config['metric']))
+
+    return {'sparsity': sparsity, 'learning': learning}
+
+
+def _stage_keys(config):
+    """
+    Key of every stage: a hash of its parameters and the keys of its input stages.
+
+    """
+
+    stat = os.stat(config['file_route'])
+    r_keys = {}
+    for stage in _run_stages:
+        key = {'stage': stage, 'params': {param: config[param] for param in _run_params[stage]},
+               'inputs': [r_keys[i_stage] for i_stage in _run_inputs[stage]]}
+        if stage == 'resample':
+            key['file'] = [os.path.abspath(config['file_route']), stat.st_mtime_ns, stat.st_size]
+        r_keys[stage] = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    return r_keys
+
+
+def _stage_entry(config, stage, key):
+    """
+    Directory of the checkpoint of a stage.
+
+    """
+
+    return os.path.join(config['checkpoint_dir'], stage, key)
+
+
+def _checkpoint_save(entry, output, file_route):
+    """
+    Writes the output of a stage, timestamp-indexed numeric DataFrames in the columnar format of the prices
+    cache (memory-mapped when loaded), anything else as a pickle. The checkpoint is written in a temporary
+    directory and then renamed, replacing a previous checkpoint of the stage (e.g. with only_stage), so it is
+    never left partial.
+
+    """
+
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    columnar = (isinstance(output, pd.DataFrame) and isinstance(output.index, pd.DatetimeIndex) and
+                all(pd.api.types.is_numeric_dtype(dtype) for dtype in output.dtypes))
+
+    if columnar:
+        dt._cache_store(entry, output, file_route)
+        return
+
+    tmp_entry = entry + '.tmp' + str(os.getpid())
+    os.makedirs(tmp_entry, exist_ok=True)
+    pd.to_pickle(output, os.path.join(tmp_entry, 'output.pkl'))
+    dt._entry_replace(tmp_entry, entry)
+
+
+def _checkpoint_load(entry):
+    """
+    Reads the output of a stage written with _checkpoint_save.
+
+    """
+
+    if os.path.isfile(os.path.join(entry, 'meta.json')):
+        return dt._cache_load(entry)
+
+    return pd.read_pickle(os.path.join(entry, 'output.pkl'))
+
+
+def _import(name):
+    """
+    Object from its full name, e.g. 'sklearn.linear_model.Ridge'.
+
+    """
+
+    module, _, attribute = name.rpartition('.')
+
+    return getattr(importlib.import_module(module), attribute)
@@ -0,0 +1,394 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- profiling.py: stage-level instrumentation of the T-Fold-SV process                                  -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import json
+import time
+import cProfile
+import functools
+import inspect
+import tracemalloc
+import pandas as pd
+
+# -- State of the instrumentation, disabled by default
+_state = {'enabled': False, 'memory': True, 'profile_stage': None, 'profiler': None, 'profiling': False}
+
+# -- Records of the current run and stack of the stages being measured (for nested stages)
+_records = []
+_stack = []
+
+# -------------------------------------------------------------------------------------- INSTRUMENTATION -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def enable(memory=True, profile_stage=None):
+    """
+    Enables the instrumentation of the stages, the records of previous runs are discarded.
+
+    Parameters
+    ----------
+
+    memory: bool
+        True (Default): measure the memory allocated by every stage with tracemalloc (slower)
+        False: only wall time, CPU time and rows
+
+    profile_stage: str
+        None (Default): no cProfile
+        str: name of the stage to run under cProfile, e.g. 'kld_matrix', see dump_profile
+
+    Example
+    -------
+
+    >> profiling.enable(profile_stage='resample_stream')
+    >> global_data = data.read_cached(file_route='files/prices/MP_H1_2010_2021.txt', target_freq='8H')
+    >> profiling.export('files/trace.csv')
+    >> profiling.dump_profile('files/resample_stream.prof')
+
+    """
+
+    reset()
+    _state.update({'enabled': True, 'memory': memory, 'profile_stage': profile_stage,
+                   'profiler': cProfile.Profile() if profile_stage is not None else None})
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Disables the instrumentation, the records of the run are kept until the next enable or reset.
+
+    """
+
+    if _state['enabled'] and _state['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    _state['enabled'] = False
+
+
+def reset():
+    """
+    Discards the records of the current run.
+
+    """
+
+    _records.clear()
+    _stack.clear()
+
+
+def stage(name=None):
+    """
+    Decorator to instrument a stage of the process: every call records its wall time, CPU time, rows in
+    (first argument), rows out (result) and the peak of memory allocated during the call. When the
+    instrumentation is disabled the only cost is a lookup of the state per call.
+
+    For generator functions, e.g. data.read_ohlcv, the time spent producing every item is added up and
+    recorded once the generator is exhausted or closed, with the rows of all the items as rows out.
+
+    Parameters
+    ----------
+
+    name: str
+        None (Default): the name of the function
+
+    Returns
+    -------
+
+    r_decorator: callable
+
+    """
+
+    def r_decorator(function):
+        s_name = function.__name__ if name is None else name
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not _state['enabled']:
+                    return function(*args, **kwargs)
+                return _measure_iter(s_name, function(*args, **kwargs), _rows(_first(args, kwargs)))
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not _state['enabled']:
+                    return function(*args, **kwargs)
+                frame = _enter(s_name)
+                try:
+                    result = function(*args, **kwargs)
+                finally:
+                    record = _exit(frame)
+                record.update({'rows_in': _rows(_first(args, kwargs)), 'rows_out': _rows(result)})
+                return result
+
+        return wrapper
+
+    return r_decorator
+
+
+class section:
+    """
+    Context manager to instrument a section of code within a stage, e.g. the timestamp conversion.
+
+    Parameters
+    ----------
+
+    name: str
+        Name of the section
+
+    rows: int
+        None (Default): rows processed by the section, recorded as rows in and out
+
+    Example
+    -------
+
+    >> with profiling.section('to_datetime', rows=len(data)):
+    >>     data['timestamp'] = pd.to_datetime(data['timestamp'])
+
+    """
+
+    __slots__ = ('name', 'rows', 'frame')
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.frame = None
+
+    def __enter__(self):
+        if _state['enabled']:
+            self.frame = _enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if self.frame is not None:
+            _exit(self.frame).update({'rows_in': self.rows, 'rows_out': self.rows})
+        return False
+
+
+def iterate(name, iterable):
+    """
+    Instruments the production of the items of an iterable, e.g. the chunks of pd.read_csv, as a single
+    record. When the instrumentation is disabled the iterable is returned as it is.
+
+    Parameters
+    ----------
+
+    name: str
+        Name of the stage
+
+    iterable: iterable
+        Items to be produced
+
+    Returns
+    -------
+
+    r_iterable: iterable
+
+    """
+
+    if not _state['enabled']:
+        return iterable
+
+    return _measure_iter(name, iter(iterable), None)
+
+
+def _measure_iter(name, iterator, rows_in):
+    """
+    Generator that measures the time spent in producing every item of iterator, recorded at the end.
+
+    """
+
+    totals = {'wall_s': 0.0, 'cpu_s': 0.0, 'alloc_mb': None}
+    rows_out = 0
+    try:
+        while True:
+            frame = _enter(name, record=False)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                _accumulate(totals, _exit(frame, record=False))
+            rows_out = None if rows_out is None or _rows(item) is None else rows_out + _rows(item)
+            yield item
+    finally:
+        if _state['enabled']:
+            totals.update({'stage': name, 'depth': len(_stack), 'rows_in': rows_in, 'rows_out': rows_out})
+            _records.append(totals)
+
+
+def _enter(name, record=True):
+    """
+    Starts the measures of a stage, with the peak of memory of the enclosing stage saved before resetting it.
+
+    """
+
+    memory = _state['memory'] and tracemalloc.is_tracing()
+    current = 0
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+
+    profile = name == _state['profile_stage'] and not _state['profiling']
+    if profile:
+        _state['profiling'] = True
+        _state['profiler'].enable()
+
+    frame = {'stage': name, 'record': record, 'memory': memory, 'profile': profile, 'current': current,
+             'peak': 0, 'wall': time.perf_counter(), 'cpu': time.process_time()}
+    _stack.append(frame)
+
+    return frame
+
+
+def _exit(frame, record=True):
+    """
+    Ends the measures of a stage, the peak of memory is propagated to the enclosing stage.
+
+    """
+
+    wall, cpu = time.perf_counter() - frame['wall'], time.process_time() - frame['cpu']
+
+    if frame['profile']:
+        _state['profiler'].disable()
+        _state['profiling'] = False
+
+    _stack.pop()
+    alloc = None
+    if frame['memory'] and tracemalloc.is_tracing():
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        alloc = (peak - frame['current'])/1024**2
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+
+    r_record = {'stage': frame['stage'], 'depth': len(_stack), 'wall_s': wall, 'cpu_s': cpu,
+                'alloc_mb': alloc, 'rows_in': None, 'rows_out': None}
+    if record:
+        _records.append(r_record)
+
+    return r_record
+
+
+def _accumulate(totals, record):
+    """
+    Adds the times of a record to totals, and keeps the largest allocation.
+
+    """
+
+    totals['wall_s'] += record['wall_s']
+    totals['cpu_s'] += record['cpu_s']
+    if record['alloc_mb'] is not None:
+        totals['alloc_mb'] = max(totals['alloc_mb'] or 0.0, record['alloc_mb'])
+
+
+def _first(args, kwargs):
+    """
+    First argument of a call, positional or by keyword.
+
+    """
+
+    if args:
+        return args[0]
+
+    return next(iter(kwargs.values()), None)
+
+
+def _rows(obj):
+    """
+    Number of rows of a DataFrame, Series, array or a dict/list of them, None for anything else.
+
+    """
+
+    if hasattr(obj, 'shape') and len(obj.shape) > 0:
+        return int(obj.shape[0])
+
+    if isinstance(obj, (dict, list, tuple)) and len(obj) > 0:
+        rows = [_rows(value) for value in (obj.values() if isinstance(obj, dict) else obj)]
+        return None if any(row is None for row in rows) else sum(rows)
+
+    return None
+
+# ---------------------------------------------------------------------------------------------- EXPORTS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def trace():
+    """
+    Records of the current run, one row per call in order of completion, the time of nested stages is
+    included in the time of the enclosing stage (depth 0 is the outermost).
+
+    Returns
+    -------
+
+    r_trace: pd.DataFrame
+        'stage', 'depth', 'wall_s', 'cpu_s', 'alloc_mb', 'rows_in', 'rows_out' columns
+
+    """
+
+    return pd.DataFrame(_records, columns=['stage', 'depth', 'wall_s', 'cpu_s', 'alloc_mb', 'rows_in',
+                                           'rows_out'])
+
+
+def summary():
+    """
+    Calls, total and mean wall time, total CPU time and the largest allocation of every stage.
+
+    Returns
+    -------
+
+    r_summary: pd.DataFrame
+        One row per stage, sorted by total wall time
+
+    """
+
+    r_summary = trace().groupby('stage').agg(calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'),
+                                             mean_wall_s=('wall_s', 'mean'), cpu_s=('cpu_s', 'sum'),
+                                             alloc_mb=('alloc_mb', 'max'))
+
+    return r_summary.sort_values('wall_s', ascending=False)
+
+
+def export(route):
+    """
+    Writes the trace of the current run to a file, as CSV if the route ends with .csv, JSON otherwise.
+
+    Parameters
+    ----------
+
+    route: str
+        Route of the file
+
+    """
+
+    if route.endswith('.csv'):
+        trace().to_csv(route, index=False)
+    else:
+        with open(route, 'w') as file:
+            json.dump({'timestamp': pd.Timestamp.now().isoformat(), 'records': _records}, file, indent=2)
+
+
+def dump_profile(route):
+    """
+    Writes the cProfile statistics of the stage given in enable(profile_stage=...), readable with pstats or
+    snakeviz.
+
+    Parameters
+    ----------
+
+    route: str
+        Route of the file
+
+    """
+
+    if _state['profiler'] is None:
+        raise ValueError('No stage was profiled, use enable(profile_stage=...)')
+
+    _state['profiler'].dump_stats(route)
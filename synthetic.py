@@ -12,12 +12,227 @@
 """
 
 # -- Load libraries for script
+import os
+import json
 import numpy as np
+import pandas as pd
 
 # ------------------------------------------------------------------------------- RANDOM WALK WITH DRIFT -- # 
 # ------------------------------------------------------------------------------- ---------------------- -- # 
 
-# Single value
-np.random.seed(123) 
-mu, sigma = 0.1, 0.1 # mean and standard deviation
-random_walk = np.cumsum(np.random.normal(mu, sigma, 100))
+def random_walk(n=100, mu=0.1, sigma=0.1, seed=123):
+    """
+    Random walk with drift, as the cumulative sum of normal increments.
+
+    Parameters
+    ----------
+
+    n: int
+        100 (Default): number of values
+
+    mu: float
+        0.1 (Default): mean of the increments
+
+    sigma: float
+        0.1 (Default): standard deviation of the increments
+
+    seed: int
+        123 (Default): seed for the random numbers generator
+
+    Returns
+    -------
+
+    r_random_walk: np.array
+        Values of the random walk
+
+    """
+
+    return np.cumsum(np.random.default_rng(seed).normal(mu, sigma, n))
+
+# ----------------------------------------------------------------------------- RANDOM WALK OHLCV PRICES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+# -- Columns of the synthetic prices
+_ohlcv_columns = ['open', 'high', 'low', 'close', 'volume']
+
+def ohlcv_random_walk(n_bars, freq='1min', start='2010-01-01', mu=0.0, sigma=0.001, p_0=1.0, regimes=None,
+                      seed=123):
+    """
+    OHLCV prices from a geometric random walk with drift, with high and low prices consistent with the open
+    and close prices of every bar, and optional changes of regime (drift and volatility) at known timestamps,
+    e.g. to validate that a KLD between Folds detects them.
+
+    Parameters
+    ----------
+
+    n_bars: int
+        Number of bars
+
+    freq: str
+        '1min' (Default): frequency of the bars
+
+    start: str
+        '2010-01-01' (Default): timestamp of the first bar
+
+    mu: float
+        0.0 (Default): drift of the log returns per bar
+
+    sigma: float
+        0.001 (Default): standard deviation of the log returns per bar
+
+    p_0: float
+        1.0 (Default): price before the first bar
+
+    regimes: list
+        None (Default): the same drift and volatility for all the bars
+        list: [(timestamp, mu, sigma), ...] new drift and volatility from every timestamp onwards
+
+    seed: int
+        123 (Default): seed for the random numbers generator
+
+    Returns
+    -------
+
+    r_ohlcv: pd.DataFrame
+        'open', 'high', 'low', 'close', 'volume' columns with a DatetimeIndex
+
+    Example
+    -------
+
+    >>> prices = ohlcv_random_walk(n_bars=5000000, freq='1min', regimes=[('2012-06-01', 0.0, 0.003)])
+
+    """
+
+    chunks = ohlcv_chunks(n_bars=n_bars, chunk_size=max(n_bars, 1), freq=freq, start=start, mu=mu,
+                          sigma=sigma, p_0=p_0, regimes=regimes, seed=seed)
+
+    # no chunks for 0 bars
+    return next(chunks, pd.DataFrame({column: np.empty(0) for column in _ohlcv_columns},
+                                     index=pd.DatetimeIndex([], name='timestamp')))
+
+
+def ohlcv_chunks(n_bars, chunk_size=1000000, freq='1min', start='2010-01-01', mu=0.0, sigma=0.001, p_0=1.0,
+                 regimes=None, seed=123):
+    """
+    Generates the prices of ohlcv_random_walk in consecutive chunks of bars, so the memory used is bounded by
+    the chunk size regardless of the number of bars. The returns, highs, lows and volumes draw from their own
+    generators (spawned from the seed), so the prices only depend on the seed and not on the chunk size.
+
+    Parameters
+    ----------
+
+    n_bars: int
+        Number of bars
+
+    chunk_size: int
+        1000000 (Default): number of bars per chunk
+
+    freq, start, mu, sigma, p_0, regimes, seed:
+        See ohlcv_random_walk
+
+    Returns
+    -------
+
+    r_chunks: generator
+        DataFrames with 'open', 'high', 'low', 'close', 'volume' columns and a DatetimeIndex
+
+    """
+
+    if n_bars < 0 or chunk_size < 1:
+        raise ValueError('n_bars must be positive or 0 and chunk_size must be positive')
+
+    # one stream of random numbers for the returns, highs, lows and volumes
+    rng_returns, rng_high, rng_low, rng_volume = [np.random.default_rng(child)
+                                                  for child in np.random.SeedSequence(seed).spawn(4)]
+    offset = pd.tseries.frequencies.to_offset(freq)
+    start = pd.Timestamp(start)
+
+    # drift and volatility of every regime, from its starting timestamp
+    r_starts = pd.DatetimeIndex([pd.Timestamp(regime[0]) for regime in regimes or []])
+    r_mu = np.array([mu] + [regime[1] for regime in regimes or []], dtype=np.float64)
+    r_sigma = np.array([sigma] + [regime[2] for regime in regimes or []], dtype=np.float64)
+    if not r_starts.is_monotonic_increasing:
+        raise ValueError('The regimes must be sorted by its starting timestamp')
+
+    last_close = p_0
+    for c_start in range(0, n_bars, chunk_size):
+        n = min(chunk_size, n_bars - c_start)
+        index = pd.date_range(start=start + c_start*offset, periods=n, freq=freq, name='timestamp')
+
+        # regime of every bar
+        regime = r_starts.searchsorted(index, side='right')
+        b_mu, b_sigma = r_mu[regime], r_sigma[regime]
+
+        # log returns and prices, continuing from the last close of the previous chunk
+        returns = b_mu + b_sigma*rng_returns.standard_normal(n)
+        close = last_close*np.exp(np.cumsum(returns))
+        open_ = np.empty(n)
+        open_[0] = last_close
+        open_[1:] = close[:-1]
+        last_close = close[-1]
+
+        # high and low beyond the open and close prices of every bar
+        high = np.maximum(open_, close)*np.exp(np.abs(rng_high.standard_normal(n))*b_sigma/2)
+        low = np.minimum(open_, close)*np.exp(-np.abs(rng_low.standard_normal(n))*b_sigma/2)
+
+        # more volume in bars with larger moves
+        volume = rng_volume.poisson(100*(1 + np.abs(returns - b_mu)/b_sigma)).astype(np.float64)
+
+        yield pd.DataFrame(dict(zip(_ohlcv_columns, [open_, high, low, close, volume])), index=index)
+
+
+def ohlcv_to_columnar(route, n_bars, chunk_size=1000000, **kwargs):
+    """
+    Writes the prices of ohlcv_random_walk, chunk by chunk, directly to the columnar binary format of the
+    prices cache in data.py (a directory with values.npy, index.npy and meta.json), which can be read
+    memory-mapped with data.read_columnar.
+
+    Parameters
+    ----------
+
+    route: str
+        Directory to write the prices to
+
+    n_bars: int
+        Number of bars
+
+    chunk_size: int
+        1000000 (Default): number of bars generated and written at a time
+
+    kwargs:
+        freq, start, mu, sigma, p_0, regimes and seed, see ohlcv_random_walk
+
+    Returns
+    -------
+
+    route: str
+        Directory with the prices
+
+    Example
+    -------
+
+    >>> ohlcv_to_columnar(route='files/synthetic/rw_100M', n_bars=100000000, freq='1min')
+    >>> prices = data.read_columnar(route='files/synthetic/rw_100M')
+
+    """
+
+    os.makedirs(route, exist_ok=True)
+    values = np.lib.format.open_memmap(os.path.join(route, 'values.npy'), mode='w+', dtype=np.float64,
+                                       shape=(n_bars, len(_ohlcv_columns)))
+    index = np.lib.format.open_memmap(os.path.join(route, 'index.npy'), mode='w+', dtype='datetime64[ns]',
+                                      shape=(n_bars,))
+
+    position = 0
+    for chunk in ohlcv_chunks(n_bars=n_bars, chunk_size=chunk_size, **kwargs):
+        values[position:position + len(chunk)] = chunk.to_numpy()
+        index[position:position + len(chunk)] = chunk.index.values
+        position += len(chunk)
+
+    values.flush()
+    index.flush()
+    del values, index
+
+    with open(os.path.join(route, 'meta.json'), 'w') as file:
+        json.dump({'route': None, 'columns': _ohlcv_columns, 'index_name': 'timestamp', 'tz': None}, file)
+
+    return route
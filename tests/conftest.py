@@ -0,0 +1,33 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- conftest.py: shared fixtures for the tests                                                          -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import os
+import sys
+import pytest
+
+# -- The scripts of the repository are flat modules in its root directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# -- Load other scripts
+import synthetic as sn
+
+
+@pytest.fixture(scope='session')
+def minute_prices():
+    """
+    Two years of synthetic 10 minute OHLCV prices, with a change of regime.
+
+    """
+
+    return sn.ohlcv_random_walk(n_bars=105000, freq='10min', p_0=20.0, regimes=[('2011-01-01', 0.0, 0.003)],
+                                seed=7)
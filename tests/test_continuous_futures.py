@@ -0,0 +1,91 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_continuous_futures.py: tests for continuous_futures.py                                         -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import numpy as np
+import pandas as pd
+import pytest
+
+# -- Load other scripts
+import continuous_futures as cf
+import synthetic as sn
+
+# --------------------------------------------------------------------------------- MULTI-CONTRACT BATCH -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.fixture
+def contracts():
+    # A ends before B, and has a gap of a week
+    a_prices = sn.ohlcv_random_walk(n_bars=8784, freq='60min', start='2015-01-01', seed=1)
+    a_prices = a_prices.loc[:'2015-12-30']
+    a_prices = a_prices.drop(a_prices.loc['2015-06-01':'2015-06-07'].index)
+    b_prices = sn.ohlcv_random_walk(n_bars=12000, freq='60min', start='2015-03-01', seed=2)
+    return {'A': a_prices, 'B': b_prices}
+
+
+def test_align_contracts_outer(contracts):
+    c_data, filled = cf._align_contracts(c_data=contracts, align='outer')
+    a_data, index = c_data['A'], c_data['A'].index
+
+    # from the first to the last common timestamp
+    assert index[0] == contracts['B'].index[0] and index[-1] == contracts['A'].index[-1]
+    assert c_data['B'].index.equals(index) and not filled['B'].any()
+
+    # filled bars without price changes nor volume, at the previous close
+    gap = a_data.loc['2015-06-01':'2015-06-07']
+    assert filled['A'].sum() == len(gap) and filled['A'][index.isin(gap.index)].all()
+    previous_close = contracts['A'].loc[:'2015-05-31', 'close'].iloc[-1]
+    for column in ['open', 'high', 'low', 'close']:
+        np.testing.assert_array_equal(gap[column].to_numpy(), previous_close)
+    assert (gap['volume'] == 0).all() and not a_data.isna().any().any()
+
+
+def test_batch_contracts_outer(contracts, tmp_path):
+    routes = []
+    for name, prices in contracts.items():
+        routes.append(str(tmp_path / (name + '.txt')))
+        prices.to_csv(routes[-1], header=False, date_format='%Y-%m-%d %H:%M:%S')
+
+    batch = cf.batch_contracts(contracts=routes, target_freq='D', fold_size='quarter', align='outer',
+                               workers=1, cache_dir=str(tmp_path / 'cache'))
+
+    assert batch['index'][-1] == pd.Timestamp('2015-12-30')
+    assert batch['filled']['A'].sum() == 7 and not batch['filled']['B'].any()
+    # the filled days are not part of the targets of A
+    targets = pd.concat(batch['targets']['A'].values())
+    assert len(targets) == len(batch['index']) - 7
+    assert not targets.index.isin(pd.date_range('2015-06-01', '2015-06-07')).any()
+    assert np.isfinite(batch['cross_kld'].to_numpy()).all()
+
+# --------------------------------------------------------------------------------------- ROLL STITCHING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('roll_rule', ['volume', 'days'])
+def test_roll_gap_at_last_bar_used(roll_rule):
+    index = pd.date_range('2020-01-01', periods=10, freq='D')
+    current = pd.DataFrame({'close': np.arange(10, 20, dtype=np.float64), 'volume': 100.0}, index=index)
+    following = pd.DataFrame({'close': np.arange(30, 40, dtype=np.float64), 'volume': 50.0}, index=index)
+    following.loc[index[6:], 'volume'] = 200.0
+    # the next contract does not trade the last day used from the current one
+    following = following.drop(index[5])
+    for data in [current, following]:
+        data['open'] = data['high'] = data['low'] = data['close']
+
+    contracts, expiries = {'c': current, 'f': following}, {'c': '2020-01-12', 'f': '2020-03-01'}
+    schedule = cf.roll_schedule(contracts=contracts, expiries=expiries, roll_rule=roll_rule, days=5)
+
+    assert schedule['roll'].iloc[0] == index[6]
+    # current close of the last day used (15) against the last close of the next contract up to it (34)
+    assert schedule['gap'].iloc[0] == 34.0 - 15.0
+
+    stitched = cf.stitch_contracts(contracts=contracts, expiries=expiries, roll_rule=roll_rule, days=5)
+    assert stitched['close'].iloc[5] == 34.0 and stitched['close'].iloc[6] == 36.0
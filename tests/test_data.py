@@ -0,0 +1,272 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_data.py: tests for data.py                                                                     -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# -- Load other scripts
+import data as dt
+
+# ------------------------------------------------------------------------------------ FOLDS FORMATION -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def _mask_folds(global_data, fold_size):
+    # boolean masks over the whole data for every fold, as the original folds_formation
+    index = global_data.index
+    if fold_size == 'month':
+        keys, fmt = [index.year, index.month], 'm_{1:02d}_{0}'
+    elif fold_size == 'quarter':
+        keys, fmt = [index.year, index.quarter], 'q_{1:02d}_{0}'
+    elif fold_size == 'semester':
+        keys, fmt = [index.year, (index.quarter + 1)//2], 's_{1:02d}_{0}'
+    elif fold_size == 'year':
+        keys, fmt = [index.year, index.year], 'y_{0}'
+    else:
+        first = index.year - (index.year - index[0].year) % 2
+        keys, fmt = [first, first + 1], 'b_{0}_{1}'
+
+    r_folds = {}
+    for key in sorted(set(zip(*keys))):
+        r_folds[fmt.format(*key)] = global_data[(keys[0] == key[0]) & (keys[1] == key[1])]
+
+    return r_folds
+
+
+@pytest.mark.parametrize('fold_size', ['month', 'quarter', 'semester', 'year', 'bi-year'])
+def test_folds_formation_masks(minute_prices, fold_size):
+    # a month without data, which does not produce a fold
+    prices = minute_prices.drop(minute_prices.loc['2010-05-01':'2010-05-31'].index)
+    folds = dt.folds_formation(global_data=prices, fold_size=fold_size)
+    expected = _mask_folds(prices, fold_size)
+
+    assert list(folds) == list(expected)
+    for label, fold in folds.items():
+        pd.testing.assert_frame_equal(fold, expected[label])
+
+    # the offsets are the positions of the same folds
+    offsets = dt.folds_formation(global_data=prices, fold_size=fold_size, output='offsets')
+    for label, (start, stop) in offsets.items():
+        assert prices.index[start:stop].equals(folds[label].index)
+
+
+def test_folds_formation_hold_out(minute_prices):
+    # five years of daily prices: 4 years and 1 year
+    prices = minute_prices.iloc[:1826].set_axis(pd.date_range('2010-01-01', periods=1826, freq='D'))
+    folds = dt.folds_formation(global_data=prices, fold_size='80-20')
+
+    pd.testing.assert_frame_equal(folds['h_8'], prices[prices.index.year <= 2013])
+    pd.testing.assert_frame_equal(folds['h_2'], prices[prices.index.year == 2014])
+
+# ------------------------------------------------------------------------------- INCREMENTAL RESAMPLING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('target_freq', ['30min', '480min', 'D'])
+@pytest.mark.parametrize('chunk_size', [97, 999, 10000])
+def test_resample_stream_resample_data(minute_prices, target_freq, chunk_size):
+    prices = minute_prices.iloc[:8000]
+    chunks = [prices.iloc[i:i + chunk_size] for i in range(0, len(prices), chunk_size)]
+    expected = dt.resample_data(target_data=prices.reset_index(), target_freq=target_freq)
+
+    bars = dt.resample_stream(chunks=chunks, target_freq=target_freq)
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False, check_names=False)
+
+
+def test_read_ohlcv_chunks(minute_prices, tmp_path):
+    file_route = str(tmp_path / 'prices.txt')
+    prices = minute_prices.iloc[:5000]
+    prices.to_csv(file_route, header=False, date_format='%Y-%m-%d %H:%M:%S')
+
+    chunks = list(dt.read_ohlcv(file_route=file_route, chunk_size=1200, ts_format='%Y-%m-%d %H:%M:%S'))
+    assert [len(chunk) for chunk in chunks] == [1200, 1200, 1200, 1200, 200]
+    pd.testing.assert_frame_equal(pd.concat(chunks), prices, check_freq=False, check_index_type=False,
+                                  check_dtype=False, rtol=1e-12)
+
+    # the bars of the chunks read from the file, as the bars of the prices
+    chunks = dt.read_ohlcv(file_route=file_route, chunk_size=1200)
+    bars = dt.resample_stream(chunks=chunks, target_freq='60min')
+    expected = dt.resample_data(target_data=prices.reset_index(), target_freq='60min')
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False, check_names=False, check_dtype=False,
+                                  rtol=1e-12)
+
+# --------------------------------------------------------------------------------------- PRICES CACHE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def _price_file(prices, route):
+    prices.to_csv(route, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    return str(route)
+
+
+def test_read_cached_hit_and_mtime(minute_prices, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    file_route = _price_file(minute_prices.iloc[:3000], tmp_path / 'prices.txt')
+    kwargs = {'file_route': file_route, 'target_freq': '60min', 'cache_dir': cache_dir}
+
+    # miss: resampled from the file, hit: memory-mapped from the cache
+    missed = dt.read_cached(**kwargs)
+    hit = dt.read_cached(**kwargs)
+    pd.testing.assert_frame_equal(hit, missed, check_freq=False)
+    assert not hit.to_numpy().flags.writeable and len(os.listdir(cache_dir)) == 1
+
+    # a new version of the file, with another modification time, is a new entry
+    _price_file(minute_prices.iloc[3000:6000], file_route)
+    stat = os.stat(file_route)
+    os.utime(file_route, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    changed = dt.read_cached(**kwargs)
+    expected = dt.resample_data(target_data=minute_prices.iloc[3000:6000].reset_index(), target_freq='60min')
+    pd.testing.assert_frame_equal(changed, expected, check_freq=False, check_names=False, rtol=1e-12)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_read_cached_lru_eviction(minute_prices, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    routes = [_price_file(minute_prices.iloc[i*2000:(i + 1)*2000], tmp_path / ('prices_' + str(i) + '.txt'))
+              for i in range(3)]
+
+    def _entries():
+        return {meta['route']: entry for entry, meta in dt._cache_entries(cache_dir)}
+
+    dt.read_cached(file_route=routes[0], target_freq='60min', cache_dir=cache_dir)
+    dt.read_cached(file_route=routes[1], target_freq='60min', cache_dir=cache_dir)
+    entry = _entries()[os.path.abspath(routes[0])]
+    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    # the first file was used after the second one
+    for age, route in [(20, routes[1]), (10, routes[0])]:
+        meta_route = os.path.join(_entries()[os.path.abspath(route)], 'meta.json')
+        os.utime(meta_route, (os.path.getmtime(meta_route) - age,)*2)
+
+    # room for two entries: the least recently used one is evicted
+    dt.read_cached(file_route=routes[2], target_freq='60min', cache_dir=cache_dir, max_size=int(2.5*size))
+    assert set(_entries()) == {os.path.abspath(routes[0]), os.path.abspath(routes[2])}
+
+# ------------------------------------------------------------------------------- VECTORIZED RESAMPLING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('target_freq', ['30min', '60min', '480min', 'D'])
+def test_resample_bars_resample_data(minute_prices, target_freq):
+    raw = minute_prices.reset_index()
+    expected = dt.resample_data(target_data=raw, target_freq=target_freq)
+    bars = dt.resample_bars(target_data=raw, target_freq=target_freq)
+
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False, check_names=False)
+
+
+def test_resample_bars_several_freqs(minute_prices):
+    bars = dt.resample_bars(target_data=minute_prices, target_freq=['480min', '60min', 'D'])
+    for freq in ['60min', '480min', 'D']:
+        expected = dt.resample_bars(target_data=minute_prices, target_freq=freq)
+        pd.testing.assert_frame_equal(bars[freq], expected)
+
+
+def test_resample_bars_closed_sessions():
+    # hourly prices from thursday 2021-01-07, with friday 2021-01-08 as a holiday before the weekend
+    index = pd.date_range('2021-01-07', '2021-01-19 23:00', freq='60min', name='timestamp')
+    prices = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 1.0}, index=index)
+
+    bars = dt.resample_bars(target_data=prices, target_freq='D', holidays=['2021-01-08', '2021-01-18'],
+                            weekends=True)
+
+    expected = pd.DatetimeIndex(['2021-01-07', '2021-01-11', '2021-01-12', '2021-01-13', '2021-01-14',
+                                 '2021-01-15', '2021-01-19'])
+    assert list(bars.index) == list(expected)
+    # friday, saturday and sunday in monday, and the next saturday to monday (a holiday) in tuesday
+    np.testing.assert_array_equal(bars['volume'].to_numpy(), [24, 96, 24, 24, 24, 24, 96])
+    assert bars['volume'].sum() == len(prices)
+
+
+@pytest.mark.parametrize('target_freq', ['60min', '480min', 'D', '2D'])
+@pytest.mark.parametrize('chunk_size', [500, 7777])
+def test_resample_stream_sessions(minute_prices, target_freq, chunk_size):
+    # a chunk can end in a closed session, or in the open session after it
+    days = pd.date_range('2010-01-01', '2011-12-31', freq='D')
+    holidays = list(days[np.random.default_rng(1).choice(len(days), 40, replace=False)])
+    kwargs = {'target_freq': target_freq, 'session_open': '17:00', 'holidays': holidays, 'weekends': True}
+
+    chunks = [minute_prices.iloc[i:i + chunk_size] for i in range(0, len(minute_prices), chunk_size)]
+    bars = dt.resample_stream(chunks=chunks, **kwargs)
+    expected = dt.resample_bars(target_data=minute_prices, **kwargs)
+
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False)
+
+# ---------------------------------------------------------------------------------- LEAKAGE PREVENTION -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.fixture
+def daily_index():
+    return pd.date_range('2018-01-01', '2020-12-31', freq='D', name='timestamp')
+
+
+def _assert_no_leakage(train_idx, val_idx, label_end, embargo_stop):
+    start, stop = val_idx[0], val_idx[-1] + 1
+    # no training label overlaps the validation T-Fold, and none is in the embargo after it
+    assert not np.any((train_idx < stop) & (label_end[train_idx] >= start))
+    assert not np.any((train_idx >= stop) & (train_idx < embargo_stop))
+    assert not np.isin(train_idx, val_idx).any()
+
+
+@pytest.mark.parametrize('embargo', [0, 7])
+def test_purged_tfold_horizon(daily_index, embargo):
+    horizon = 5
+    splitter = dt.PurgedTFold(fold_size='quarter', horizon=horizon, embargo=embargo)
+    label_end = np.minimum(np.arange(len(daily_index)) + horizon, len(daily_index) - 1)
+    splits = list(splitter.split(daily_index))
+    assert len(splits) == splitter.get_n_splits(daily_index) == 12
+
+    for train_idx, val_idx in splits:
+        start, stop = val_idx[0], val_idx[-1] + 1
+        _assert_no_leakage(train_idx, val_idx, label_end, stop + embargo)
+        # only the observations with overlapping labels or in the embargo are removed
+        removed = np.arange(max(start - horizon, 0), min(stop + max(horizon, embargo), len(daily_index)))
+        np.testing.assert_array_equal(np.sort(np.concatenate([train_idx, removed])),
+                                      np.arange(len(daily_index)))
+
+
+def test_purged_tfold_timedelta_embargo(daily_index):
+    splitter = dt.PurgedTFold(fold_size='quarter', horizon=2, embargo=pd.Timedelta('10D'))
+    label_end = np.minimum(np.arange(len(daily_index)) + 2, len(daily_index) - 1)
+
+    for train_idx, val_idx in splitter.split(daily_index):
+        # daily data: 10 days are 10 periods after the last one of the T-Fold
+        _assert_no_leakage(train_idx, val_idx, label_end, val_idx[-1] + 11)
+        after = train_idx[train_idx > val_idx[-1]]
+        assert len(after) == 0 or after[0] == val_idx[-1] + 11
+
+
+def test_purged_tfold_horizon_series(daily_index):
+    # labels ending 0 to 20 days ahead, not sorted
+    days = np.random.default_rng(5).integers(0, 21, len(daily_index))
+    ends = pd.Series(daily_index + pd.to_timedelta(days, unit='D'), index=daily_index)
+    label_end = np.minimum(np.arange(len(daily_index)) + days, len(daily_index) - 1)
+
+    splitter = dt.PurgedTFold(fold_size='quarter', horizon=ends, embargo=3)
+    for train_idx, val_idx in splitter.split(daily_index):
+        _assert_no_leakage(train_idx, val_idx, label_end, val_idx[-1] + 4)
+        assert len(train_idx) > 0
+
+    with pytest.raises(IndexError):
+        list(dt.PurgedTFold(fold_size='quarter', horizon=ends.iloc[1:]).split(daily_index))
+
+
+def test_purged_tfold_train_past(daily_index):
+    splitter = dt.PurgedTFold(fold_size='quarter', horizon=5, embargo=7, train='past')
+    label_end = np.minimum(np.arange(len(daily_index)) + 5, len(daily_index) - 1)
+
+    for train_idx, val_idx in splitter.split(daily_index):
+        _assert_no_leakage(train_idx, val_idx, label_end, val_idx[-1] + 8)
+        # only the past, purged: up to the horizon before the T-Fold
+        np.testing.assert_array_equal(train_idx, np.arange(max(val_idx[0] - 5, 0)))
+
+    with pytest.raises(ValueError):
+        dt.PurgedTFold(train='future')
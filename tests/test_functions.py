@@ -0,0 +1,305 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_functions.py: tests for functions.py                                                           -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.special as sps
+from scipy import integrate, stats
+
+# -- Load other scripts
+import functions as fn
+
+# ---------------------------------------------------------------------------------------- OHLC LABELING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.fixture
+def ohlc_data():
+    close = np.array([1.0, 1.1, 1.05, 1.2, 1.15])
+    return pd.DataFrame({'open': close - 0.01, 'high': close + 0.02, 'low': close - 0.02, 'close': close},
+                        index=pd.date_range('2020-01-01', periods=5, freq='D'))
+
+
+@pytest.mark.parametrize('p_label', ['fwd_ret', 'b_fwd_ret', 'tb'])
+@pytest.mark.parametrize('horizon', [0, -1, 1.5])
+def test_labeling_invalid_horizon(ohlc_data, p_label, horizon):
+    with pytest.raises(ValueError):
+        fn.ohlc_labeling(ohlc_data=ohlc_data, p_label=p_label, horizon=horizon)
+
+
+@pytest.mark.parametrize('p_label', ['fwd_ret', 'b_fwd_ret'])
+@pytest.mark.parametrize('horizon', [5, 6, 100])
+def test_labeling_horizon_beyond_data(ohlc_data, p_label, horizon):
+    label = fn.ohlc_labeling(ohlc_data=ohlc_data, p_label=p_label, horizon=horizon)
+    assert len(label) == len(ohlc_data) and label.isna().all()
+
+
+def test_labeling_forward_returns(ohlc_data):
+    close = ohlc_data['close'].to_numpy()
+    fwd_ret = fn.ohlc_labeling(ohlc_data=ohlc_data, p_label='fwd_ret', horizon=2)
+    b_fwd_ret = fn.ohlc_labeling(ohlc_data=ohlc_data, p_label='b_fwd_ret', horizon=2)
+
+    np.testing.assert_allclose(fwd_ret.to_numpy()[:3], close[2:]/close[:3] - 1)
+    np.testing.assert_array_equal(b_fwd_ret.to_numpy()[:3], [1.0, 1.0, 1.0])
+    # the last horizon labels are unknown, not a down move
+    assert fwd_ret.iloc[3:].isna().all() and b_fwd_ret.iloc[3:].isna().all()
+
+
+def test_labeling_triple_barrier_horizon_beyond_data(ohlc_data):
+    label = fn.ohlc_labeling(ohlc_data=ohlc_data, p_label='tb', horizon=10, barriers=(0.05, 0.05))
+    assert label.dtype == np.int8 and len(label) == len(ohlc_data)
+
+# ----------------------------------------------------------------------------- OHLC FEATURE ENGINEERING -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_features_forward_label_lags(minute_prices):
+    ohlc_data = minute_prices.iloc[:500]
+    target = fn.ohlc_labeling(ohlc_data=ohlc_data, p_label='fwd_ret', horizon=3)
+    features = fn.ohlc_features(ohlc_data=ohlc_data, target_data=target, lags=(1, 2), windows=(5,),
+                                horizon_shift=fn.label_horizon('fwd_ret', 3))
+
+    # the target of t-4 is the last one known at t-1
+    np.testing.assert_array_equal(features['lag_1'].to_numpy()[4:], target.to_numpy()[:-4])
+    np.testing.assert_allclose(features['ma_5'].to_numpy()[8:],
+                               target.rolling(5).mean().to_numpy()[4:-4])
+    assert fn.label_horizon('co', 3) == 0
+
+
+# --------------------------------------------------------------------------- KLD with generalized gamma -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def _kld_gamma_reference(alpha_1, beta_1, alpha_2, beta_2):
+    # closed form of the KLD between two gamma PDFs with shape and rate parameters
+    return ((alpha_1 - alpha_2)*sps.digamma(alpha_1) - sps.gammaln(alpha_1) + sps.gammaln(alpha_2)
+            + alpha_2*(np.log(beta_1) - np.log(beta_2)) + alpha_1*(beta_2 - beta_1)/beta_1)
+
+
+def test_kld_gamma_large_shape():
+    # gamma(alpha) overflows a float64 beyond alpha ~171
+    p_params = np.array([[2.0, 1.0], [250.0, 30.0], [1500.0, 40.0]])
+    q_params = np.array([[1.0, 0.5], [240.0, 29.0], [1400.0, 35.0]])
+    kld = fn.kld_gamma(p_params=p_params, q_params=q_params)
+
+    assert np.isfinite(kld).all() and (kld > 0).all()
+    np.testing.assert_allclose(kld, _kld_gamma_reference(*p_params.T, *q_params.T), rtol=1e-9)
+
+    # against the numerical integral of p*log(p/q)
+    p, q = stats.gamma(a=250.0, scale=1/30.0), stats.gamma(a=240.0, scale=1/29.0)
+    integral = integrate.quad(lambda x: p.pdf(x)*(p.logpdf(x) - q.logpdf(x)), *p.ppf([1e-12, 1 - 1e-12]))[0]
+    assert kld[1] == pytest.approx(integral, rel=1e-6)
+
+
+def test_kld_gamma_data_large_shape():
+    # positive data with a small relative variance: shape parameters in the thousands
+    rng = np.random.default_rng(2)
+    p_data, q_data = rng.gamma(2000.0, 1/40.0, 5000), rng.gamma(1800.0, 1/35.0, 5000)
+    kld = fn.kld(p_data=p_data, q_data=q_data, prob_dist='gamma', pq_shift=False)
+
+    params = [(np.mean(data)**2/np.var(data), np.mean(data)/np.var(data)) for data in [p_data, q_data]]
+    assert params[0][0] > 1000 and np.isfinite(kld)
+    assert kld == pytest.approx(_kld_gamma_reference(*params[0], *params[1]), rel=1e-9)
+
+# --------------------------------------------------------------------- KLD with discrete and histograms -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def _kl(p_counts, q_counts):
+    # KLD of the counts with a pseudo-count of 0.5 in every category
+    p_probs = (np.asarray(p_counts) + 0.5)/np.sum(np.asarray(p_counts) + 0.5)
+    q_probs = (np.asarray(q_counts) + 0.5)/np.sum(np.asarray(q_counts) + 0.5)
+    return float(np.sum(p_probs*np.log(p_probs/q_probs)))
+
+
+def test_kld_discrete_known_values():
+    # 2 zeros and 2 ones against 1 zero and 3 ones
+    binomial = fn.kld(p_data=[0, 0, 1, 1], q_data=[0, 1, 1, 1], prob_dist='binomial')
+    assert binomial == pytest.approx(0.5*np.log(0.5/0.3) + 0.5*np.log(0.5/0.7))
+
+    # categories -1, 0 and 1 of both datasets, e.g. 'tb' labels
+    categorical = fn.kld(p_data=[-1, 0, 1, 1], q_data=[-1, -1, 0, 1], prob_dist='categorical')
+    assert categorical == pytest.approx(_kl([1, 1, 2], [2, 1, 1]))
+    # a category only in q
+    assert fn.kld(p_data=[0, 0, 1], q_data=[0, 1, 2], prob_dist='categorical') == pytest.approx(
+        _kl([2, 1, 0], [1, 1, 1]))
+
+    with pytest.raises(ValueError, match='binary'):
+        fn.kld(p_data=[0, 1, 2], q_data=[0, 1, 1], prob_dist='binomial')
+
+
+def test_kld_histogram_known_values():
+    p_data, q_data = [0.0, 0.1, 0.9, 1.0], [0.0, 0.2, 0.3, 1.0]
+
+    # 2 bins of the same edges [0, 0.5, 1]: 2 and 2 values against 3 and 1
+    histogram = fn.kld(p_data=p_data, q_data=q_data, prob_dist='histogram', bins=2)
+    assert histogram == pytest.approx(_kl([2, 2], [3, 1]))
+
+    # the counts smoothed with a gaussian kernel of the Scott's rule bandwidth of every dataset, in bins
+    def _smooth(data, counts):
+        bandwidth = np.std(data)*len(data)**(-1/5)/0.5
+        kernel = np.exp(-0.5*(np.arange(-1, 2)/bandwidth)**2)
+        kernel = kernel/kernel.sum()
+        return [counts[0]*kernel[1] + counts[1]*kernel[2], counts[0]*kernel[0] + counts[1]*kernel[1]]
+
+    kde = fn.kld(p_data=p_data, q_data=q_data, prob_dist='kde', bins=2)
+    assert kde == pytest.approx(_kl(_smooth(p_data, [2, 2]), _smooth(q_data, [3, 1])))
+
+    for prob_dist in ['binomial', 'categorical', 'histogram', 'kde']:
+        same = fn.kld(p_data=[0, 1, 1, 0], q_data=[0, 1, 1, 0], prob_dist=prob_dist)
+        assert same == pytest.approx(0.0, abs=1e-12)
+
+# ------------------------------------------------------------------------------------------- KLD MATRIX -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('p_label, prob_dist', [('co', 'gamma'), ('hl', 'gamma'), ('b_co', 'binomial')])
+def test_kld_matrix_pairwise_kld(minute_prices, p_label, prob_dist):
+    target = fn.ohlc_labeling(ohlc_data=minute_prices.iloc[:6000], p_label=p_label)
+    folds = {'f_' + str(i): target.iloc[i*1500:(i + 1)*1500] for i in range(4)}
+    kld = fn.kld_matrix(folds=folds, prob_dist=prob_dist)
+
+    assert list(kld.index) == list(kld.columns) == list(folds)
+    for p in folds:
+        for q in folds:
+            # p in rows, q in columns
+            expected = fn.kld(p_data=folds[p], q_data=folds[q], prob_dist=prob_dist)
+            assert kld.loc[p, q] == pytest.approx(expected, rel=1e-10, abs=1e-14)
+
+# -------------------------------------------------------------------------------------- FOLD STATISTICS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_gamma_params_zero_variance():
+    folds = {'q_1': pd.Series([0.1, -0.2, 0.3, 0.05]), 'q_2': pd.Series([0.2]*4)}
+    with pytest.raises(ValueError, match='zero variance'):
+        fn.kld_matrix(folds=folds, prob_dist='gamma')
+
+
+def test_fold_stats_cache_key():
+    fn.fold_stats_invalidate()
+    values = np.linspace(-1.0, 1.0, 1001)
+    stats = fn.fold_stats(data=values, label='q_1')
+    assert fn.fold_stats(data=values.copy(), label='q_1') is stats
+
+    # appended bars, another target of the same Fold and a value changed in place are not served from the
+    # cache
+    assert fn.fold_stats(data=np.append(values, 2.0), label='q_1')['count'] == 1002
+    assert fn.fold_stats(data=values[::-1].copy(), label='q_1') is not stats
+    changed = values.copy()
+    changed[1] = 5.0
+    assert fn.fold_stats(data=changed, label='q_1')['max'] == 5.0
+    # data without label is cached by its values, e.g. for pairwise calls of kld
+    assert fn.fold_stats(data=values) is fn.fold_stats(data=values.copy())
+
+
+def test_kld_changed_fold_values():
+    fn.fold_stats_invalidate()
+    # binary targets with the same length and the same evenly spaced values
+    p_target = np.zeros(1000)
+    p_target[::2] = 1.0
+    q_target = np.ones(1000)
+    q_target[[0, 2, 4, 6, 8, 10, 12, 14]] = 0.0
+    folds = {'f_1': p_target, 'f_2': p_target}
+    kld_1 = fn.kld_matrix(folds=folds, prob_dist='binomial')
+    kld_2 = fn.kld_matrix(folds={'f_1': p_target, 'f_2': q_target}, prob_dist='binomial')
+    assert kld_1.loc['f_1', 'f_2'] == 0.0 and kld_2.loc['f_1', 'f_2'] > 0.5
+
+    # one value of a Fold changed in a copy
+    target = np.random.default_rng(1).normal(size=1000)
+    changed = target.copy()
+    changed[500] = 1000.0
+    kld_1 = fn.kld_matrix(folds={'f_1': target, 'f_2': target}, prob_dist='gamma')
+    kld_2 = fn.kld_matrix(folds={'f_1': target, 'f_2': changed}, prob_dist='gamma')
+    assert kld_1.loc['f_1', 'f_2'] == pytest.approx(0.0, abs=1e-12)
+    assert kld_2.loc['f_1', 'f_2'] == pytest.approx(fn.kld(p_data=target, q_data=changed, prob_dist='gamma'))
+    assert kld_2.loc['f_1', 'f_2'] > 1.0
+
+@pytest.mark.parametrize('p_label, prob_dist', [('log_ret', 'gamma'), ('fwd_ret', 'gamma'),
+                                                 ('b_fwd_ret', 'binomial'), ('log_ret', 'histogram')])
+def test_kld_matrix_unknown_labels(minute_prices, p_label, prob_dist):
+    # labels of every Fold on its own: NaN at the first (log_ret) or the last (fwd_ret) periods
+    folds = {'f_' + str(i): minute_prices.iloc[i*2000:(i + 1)*2000] for i in range(4)}
+    targets = {label: fn.ohlc_labeling(ohlc_data=data, p_label=p_label, horizon=3)
+               for label, data in folds.items()}
+    assert all(target.isna().any() for target in targets.values())
+
+    kld = fn.kld_matrix(folds=targets, prob_dist=prob_dist)
+    assert np.isfinite(kld.to_numpy()).all()
+    assert fn.fold_stats(data=targets['f_0'])['count'] == targets['f_0'].notna().sum()
+    # the same as without the unknown labels (the bins of 'histogram' depend on all the Folds)
+    if prob_dist != 'histogram':
+        expected = fn.kld(p_data=targets['f_0'].dropna(), q_data=targets['f_1'].dropna(), prob_dist=prob_dist)
+        assert kld.loc['f_0', 'f_1'] == pytest.approx(expected)
+
+# ---------------------------------------------------------------------------------- SPARSITY ASSESSMENT -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_sparsity_assessment_undefined_kld():
+    labels = ['f_1', 'f_2', 'f_3', 'f_4']
+    kld = pd.DataFrame([[0.0, 0.01, 5.0, 5.0], [0.01, 0.0, 5.0, 5.0], [5.0, 5.0, 0.0, np.nan],
+                        [5.0, 5.0, 0.02, 0.0]], index=labels, columns=labels)
+
+    # the undefined pair f_3, f_4 is left out, not admitted by every threshold
+    assessment = fn.sparsity_assessment(kld_data=kld)
+    assert np.isfinite(assessment['threshold']) and assessment['class'] == 'Weakly Sparse'
+    assert assessment['clusters'] == {'f_1': 0, 'f_2': 0, 'f_3': 1, 'f_4': 2}
+    assert assessment['sweep']['n_clusters'].iloc[-1] == 1 and assessment['sweep']['density'].iloc[-1] == 5/6
+
+    with pytest.raises(ValueError, match='NaN'):
+        fn.sparsity_assessment(kld_data=kld, threshold=np.nan)
+
+# ------------------------------------------------------------------------------------------ ROLLING KLD -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('window, ref_window', [(50, None), (30, 120)])
+def test_rolling_kld_window_slices(minute_prices, window, ref_window):
+    target = fn.ohlc_labeling(ohlc_data=minute_prices.iloc[:2000], p_label='co')
+    drift = fn.rolling_kld(target_data=target, window=window, ref_window=ref_window)
+    ref_window = window if ref_window is None else ref_window
+
+    # NaN until both windows are complete
+    first = window + ref_window - 1
+    assert drift.iloc[:first].isna().all() and drift.iloc[first:].notna().all()
+    assert drift.index.equals(target.index)
+
+    for t in [first, first + 1, 777, len(target) - 1]:
+        current = target.iloc[t - window + 1:t + 1]
+        reference = target.iloc[t - window - ref_window + 1:t - window + 1]
+        assert drift.iloc[t] == pytest.approx(fn.kld(p_data=reference, q_data=current, prob_dist='gamma'),
+                                              rel=1e-6)
+
+# ----------------------------------------------------------------------------- KLD CONFIDENCE INTERVALS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.fixture
+def fold_targets(minute_prices):
+    target = fn.ohlc_labeling(ohlc_data=minute_prices.iloc[:3000], p_label='co')
+    return {'f_1': target.iloc[:1000], 'f_2': target.iloc[1000:2000], 'f_3': target.iloc[2000:]}
+
+
+def test_kld_bootstrap_workers(fold_targets):
+    serial = fn.kld_bootstrap(folds=fold_targets, n_boot=200, block_size=5, random_state=3)
+    parallel = fn.kld_bootstrap(folds=fold_targets, n_boot=200, block_size=5, random_state=3, workers=2)
+    for key in ['kld', 'std', 'lower', 'upper']:
+        pd.testing.assert_frame_equal(serial[key], parallel[key])
+    assert (serial['lower'] <= serial['upper']).all().all()
+
+
+def test_kld_bootstrap_whole_fold_blocks(fold_targets):
+    # blocks as long as the Folds: every replicate is the Fold, with the shift of the point estimate
+    ci = fn.kld_bootstrap(folds=fold_targets, n_boot=20, block_size=1000, random_state=3)
+    np.testing.assert_allclose(ci['lower'], ci['kld'], atol=1e-12)
+    np.testing.assert_allclose(ci['upper'], ci['kld'], atol=1e-12)
+
+
+@pytest.mark.parametrize('length', [0, 1])
+def test_kld_bootstrap_short_folds(fold_targets, length):
+    folds = dict(fold_targets, f_4=fold_targets['f_1'].iloc[:length])
+    with pytest.raises(ValueError, match='f_4'):
+        fn.kld_bootstrap(folds=folds, n_boot=10)
@@ -0,0 +1,218 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_pipeline.py: tests for pipeline.py                                                             -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# -- Load other scripts
+import data as dt
+import functions as fn
+import pipeline as pl
+import synthetic as sn
+
+# ------------------------------------------------------------------------------------ PER-FOLD PIPELINE -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def _assert_same_results(serial, parallel):
+    assert list(serial['offsets']) == list(parallel['offsets'])
+    pd.testing.assert_frame_equal(serial['kld'], parallel['kld'])
+    for fold in serial['offsets']:
+        # the frequency of the index is not kept in shared memory
+        pd.testing.assert_series_equal(serial['targets'][fold], parallel['targets'][fold], check_freq=False)
+        pd.testing.assert_frame_equal(serial['features'][fold], parallel['features'][fold], check_freq=False)
+
+
+@pytest.fixture(scope='module')
+def hourly_prices(minute_prices):
+    return dt.resample_data(target_data=minute_prices.reset_index(), target_freq='60min')
+
+
+@pytest.mark.parametrize('p_label', ['co', 'fwd_ret'])
+def test_run_folds_serial_parallel(hourly_prices, p_label):
+    kwargs = {'global_data': hourly_prices, 'fold_size': 'quarter', 'p_label': p_label, 'horizon': 3}
+    serial = pl.run_folds(workers=1, **kwargs)
+    parallel = pl.run_folds(workers=2, min_rows=0, **kwargs)
+    _assert_same_results(serial, parallel)
+
+@pytest.mark.parametrize('p_label', ['co', 'log_ret', 'fwd_ret'])
+def test_run_folds_kld_matrix(hourly_prices, p_label):
+    results = pl.run_folds(global_data=hourly_prices, fold_size='quarter', p_label=p_label, workers=1)
+    # the same KLD as kld_matrix, without the unknown first 'log_ret' and last 'fwd_ret' labels
+    expected = fn.kld_matrix(folds=results['targets'], prob_dist='gamma')
+    assert np.isfinite(results['kld'].to_numpy()).all()
+    pd.testing.assert_frame_equal(results['kld'], expected, rtol=1e-9)
+
+
+def test_run_folds_prob_dist(hourly_prices):
+    with pytest.raises(ValueError, match='gamma'):
+        pl.run_folds(global_data=hourly_prices, prob_dist='binomial', workers=1)
+
+    # a Fold with zero variance raises the error of kld_matrix
+    flat = hourly_prices.copy()
+    flat.loc[:'2010-03-31', ['open', 'high', 'low', 'close']] = 1.0
+    with pytest.raises(ValueError, match='zero variance'):
+        pl.run_folds(global_data=flat, fold_size='quarter', workers=1)
+
+# -------------------------------------------------------------------------------- LEARNING ASSESSMENT -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+class _LeastSquares:
+    # scikit-learn style linear estimator, picklable for the worker processes
+
+    def fit(self, X, y):
+        design = np.c_[np.ones(len(X)), np.asarray(X)]
+        self.coef_ = np.linalg.lstsq(design, np.asarray(y), rcond=None)[0]
+        return self
+
+    def predict(self, X):
+        return np.c_[np.ones(len(X)), np.asarray(X)] @ self.coef_
+
+    def score(self, X, y):
+        residuals = np.asarray(y) - self.predict(X)
+        return 1 - residuals @ residuals/np.sum((np.asarray(y) - np.mean(y))**2)
+
+
+def test_assess_learning_serial_parallel(hourly_prices):
+    results = pl.run_folds(global_data=hourly_prices, fold_size='quarter', p_label='co', workers=1)
+    # the first rows of the first Fold have no lags
+    features = {label: data.dropna() for label, data in results['features'].items()}
+    targets = {label: results['targets'][label].loc[features[label].index] for label in features}
+    labels = list(features)
+    clusters = {label: int(i >= 4) for i, label in enumerate(labels)}
+
+    kwargs = {'estimator': _LeastSquares(), 'features': features, 'targets': targets, 'clusters': clusters}
+    serial = pl.assess_learning(workers=1, **kwargs)
+    parallel = pl.assess_learning(workers=2, min_rows=0, **kwargs)
+
+    # the timings are the only columns allowed to differ
+    columns = ['train_fold', 'test_fold', 'type', 'metric', 'n_train', 'n_test']
+    pd.testing.assert_frame_equal(serial[columns], parallel[columns])
+    assert len(serial) == len(labels)**2
+
+    # every Fold against every Fold, classified by the clusters
+    row = serial.set_index(['train_fold', 'test_fold'])
+    assert row.loc[(labels[0], labels[0]), 'type'] == 'in-sample'
+    assert row.loc[(labels[0], labels[1]), 'type'] == 'out-of-sample'
+    assert row.loc[(labels[0], labels[5]), 'type'] == 'out-of-distribution'
+    expected = _LeastSquares().fit(features[labels[0]], targets[labels[0]]).score(features[labels[1]],
+                                                                                    targets[labels[1]])
+    assert row.loc[(labels[0], labels[1]), 'metric'] == pytest.approx(expected)
+
+# ---------------------------------------------------------------------------------- INCREMENTAL UPDATES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('fold_size, target_freq, max_bars',
+                         [('quarter', '480min', 600), ('bi-year', 'D', 800)])
+def test_state_append_save_load(minute_prices, tmp_path, fold_size, target_freq, max_bars):
+    # five years of hourly prices for the bi-year Folds
+    prices = minute_prices if fold_size == 'quarter' else sn.ohlcv_random_walk(n_bars=45000, freq='60min',
+                                                                                 start='2010-06-01', seed=3)
+    kwargs = {'fold_size': fold_size, 'p_label': 'fwd_ret', 'horizon': 2}
+    state = pl.state_init(target_freq=target_freq, **kwargs)
+    route = str(tmp_path / 'state')
+    for i, start in enumerate(range(0, len(prices), 9000)):
+        state = pl.state_append(state=state, new_data=prices.iloc[start:start + 9000])
+        # only the open Folds in memory
+        assert len(state['bars']) < max_bars
+        if i % 3 == 2:
+            rows = state['saved']['rows']
+            pl.state_save(state=state, route=route)
+            state = pl.state_load(route=route)
+            assert state['saved']['rows'] >= rows and state['spill'] == []
+
+    global_data = dt.resample_stream(chunks=[prices], target_freq=target_freq)
+    results = pl.run_folds(global_data=global_data, workers=1, **kwargs)
+    assert state['saved']['rows'] > 0 and len(state['closed']) == len(results['offsets']) - 1
+
+    pd.testing.assert_frame_equal(pl.state_bars(state), global_data, check_freq=False)
+    assert list(state['offsets'].items()) == list(results['offsets'].items())
+    pd.testing.assert_frame_equal(state['kld'], results['kld'])
+    for fold in results['offsets']:
+        pd.testing.assert_series_equal(state['targets'][fold], results['targets'][fold], check_freq=False)
+        pd.testing.assert_frame_equal(state['features'][fold], results['features'][fold], check_freq=False)
+
+
+@pytest.mark.parametrize('dtype, tick_size', [('float32', None), ('int32', 1e-4)])
+def test_run_folds_compact_serial_parallel(hourly_prices, dtype, tick_size):
+    # prices quoted in ticks
+    prices = hourly_prices.copy()
+    prices[['open', 'high', 'low', 'close']] = prices[['open', 'high', 'low', 'close']].round(4)
+    compact_data = dt.compact_prices(global_data=prices, dtype=dtype, tick_size=tick_size)
+
+    kwargs = {'fold_size': 'quarter', 'p_label': 'co'}
+    serial = pl.run_folds(global_data=compact_data, workers=1, **kwargs)
+    parallel = pl.run_folds(global_data=compact_data, workers=2, min_rows=0, **kwargs)
+    _assert_same_results(serial, parallel)
+
+    # labels and features in prices, not in ticks
+    expected = pl.run_folds(global_data=prices, workers=1, **kwargs)
+    for fold in expected['offsets']:
+        np.testing.assert_allclose(parallel['targets'][fold], expected['targets'][fold], atol=1e-5)
+        np.testing.assert_allclose(parallel['features'][fold], expected['features'][fold], atol=1e-5)
+
+# --------------------------------------------------------------------------------------- RESUMABLE RUNS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+@pytest.fixture
+def run_config(minute_prices, tmp_path):
+    file_route = str(tmp_path / 'prices.txt')
+    prices = minute_prices.loc['2010-01-04':'2011-12-29']
+    prices.to_csv(file_route, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    return pl.load_config(file_route=file_route, invert=False, ts_format='%Y-%m-%d %H:%M:%S',
+                          chunk_size=7000, target_freq='480min', session_open='17:00', weekends=True,
+                          fold_size='quarter', checkpoint_dir=str(tmp_path / 'checkpoints'))
+
+
+def test_run_stages_only_stage(run_config):
+    run = pl.run_stages(config=run_config, workers=1)
+    assert set(run['status'].values()) == {'run'}
+
+    # the price file resampled by chunks, as a whole
+    prices = pd.concat(list(dt.read_ohlcv(file_route=run_config['file_route'], invert=False,
+                                          ts_format=run_config['ts_format'])))
+    expected = dt.resample_bars(target_data=prices, target_freq='480min', session_open='17:00',
+                                weekends=True)
+    pd.testing.assert_frame_equal(pl.stage_output(config=run_config, stage='resample'), expected,
+                                  check_freq=False)
+
+    run = pl.run_stages(config=run_config, workers=1)
+    assert set(run['status'].values()) == {'skipped'}
+
+    # the existing checkpoints (columnar and pickled) are replaced by the new outputs
+    for stage in ['resample', 'kld']:
+        entry = pl._stage_entry(run_config, stage, run['keys'][stage])
+        open(os.path.join(entry, 'previous'), 'w').close()
+        run = pl.run_stages(config=run_config, only_stage=stage, workers=1)
+        assert run['status'] == {stage: 'run'} and not os.path.exists(os.path.join(entry, 'previous'))
+        output = pl.stage_output(config=run_config, stage=stage)
+        pd.testing.assert_frame_equal(output, run['outputs'][stage], check_freq=False)
+
+    checkpoints = [entry for stage in pl._run_stages
+                   for entry in os.listdir(os.path.join(run_config['checkpoint_dir'], stage))]
+    assert len(checkpoints) == len(pl._run_stages)
+
+
+def test_compact_check(hourly_prices):
+    p_labels = ('co', 'b_co', 'hl', 'log_ret', 'fwd_ret', 'b_fwd_ret', 'tb')
+    check = pl.compact_check(global_data=hourly_prices, fold_size='quarter', p_labels=p_labels)
+    assert check['passed'].all()
+    # the KLD of the labels with unknown edges is compared, not left undefined
+    assert (check.loc[['log_ret', 'fwd_ret'], 'kld_error'] > 0).all()
+
+    # ticks coarser than the prices: every label, including the triple barrier, fails
+    check = pl.compact_check(global_data=hourly_prices, fold_size='quarter', p_labels=p_labels, dtype='int32',
+                             tick_size=1e-2)
+    assert not check['passed'].any()
+    assert (check.loc[['b_co', 'b_fwd_ret', 'tb'], 'flips'] > 0).all()
@@ -0,0 +1,143 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_profiling.py: tests for profiling.py                                                           -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import json
+import pstats
+import numpy as np
+import pandas as pd
+import pytest
+
+# -- Load other scripts
+import profiling as pf
+
+
+@pf.stage()
+def _inner(data):
+    # 8 MB allocated and released before returning
+    np.ones((len(data), 1000)).sum()
+    return data.iloc[:len(data)//2]
+
+
+@pf.stage(name='outer')
+def _outer(data):
+    with pf.section('copy', rows=len(data)):
+        data = data.copy()
+    return _inner(data)
+
+
+@pf.stage()
+def _chunks(data):
+    for start in range(0, len(data), 300):
+        yield data.iloc[start:start + 300]
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'close': np.arange(1000, dtype=np.float64)})
+
+
+@pytest.fixture
+def profiled():
+    yield pf
+    pf.disable()
+    pf.reset()
+
+# --------------------------------------------------------------------------------------------- RECORDS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_stage_disabled(frame):
+    pf.reset()
+    assert len(_outer(frame)) == 500
+    assert pf.trace().empty
+
+
+def test_stage_nested_records(profiled, frame):
+    profiled.enable(memory=False)
+    result = _outer(frame)
+    trace = profiled.trace()
+
+    # in order of completion, the nested stages first
+    assert list(trace['stage']) == ['copy', '_inner', 'outer']
+    assert list(trace['depth']) == [1, 1, 0]
+    assert list(trace['rows_in']) == [1000, 1000, 1000]
+    assert list(trace['rows_out']) == [1000, 500, len(result)]
+    assert trace['alloc_mb'].isna().all()
+
+    # the time of the nested stages is included in the enclosing stage
+    outer = trace.set_index('stage')
+    assert outer.loc['outer', 'wall_s'] >= outer.loc['copy', 'wall_s'] + outer.loc['_inner', 'wall_s']
+
+    summary = profiled.summary()
+    assert summary.loc['outer', 'calls'] == 1
+    assert summary.index[0] == 'outer'
+
+
+def test_stage_nested_peaks(profiled, frame):
+    profiled.enable(memory=True)
+    _outer(frame)
+    _outer(frame.iloc[:10])
+    trace = profiled.trace()
+
+    # the peak of the nested stage propagates to the enclosing one, even if released before returning
+    inner, outer = trace[trace['stage'] == '_inner'], trace[trace['stage'] == 'outer']
+    assert inner['alloc_mb'].iloc[0] >= 7.5
+    assert (outer['alloc_mb'].to_numpy() >= inner['alloc_mb'].to_numpy()).all()
+
+    # a later, smaller run does not keep the peak of the previous one
+    assert outer['alloc_mb'].iloc[1] < 1.0
+
+
+def test_stage_generator_iterate(profiled, frame):
+    profiled.enable(memory=False)
+    chunks = list(_chunks(frame))
+    items = list(profiled.iterate('items', [frame, frame.iloc[:10]]))
+    trace = profiled.trace()
+
+    # a single record per generator, with the rows of all the items
+    assert len(chunks) == 4 and len(items) == 2
+    assert list(trace['stage']) == ['_chunks', 'items']
+    assert trace['rows_in'].iloc[0] == 1000 and pd.isna(trace['rows_in'].iloc[1])
+    assert list(trace['rows_out']) == [1000, 1010]
+
+# --------------------------------------------------------------------------------------------- EXPORTS -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_export(profiled, frame, tmp_path):
+    profiled.enable(memory=True)
+    _outer(frame)
+    trace = profiled.trace()
+
+    profiled.export(str(tmp_path / 'trace.csv'))
+    exported = pd.read_csv(tmp_path / 'trace.csv')
+    pd.testing.assert_frame_equal(exported, trace, check_dtype=False)
+
+    profiled.export(str(tmp_path / 'trace.json'))
+    with open(tmp_path / 'trace.json') as file:
+        exported = json.load(file)
+    assert 'timestamp' in exported
+    assert [record['stage'] for record in exported['records']] == list(trace['stage'])
+
+
+def test_dump_profile(profiled, frame, tmp_path):
+    profiled.enable(memory=False)
+    with pytest.raises(ValueError, match='No stage was profiled'):
+        profiled.dump_profile(str(tmp_path / 'none.prof'))
+
+    profiled.enable(memory=False, profile_stage='_inner')
+    _outer(frame)
+    profiled.dump_profile(str(tmp_path / 'inner.prof'))
+
+    # only the profiled stage is under cProfile
+    functions = {function[2] for function in pstats.Stats(str(tmp_path / 'inner.prof')).stats}
+    assert '_inner' in functions
+    assert 'copy' not in functions
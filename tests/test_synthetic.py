@@ -0,0 +1,34 @@
+"""
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- T-Fold-SV is Time Series Folds for Sequential Validation, the go to alternative for K-Fold-CV       -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+# -- Description: Python Implementation of the T-Fold Sequential Validation Method                       -- #
+# -- test_synthetic.py: tests for synthetic.py                                                           -- #
+# -- Author: IFFranciscoME - if.francisco.me@gmail.com                                                   -- #
+# -- license: GPL-3.0 License                                                                            -- #
+# -- Repository: https://github.com/IFFranciscoME/T-Fold-SV                                              -- #
+# -- --------------------------------------------------------------------------------------------------- -- #
+"""
+
+# -- Load libraries for script
+import pandas as pd
+
+# -- Load other scripts
+import synthetic as sn
+
+# ----------------------------------------------------------------------------- RANDOM WALK OHLCV PRICES -- #
+# --------------------------------------------------------------------------------------------------------- #
+
+def test_ohlcv_chunks_independent_of_chunk_size():
+    kwargs = {'n_bars': 2500, 'freq': '1min', 'regimes': [('2010-01-01 20:00', 0.0, 0.003)], 'seed': 5}
+    prices = sn.ohlcv_random_walk(**kwargs)
+    chunked = pd.concat(list(sn.ohlcv_chunks(chunk_size=700, **kwargs)))
+
+    pd.testing.assert_frame_equal(prices, chunked, check_freq=False)
+    assert (prices['high'] >= prices[['open', 'close']].max(axis=1)).all()
+    assert (prices['low'] <= prices[['open', 'close']].min(axis=1)).all()
+
+
+def test_ohlcv_random_walk_empty():
+    prices = sn.ohlcv_random_walk(n_bars=0)
+    assert prices.empty and list(prices.columns) == ['open', 'high', 'low', 'close', 'volume']